@@ -0,0 +1,244 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+RapidKrill background noise estimation. Same estimation as in echopy, but
+taking the TVG already worked out, and binning every block of samples only
+once. The noise estimated can also be reused in the following RAW files.
+
+Created on Fri Oct 16 23:51:26 2026
+@author: British Antarctic Survey
+"""
+
+# import modules
+import os, warnings, logging, logging.config
+import numpy as np
+from rapidkrill import binning
+
+# log events while running
+logger = logging.getLogger()
+logging.config.fileConfig(os.path.join(os.path.dirname(__file__),'logging.conf'))
+
+def tvg(r, alpha):
+    """
+    Time-varied gain (TVG) applied to Sv.
+
+    Args:
+        r     (float): 1D array with range (m).
+        alpha (float): Absorption coefficient (dB m-1).
+
+    Returns:
+        float: 1D array with TVG (dB), NaN where range is not positive.
+    """
+    r_       = r.astype(np.float64)
+    r_[r<=0] = np.nan
+    return 20*np.log10(r_) + 2*alpha*r_
+
+def derobertis(Sv, m, n, tvg, bgnmax=-125):
+    """
+    Estimate background noise as in:
+
+        De Robertis and Higginbottom (2007) ‘A post-processing technique to
+        estimate the signal-to-noise ratio and remove echosounder background
+        noise’, ICES Journal of Marine Science, 64: 1282–1291.
+
+    Same as gBN.derobertis with sample and ping numbers as i and j axes: Sv
+    without TVG is averaged in blocks of m samples by n pings, and the noise
+    of every n pings is the minimum block average along range.
+
+    Args:
+        Sv     (float): 2D array with Sv data (dB).
+        m      (int  ): Number of samples in blocks.
+        n      (int  ): Number of pings in blocks.
+        tvg    (float): 1D array with TVG (dB), see tvg.
+        bgnmax (float): Maximum background noise estimation (dB).
+
+    Returns:
+        float: 2D array with background noise estimation (dB).
+        bool : 2D array with mask indicating valid noise estimation.
+    """
+
+    bins, bgnr = levels(Sv, m, n, tvg, bgnmax=bgnmax)
+    if bins is None:
+        warnings.warn('unable to estimate background noise, incorrect '
+                      'resampling axes', RuntimeWarning)
+        return np.full(Sv.shape, np.nan), np.ones(Sv.shape, dtype=bool)
+
+    return _full(bins, bgnr, tvg)
+
+def levels(Sv, m, n, tvg, bgnmax=-125):
+    """
+    Estimate background noise without TVG every n pings (see derobertis).
+
+    Args:
+        Sv     (float): 2D array with Sv data (dB).
+        m      (int  ): Number of samples in blocks.
+        n      (int  ): Number of pings in blocks.
+        tvg    (float): 1D array with TVG (dB), see tvg.
+        bgnmax (float): Maximum background noise estimation (dB).
+
+    Returns:
+        Bins : Blocks of samples (see binning.Bins). None if Sv is too small
+               to get at least one block.
+        float: 1D array with background noise without TVG (dB), every n 
+               pings. NaN if no data.
+    """
+
+    # get block edges, as sample and ping numbers
+    iedges = np.arange(0, Sv.shape[0]-1, m)
+    jedges = np.arange(0, Sv.shape[1]-1, n)
+    if (len(iedges)<2) | (len(jedges)<2):
+        return None, None
+
+    # average Sv without TVG in blocks
+    bins = binning.Bins(np.arange(Sv.shape[0]), np.arange(Sv.shape[1]),
+                        iedges, jedges)
+    Svr  = bins.mean(Sv - tvg.reshape(-1, 1), log=True)[0]
+    Svr[Svr==-np.inf] = -999
+
+    # get the minimum along range, not exceeding the maximum expected
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)
+        bgnr = np.nanmin(Svr, axis=0)
+    bgnr[bgnr>bgnmax] = bgnmax
+
+    return bins, bgnr
+
+class Noise(object):
+    """
+    Background noise model, reusing the noise estimated in preceeding RAW
+    files. Noise levels change over tens of minutes, not from ping to ping,
+    so noise is only estimated (see derobertis) on a schedule, or when the
+    noise in the deepest samples drifts away from the noise there at the
+    last estimation. Otherwise, the noise level without TVG estimated last
+    (the median of levels every n pings) is applied to every ping.
+    
+    Drift is measured as in derobertis, but only in the deepest samples, 
+    averaged in blocks across all pings. If the seabed is in the deepest 
+    samples, drift also follows seabed changes, and noise is estimated more
+    often.
+
+    Args:
+        every  (float): Time after which noise is estimated again (s).
+        drift  (float): Drift of noise in the deepest samples after which
+                        noise is estimated again (dB).
+        deep   (int  ): Number of deepest samples where drift is measured.
+        m      (int  ): Number of samples in blocks (see derobertis).
+        n      (int  ): Number of pings in blocks (see derobertis).
+        bgnmax (float): Maximum background noise estimation (dB).
+    """
+
+    def __init__(self, every=1800, drift=1, deep=50, m=5, n=20, bgnmax=-125):
+        self.every       = every
+        self.drift       = drift
+        self.deep        = deep
+        self.m           = m
+        self.n           = n
+        self.bgnmax      = bgnmax
+        self.level       = None  # noise level without TVG (dB)
+        self.reference   = None  # deep noise at the last estimation (dB)
+        self.time        = None  # time of the last ping estimated
+        self.estimations = 0
+        self.reuses      = 0
+
+    def estimate(self, Sv, t, tvg):
+        """
+        Estimate background noise, or reuse the noise estimated last.
+
+        Args:
+            Sv  (float     ): 2D array with Sv data (dB).
+            t   (datetime64): 1D array with ping time.
+            tvg (float     ): 1D array with TVG (dB), see tvg.
+
+        Returns:
+            float: 2D array with background noise estimation (dB).
+            bool : 2D array with mask indicating valid noise estimation.
+        """
+
+        # check whether noise needs to be estimated again
+        deep   = self.deepnoise(Sv, tvg)
+        reason = None
+        if self.level is None:
+            reason = 'no preceeding estimation'
+        elif t[-1] - self.time > np.timedelta64(int(self.every*1000), 'ms'):
+            reason = 'scheduled'
+        elif np.abs(deep - self.reference) > self.drift:
+            reason = 'drift of %.1f dB' % (deep - self.reference)
+        elif np.isnan(deep) & ~np.isnan(self.reference):
+            reason = 'drift not measurable'
+
+        # estimate noise, and keep its level if it could be estimated
+        if reason is not None:
+            bins, bgnr = levels(Sv, self.m, self.n, tvg, self.bgnmax)
+            if bins is None:
+                return derobertis(Sv, self.m, self.n, tvg, self.bgnmax)
+            if (~np.isnan(bgnr)).any():
+                self.level        = np.nanmedian(bgnr)
+                self.reference    = deep
+                self.time         = t[-1]
+                self.estimations += 1
+                logger.info('Background noise estimated (%s): %.1f dB'
+                            % (reason, self.level))
+            return _full(bins, bgnr, tvg)
+
+        # or apply the last level to every ping, down to the last block of
+        # samples as in derobertis (pings after the last block are not left
+        # without noise estimation then)
+        self.reuses += 1
+        iedges = np.arange(0, Sv.shape[0]-1, self.m)
+        valid  = np.arange(Sv.shape[0]) < (iedges[-1] if len(iedges)>1 else 0)
+        bgn    = np.where(valid, self.level + tvg, np.nan)
+        bgn    = np.repeat(bgn.reshape(-1, 1), Sv.shape[1], axis=1)
+        mask   = np.repeat(~valid.reshape(-1, 1), Sv.shape[1], axis=1)
+        return bgn, mask
+
+    def state(self):
+        """
+        Get the noise estimated last, to restore it later (see restore), e.g.
+        in a checkpoint.
+
+        Returns:
+            dict: Noise level and reference (dB), and time of the last ping
+                  estimated (ISO 8601). Empty if noise was not estimated.
+        """
+        if self.level is None:
+            return {}
+        return {'level'    : float(self.level),
+                'reference': float(self.reference),
+                'time'     : str(self.time)}
+
+    def restore(self, state):
+        """
+        Restore the noise estimated last from a state (see state), so that
+        it is reused as if it had been estimated in this model.
+
+        Args:
+            state (dict): Noise estimated last.
+        """
+        if not state:
+            return
+        self.level     = state['level'    ]
+        self.reference = state['reference']
+        self.time      = np.datetime64(state['time'])
+
+    def deepnoise(self, Sv, tvg):
+        """
+        Measure noise without TVG in the deepest samples (dB): the minimum 
+        of Sv averaged in blocks of m samples, across all pings.
+        """
+        k = min(self.deep, Sv.shape[0])//self.m*self.m
+        if k==0:
+            return np.nan
+        sv = 10**((Sv[-k:] - tvg[-k:].reshape(-1, 1))/10)
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore', RuntimeWarning)
+            sv = np.nanmean(sv.reshape(-1, self.m*Sv.shape[1]), axis=1)
+            return 10*np.log10(np.nanmin(sv))
+
+def _full(bins, bgnr, tvg):
+    """
+    Broadcast noise without TVG every n pings back to full resolution, and
+    add TVG.
+    """
+    bgn, mask = bins.full(np.tile(bgnr, (bins.shape[0], 1)))
+    bgn      += tvg.reshape(-1, 1)
+    return bgn, ~mask
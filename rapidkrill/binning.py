@@ -0,0 +1,250 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+RapidKrill binning routines. Resample echograms in range and distance bins,
+working out the samples in every bin only once.
+
+Created on Fri Oct 16 21:26:40 2026
+@author: British Antarctic Survey
+"""
+
+# import modules
+import numpy as np
+
+class Bins(object):
+    """
+    Range x distance bins of an echogram. Range and distance must be sorted,
+    so that samples in every bin are contiguous and can be added up with
+    np.add.reduceat, with no need to index every sample. Samples within the
+    bin edges [edge0, edge1) belong to the bin, and samples out of the outer
+    edges are not binned.
+    
+    If weights is True, every sample spans from its coordinate to the next
+    one, and samples straddling a bin edge are weighted by the fraction of
+    them within every bin, when adding up and averaging, as in echopy's 
+    resampling (rs.twod and rs.oned). Sums and means are then the same as
+    with echopy, to rounding errors. Maxima and broadcasts (see full) still
+    take whole samples.
+
+    Args:
+        idim   (float): 1D array with range (m), or any other row dimension.
+        jdim   (float): 1D array with distance (nmi), or any other column
+                        dimension.
+        iedges (float): 1D array with range bin edges.
+        jedges (float): 1D array with distance bin edges.
+        iaxis  (tuple): Bins along range, as from axis(idim, iedges), if
+                        already worked out (e.g. cached). None to work them
+                        out.
+        weights (bool): True to weight samples straddling bin edges by the
+                        fraction within every bin, False to bin whole 
+                        samples.
+    """
+
+    def __init__(self, idim, jdim, iedges, jedges, iaxis=None,
+                 weights=False):
+        if iaxis is None:
+            iaxis = axis(idim, iedges)
+        self.shape = (len(iedges)-1, len(jedges)-1)
+        self.i, self.islice, self.istarts, self.isizes, self.ifrac = iaxis
+        self.j, self.jslice, self.jstarts, self.jsizes, self.jfrac = axis(
+            jdim, jedges)
+        
+        # take the sample before the first edge too, to weigh it
+        if weights:
+            self.islice, self.istarts = _extend(self.islice, self.istarts)
+            self.jslice, self.jstarts = _extend(self.jslice, self.jstarts)
+        else:
+            self.ifrac = self.jfrac = None
+
+    def sum(self, data, dtype=np.float64):
+        """
+        Add up data within bins. Data out of the bins are not read.
+
+        Args:
+            data (float, bool): 2D array with data to add up, with the
+                                echogram shape.
+            dtype (type)      : Data type to accumulate with. Sums are float
+                                if samples are weighted, though.
+
+        Returns:
+            float: 2D array with sums, with the bins shape.
+        """
+        data = data[self.islice, self.jslice]
+        data = _reduce(data, self.istarts, self.isizes, 0, dtype, self.ifrac)
+        return _reduce(data, self.jstarts, self.jsizes, 1, dtype, self.jfrac)
+
+    def mean(self, data, log=False):
+        """
+        Average data within bins, ignoring NaNs.
+
+        Args:
+            data (float): 2D array with data to average, with the echogram 
+                          shape.
+            log  (bool ): True if data is logarithmic (dB), to be averaged
+                          in the linear domain.
+
+        Returns:
+            float: 2D array with averages, NaN if no data in the bin.
+            int  : 2D array with number of samples averaged (not NaN), or
+                   their weight, if samples are weighted.
+        """
+        data  = data[self.islice, self.jslice]
+        if log:
+            data = 10**(data/10)
+        else:
+            data = data.copy()
+        valid = ~np.isnan(data)
+        data[~valid] = 0
+        total = _reduce(data , self.istarts, self.isizes, 0, np.float64,
+                        self.ifrac)
+        total = _reduce(total, self.jstarts, self.jsizes, 1, np.float64,
+                        self.jfrac)
+        del data
+        count = _reduce(valid, self.istarts, self.isizes, 0, np.int64,
+                        self.ifrac)
+        count = _reduce(count, self.jstarts, self.jsizes, 1, np.int64,
+                        self.jfrac)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            mean = total/count
+            if log:
+                mean = 10*np.log10(mean)
+        return mean, count
+
+    def max(self, data):
+        """
+        Get the maximum of data within bins, ignoring NaNs.
+
+        Args:
+            data (float): 2D array with data, with the echogram shape.
+
+        Returns:
+            float: 2D array with maxima, NaN if no data in the bin.
+        """
+        data = data[self.islice, self.jslice]
+        data = _fmax(data, self.istarts, self.isizes, 0)
+        return _fmax(data, self.jstarts, self.jsizes, 1)
+
+    def oned(self, data):
+        """
+        Average data along distance bins, ignoring NaNs.
+
+        Args:
+            data (float): 1D array with data along distance.
+
+        Returns:
+            float: 1D array with averages, one per distance bin.
+        """
+        data  = data[self.jslice]
+        valid = ~np.isnan(data)
+        total = _reduce(np.where(valid, data, 0), self.jstarts, self.jsizes,
+                        0, np.float64, self.jfrac)
+        count = _reduce(valid, self.jstarts, self.jsizes, 0, np.int64,
+                        self.jfrac)
+        with np.errstate(invalid='ignore'):
+            return total/count
+
+    def full(self, datar, dtype=None):
+        """
+        Broadcast binned data back to the echogram resolution.
+
+        Args:
+            datar (float): 2D array with binned data.
+            dtype (type ): Data type of the output. None for the same as
+                           binned data.
+
+        Returns:
+            float: 2D array with binned data at echogram resolution, NaN
+                   out of the bins.
+            bool : 2D array, True where samples are within the bins.
+        """
+        pad = np.full((self.shape[0]+1, self.shape[1]+1), np.nan,
+                      dtype=dtype or datar.dtype)
+        pad[:-1, :-1] = datar
+        full = pad[self.i][:, self.j]
+        mask = np.outer(self.i<self.shape[0], self.j<self.shape[1])
+        return full, mask
+
+def axis(dim, edges):
+    """
+    Get bin index of every sample along one axis (number of bins if out),
+    the slice of samples within the bins, start and size of every bin
+    within the slice, and the fraction of the sample before every edge that
+    is after the edge, with samples spanning from their coordinate to the 
+    next one (0 if the edge is at a sample, or out of the dimension).
+    
+    Args:
+        dim   (float): 1D array with the dimension, sorted.
+        edges (float): 1D array with bin edges.
+    
+    Returns:
+        tuple: Bin indexes, slice, starts, sizes and fractions.
+    """
+    n     = len(edges)-1
+    k     = np.searchsorted(edges, dim, side='right') - 1
+    k[(k<0)|(k>=n)] = n
+    after  = np.searchsorted(dim, edges)
+    i0, i1 = after[0], after[-1]
+    starts = after[:-1] - i0
+    sizes  = np.diff(np.r_[starts, i1 - i0])
+    inside = (after>0) & (after<len(dim))
+    frac   = np.zeros(len(edges))
+    a      = after[inside]
+    frac[inside] = (dim[a] - edges[inside])/(dim[a] - dim[a-1])
+    return k, slice(i0, i1), starts, sizes, frac
+
+def _extend(slice_, starts):
+    """
+    Extend a slice of samples within bins to the sample before, if any, 
+    which is not binned but weighed (see _reduce).
+    """
+    if slice_.start==0:
+        return slice_, starts
+    return slice(slice_.start-1, slice_.stop), starts + 1
+
+def _reduce(data, starts, sizes, axis, dtype, frac=None):
+    """
+    Add up data within contiguous bins along an axis, with zero for empty
+    bins (np.add.reduceat takes the value at the bin start instead). Samples
+    before the first start are not added up.
+    
+    If fractions of the samples before every edge are given (see axis), 
+    they are weighed: the fraction after an edge is added to the bin 
+    starting there, and taken from the bin ending there. Sums are then 
+    float.
+    """
+    if frac is not None:
+        dtype = np.float64
+    shape       = list(data.shape)
+    shape[axis] = len(starts)
+    if data.shape[axis]==0:
+        return np.zeros(shape, dtype=dtype)
+    before = np.r_[starts, data.shape[axis]] - 1
+    starts = np.minimum(starts, data.shape[axis]-1)
+    out    = np.add.reduceat(data, starts, axis=axis, dtype=dtype)
+    empty  = [slice(None)]*data.ndim
+    empty[axis] = sizes==0
+    out[tuple(empty)] = 0
+    if (frac is None) or not frac.any():
+        return out
+    
+    # weigh the samples straddling edges
+    shape       = [1]*data.ndim
+    shape[axis] = -1
+    edge = np.take(data, np.maximum(before, 0), axis=axis)*frac.reshape(shape)
+    return out - np.diff(edge, axis=axis)
+
+def _fmax(data, starts, sizes, axis):
+    """
+    Get the maximum of data within contiguous bins along an axis, ignoring
+    NaNs, with NaN for empty bins.
+    """
+    shape       = list(data.shape)
+    shape[axis] = len(starts)
+    if data.shape[axis]==0:
+        return np.full(shape, np.nan)
+    starts = np.minimum(starts, data.shape[axis]-1)
+    out    = np.fmax.reduceat(data, starts, axis=axis)
+    empty  = [slice(None)]*data.ndim
+    empty[axis] = sizes==0
+    out[tuple(empty)] = np.nan
+    return out
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+RapidKrill caches. Keep results that depend only on parameters that rarely
+change along a cruise (e.g. range, absorption or calibration), so that they
+are not worked out again for every RAW file.
+
+Created on Fri Oct 16 23:32:50 2026
+@author: British Antarctic Survey
+"""
+
+# import modules
+import hashlib, threading, collections
+import numpy as np
+
+class LRU(object):
+    """
+    Least recently used cache, counting hits and misses. Values are computed
+    on a miss, and the least recently used value is dropped when the cache is
+    full. It can be shared by several threads.
+
+    Arrays in cached values are set read-only, as they are shared by every
+    caller. Copy them before changing them.
+
+    Args:
+        maxsize (int): Maximum number of values kept.
+    """
+
+    def __init__(self, maxsize=8):
+        self.maxsize = maxsize
+        self.values  = collections.OrderedDict()
+        self.hits    = 0
+        self.misses  = 0
+        self.lock    = threading.Lock()
+
+    def __len__(self):
+        return len(self.values)
+
+    def get(self, key, compute):
+        """
+        Get the value cached under a key, or compute it and cache it.
+
+        Args:
+            key     (str     ): Key of the value (see key).
+            compute (callable): Function with no arguments returning the
+                                value, called on a miss.
+
+        Returns:
+            object: Value cached.
+        """
+        with self.lock:
+            if key in self.values:
+                self.hits += 1
+                self.values.move_to_end(key)
+                return self.values[key]
+        value = readonly(compute())
+        with self.lock:
+            self.misses      += 1
+            self.values[key]  = value
+            self.values.move_to_end(key)
+            while len(self.values)>self.maxsize:
+                self.values.popitem(last=False)
+        return value
+
+    def clear(self):
+        """
+        Drop every value cached, and reset counters.
+        """
+        with self.lock:
+            self.values.clear()
+            self.hits   = 0
+            self.misses = 0
+
+def key(*args):
+    """
+    Hash arrays, numbers and strings into a key. Arrays with the same values
+    but different type or shape give different keys.
+
+    Args:
+        *args: Arrays, numbers, strings or None, or lists or tuples of them.
+
+    Returns:
+        str: Key.
+    """
+    h = hashlib.sha1()
+    for a in args:
+        if isinstance(a, (list, tuple)):
+            h.update(key(*a).encode())
+            continue
+        if (a is None) or isinstance(a, str):
+            h.update(repr(a).encode())
+            continue
+        a = np.ascontiguousarray(a)
+        h.update(('%s%s' % (a.dtype.str, a.shape)).encode())
+        h.update(a.tobytes())
+    return h.hexdigest()
+
+def readonly(value):
+    """
+    Set arrays read-only, within dictionaries, lists and tuples too.
+    """
+    if isinstance(value, np.ndarray):
+        value.flags.writeable = False
+    elif isinstance(value, dict):
+        for v in value.values():
+            readonly(v)
+    elif isinstance(value, (list, tuple)):
+        for v in value:
+            readonly(v)
+    return value
+
+# caches shared by reading and processing routines
+calibration = LRU(maxsize=4)
+geometry    = LRU(maxsize=8)
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+RapidKrill checkpoints. Save and load the state of the listening routine, so
+that it can resume after a restart where it left off.
+
+Created on Fri Oct 16 20:12:45 2026
+@author: British Antarctic Survey
+"""
+
+# import modules
+import os, logging
+import numpy as np
+
+# log events while running
+logger = logging.getLogger()
+
+def save(path, state):
+    """
+    Save state in a NPZ file, atomically: the file is written aside and then
+    renamed, so that a crash while saving leaves the preceeding checkpoint
+    untouched.
+
+    Args:
+        path  (str ): Path to the checkpoint file.
+        state (dict): State to save. Values can be arrays, numbers, strings,
+                      lists of strings, None (not saved), or dictionaries of
+                      them.
+    """
+    tmp = path + '.tmp'
+    with open(tmp, 'wb') as f:
+        np.savez(f, **flatten(state))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+    # make the rename durable too
+    fd = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+def load(path):
+    """
+    Load state from a NPZ file.
+
+    Args:
+        path (str): Path to the checkpoint file.
+
+    Returns:
+        dict: State, as saved. None if there is no checkpoint, or if it can
+              not be read.
+    """
+    if not os.path.exists(path):
+        return None
+    try:
+        with np.load(path, allow_pickle=False) as f:
+            return unflatten({k: f[k] for k in f.files})
+    except Exception:
+        logger.warning('Checkpoint %s can not be read', path, exc_info=True)
+        return None
+
+def flatten(state, prefix=''):
+    """
+    Flatten nested dictionaries into arrays named after their keys path.
+    """
+    flat = {}
+    for k, v in state.items():
+        if v is None:
+            continue
+        if isinstance(v, dict):
+            flat.update(flatten(v, prefix + k + '/'))
+        elif isinstance(v, (list, tuple)):
+            flat[prefix + k] = np.array(v, dtype=str)
+        else:
+            flat[prefix + k] = np.asarray(v)
+    return flat
+
+def unflatten(flat):
+    """
+    Rebuild nested dictionaries from arrays named after their keys path.
+    Numbers and strings are returned as Python objects, and string arrays as
+    lists.
+    """
+    state = {}
+    for name, v in flat.items():
+        keys = name.split('/')
+        d    = state
+        for k in keys[:-1]:
+            d = d.setdefault(k, {})
+        if v.dtype.kind=='U':
+            v = v.tolist()
+        elif v.ndim==0:
+            v = v.item()
+        d[keys[-1]] = v
+    return state
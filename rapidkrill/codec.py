@@ -0,0 +1,221 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+RapidKrill report encodings. Results sent to land (see report.land) are
+encoded as CSV text, or in a compact binary encoding, for links where every
+byte counts (e.g. Iridium SBD messages of 340 bytes).
+
+The binary encoding quantises every field to fixed point (see FIELDS), and
+writes fields one after the other, column by column, as variable-length
+integers (LEB128). Fields varying slowly from row to row (time, position,
+distance and seabed) are written as the difference with the preceeding row.
+NaNs are kept. The encoding starts with one byte, with the version in the
+upper 4 bits and flags in the lower 4, followed by the number of rows and
+of NASC depth layers, and the names of layers, if any, as comma-separated
+text after its length. Then, the fields, compressed with raw zlib (deflate)
+if flagged:
+
+    [version|flags] [nrows] [nlayers] ([length] [names]) [fields...]
+
+Created on Fri Oct 16 23:02:51 2026
+@author: British Antarctic Survey
+"""
+
+# import modules
+import io, zlib
+import numpy as np
+import pandas as pd
+
+# binary encoding version, and flags
+VERSION = 1
+ZLIB    = 1
+
+# fields: column, quantum, and whether coded as differences between rows
+FIELDS = [('Time'     , 1   , True ),
+          ('Longitude', 1e-5, True ),
+          ('Latitude' , 1e-5, True ),
+          ('Transect' , 1   , True ),
+          ('Miles'    , .01 , True ),
+          ('Seabed'   , .1  , True ),
+          ('NASC'     , .01 , False),
+          ('% samples', .1  , False)]
+LAYERS = (.01, False)
+
+class Binary(object):
+    """
+    Binary encoding of reports, fitting a maximum size.
+
+    Args:
+        budget   (int ): Maximum size of a report (bytes), e.g. 340 for an
+                         Iridium SBD message. Reports carry as many rows as
+                         fit. None for no limit.
+        compress (bool): True to compress fields with zlib, if smaller.
+    """
+
+    def __init__(self, budget=None, compress=True):
+        self.budget   = budget
+        self.compress = compress
+
+    def encode(self, rows):
+        """
+        Encode as many rows as fit in the budget, from the first one.
+
+        Args:
+            rows (DataFrame): Results, as logged (see report.log).
+
+        Returns:
+            bytes: Encoded rows.
+            int  : Number of rows encoded.
+        """
+        data = encode(rows, compress=self.compress)
+        if self.budget is None or len(data)<=self.budget:
+            return data, len(rows)
+
+        # search the largest number of rows fitting
+        lo, hi, fit = 1, len(rows) - 1, None
+        while lo<=hi:
+            n    = (lo + hi)//2
+            part = encode(rows[:n], compress=self.compress)
+            if len(part)<=self.budget:
+                lo, fit = n + 1, (part, n)
+            else:
+                hi = n - 1
+        if fit is None:
+            raise Exception('No row fits in a %d bytes report' % self.budget)
+        return fit
+
+def encode(rows, compress=True):
+    """
+    Encode rows in binary (see module description).
+
+    Args:
+        rows     (DataFrame): Results, as logged (see report.log). Columns
+                              after the FIELDS are NASC in depth layers,
+                              named "NASC <layer>".
+        compress (bool     ): True to compress fields with zlib, if smaller.
+
+    Returns:
+        bytes: Encoded rows.
+    """
+    layers = [c for c in rows.columns if c not in [f[0] for f in FIELDS]]
+    body   = io.BytesIO()
+    for column, quantum, delta in _fields(layers):
+        if column=='Time':
+            values = pd.to_datetime(rows[column]).values
+            values = (values - np.datetime64(0, 's'))/np.timedelta64(1, 's')
+        else:
+            values = np.asarray(rows[column], dtype=float)
+        q    = np.round(values/quantum)
+        last = 0
+        for v in q:
+            if np.isnan(v):
+                _varint(body, 0)
+                continue
+            _varint(body, _zigzag(int(v) - last) + 1)
+            if delta:
+                last = int(v)
+    body = body.getvalue()
+
+    flags = 0
+    if compress:
+        z = zlib.compressobj(9, zlib.DEFLATED, -15)
+        packed = z.compress(body) + z.flush()
+        if len(packed)<len(body):
+            flags, body = ZLIB, packed
+
+    head = io.BytesIO()
+    head.write(bytes([VERSION<<4 | flags]))
+    _varint(head, len(rows))
+    _varint(head, len(layers))
+    names = ','.join(c[len('NASC '):] for c in layers).encode()
+    if layers:
+        _varint(head, len(names))
+        head.write(names)
+    return head.getvalue() + body
+
+def decode(data):
+    """
+    Decode rows encoded in binary (see encode), e.g. on land.
+
+    Args:
+        data (bytes): Encoded rows.
+
+    Returns:
+        DataFrame: Results, quantised, with time to the second.
+    """
+    f       = io.BytesIO(data)
+    version = f.read(1)[0]
+    if version>>4!=VERSION:
+        raise Exception('Report encoding version %d not recognised'
+                        % (version>>4))
+    n       = _unvarint(f)
+    nlayers = _unvarint(f)
+    layers  = []
+    if nlayers:
+        layers = ['NASC ' + s for s in
+                  f.read(_unvarint(f)).decode().split(',')]
+    body = f.read()
+    if version & ZLIB:
+        body = zlib.decompress(body, -15)
+    f = io.BytesIO(body)
+
+    rows = {}
+    for column, quantum, delta in _fields(layers):
+        values, last = np.full(n, np.nan), 0
+        for i in range(n):
+            v = _unvarint(f)
+            if v==0:
+                continue
+            v = _unzigzag(v - 1) + last
+            if delta:
+                last = v
+            values[i] = v
+        if column=='Time':
+            rows[column] = np.array(np.datetime64(0, 's')
+                                    + values.astype(np.int64), dtype=str)
+        elif quantum==1:
+            rows[column] = values.astype(int)
+        else:
+            rows[column] = np.round(values*quantum, 5)
+    return pd.DataFrame(rows, columns=[f[0] for f in _fields(layers)])
+
+def text(rows):
+    """
+    Encode rows as CSV text, with fixed decimals for every column.
+
+    Args:
+        rows (DataFrame): Results, as logged (see report.log).
+
+    Returns:
+        str: CSV text, one line per row, with no header.
+    """
+    data = io.StringIO()
+    line = '%s, %10.5f, %9.5f, %4.0f, %5.1f, %6.1f, %10.2f, %5.1f'
+    line = line + ', %10.2f'*(len(rows.columns)-8) + '\n'
+    for i, row in rows.iterrows():
+        data.write(line % tuple(row))
+    return data.getvalue()
+
+def _fields(layers):
+    return FIELDS + [(c,) + LAYERS for c in layers]
+
+def _zigzag(v):
+    return 2*v if v>=0 else -2*v - 1
+
+def _unzigzag(v):
+    return v//2 if v%2==0 else -(v + 1)//2
+
+def _varint(f, v):
+    while v>=0x80:
+        f.write(bytes([v & 0x7f | 0x80]))
+        v >>= 7
+    f.write(bytes([v]))
+
+def _unvarint(f):
+    v, shift = 0, 0
+    while True:
+        b = f.read(1)[0]
+        v |= (b & 0x7f) << shift
+        if b<0x80:
+            return v
+        shift += 7
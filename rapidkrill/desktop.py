@@ -9,10 +9,13 @@ Created on Thu Aug 15 15:34:13 2019
 """
 
 # Import modules
-import os, glob, gc, logging, logging.config
+import os, glob, gc, functools, logging, logging.config
 import numpy as np 
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime as dt
 from rapidkrill import read, process, report
+from rapidkrill import metrics as mt
 
 # Log events while running
 logger = logging.getLogger()
@@ -20,7 +23,9 @@ logging.config.fileConfig(os.path.join(os.path.dirname(__file__),
                                        '..','rapidkrill','logging.conf'))
 
 def desktop(path, calfile=None, transitspeed=3,
-            soundspeed=None, absorption=None):
+            soundspeed=None, absorption=None, maxrange=None, workers=1,
+            float32=False, layers=None, kernels='echopy', noise=None,
+            tracking=False, metrics=None):
     """
     RapidKrill desktop application. Runs unsupervised processing  in all the 
     RAW files contained in a directory. Results are stored in log/.
@@ -32,7 +37,45 @@ def desktop(path, calfile=None, transitspeed=3,
                                    transit and proceed to process data (knots).
         soundspeed   (int, float): Sound speed to correct data (m s-1)
         absorption   (int, float): Water absorption to correct data (dB m-1)
+        maxrange     (int, float): Maximum range to read from RAW files (m).
+                                   None to read all samples, as needed for
+                                   background noise and seabed detection
+                                   down to the range recorded (see 
+                                   read.raw).
+        workers      (int)       : Number of processes decoding RAW files 
+                                   ahead, in parallel. Decoded files are still
+                                   stitched and processed in order, so results
+                                   are the same as with only one process.
+                                   Decoding in other processes is not
+                                   measured by metrics, only the time
+                                   waiting for it (see metrics).
+        float32      (bool)      : True to read and process Sv in single 
+                                   precision, to halve memory use.
+        layers       (list)      : Depth layers where to compute NASC too,
+                                   logged in extra columns. E.g. [(20, 50),
+                                   (50, 100), (-20, 0, 'seabed')] (see 
+                                   process.integrate).
+        kernels      (str)       : Filter kernels, "echopy" or "rapidkrill",
+                                   which are faster (see process.ccamlr).
+        noise        (Noise)     : Background noise model to reuse noise
+                                   estimates across files, e.g. 
+                                   background.Noise(every=1800, drift=1).
+                                   None to estimate noise in every file.
+        tracking     (bool)      : True to detect the seabed following it
+                                   along pings, which is faster (see 
+                                   seabed.track).
+        metrics      (str, tuple): Path to the JSON lines file where the
+                                   time and memory of every stage are
+                                   recorded, or a pair of paths to it and to
+                                   a Prometheus textfile (see 
+                                   metrics.enable). None to not record them.
     """
+    # Record metrics of every stage, if requested
+    if metrics is not None:
+        if isinstance(metrics, str):
+            metrics = (metrics,)
+        mt.enable(*metrics)
+    
     # Get list of RAW files, and the calibration file
     rawfiles= np.sort(glob.glob(os.path.join(path, '*.raw')))    
     if rawfiles.size==0:
@@ -41,72 +84,112 @@ def desktop(path, calfile=None, transitspeed=3,
     # Preallocate variables and iterate through RAW files
     logname  = dt.now().strftime('D%Y%m%d-T%H%M%S')
     preraw   = None
-    rawpile  = None
-    for rawfile in rawfiles:
+    stream   = process.CcamlrStream(output='png', layers=layers,
+                                    kernels=kernels, noise=noise,
+                                    tracking=tracking)
+    decoder  = decoding(rawfiles, workers=workers, calfile=calfile,
+                        soundspeed=soundspeed, absorption=absorption,
+                        maxrange=maxrange, float32=float32)
+    for rawfile, decoded in zip(rawfiles, decoder):
         
         # Try to read, process and report
         try:
             
-            # read RAW file
-            raw    = read.raw(rawfile, calfile=calfile, 
-                              transitspeed=transitspeed,
-                              soundspeed=soundspeed, absorption=absorption,
-                              preraw=preraw)     
+            # read RAW file, stitching it to the preceeding one. Files
+            # decoded by other processes are only measured while waited for
+            mt.start('read.raw', os.path.basename(rawfile))
+            data   = decoded()
+            if workers>1:
+                mt.lap('wait')
+            raw    = read.stitch(data, transitspeed=transitspeed,
+                                 preraw=preraw)
+            mt.end('read.raw')
             preraw = raw.copy()
             
-            # if raw is continuous with preceeding data...
-            if raw['continuous']:
-                
-                # pile up current raw in the rawpile...
-                if rawpile is not None:
-                    rawpile = read.join(rawpile, raw)            
-                
-                # or start a new rawpile if not created yet
-                else:
-                    rawpile = raw.copy()            
+            # Start a new transect if raw is not continuous or changes 
+            # transect, reporting intervals held back first, and pile up raw
+            # data in the processing stream
+            if (not raw['continuous']) | (raw['transect']!=stream.transect):
+                pro = stream.flush()
+                if pro is not None:
+                    report.console(pro)
+                    report.log(pro, logname)
+                stream.reset()
+            stream.append(raw)
             
-            # or start a new rawpile if raw is not continuous         
-            else:
-                rawpile = raw.copy()
-                prepro = None
-                jdx    = [0,0]
+            # Process stream if vessels is moving...
+            if stream.transect>0:
                 
-            # Process rawpile if vessels is moving...
-            if rawpile['transect']>0:
-                
-                # Process rawpile if it's got at least 1 nmi...
-                if rawpile['nm'][-1]-rawpile['nm'][0]>1:
-                    pro     = process.ccamlr(rawpile, prepro=prepro, jdx=jdx)
-                    
-                    # Report results
+                # Process stream, and report results if any new nmi...
+                pro = stream.process()
+                if pro is not None:
                     report.console(pro)
                     report.log(pro, logname)
-                    
-                    prepro  = rawpile                
-                    jdx     = process.next_jdx(pro)
-                    rawpile = None
                 
                 # or report it hasn't got 1 nmi yet
                 else:
                     logger.info('Processing pending: at least 1 nmi required')
             
-            # or report the vessel is not moving, and reset parameters        
+            # or report the vessel is not moving, and reset parameters (the
+            # transect in transit, if any, was flushed above)
             else:
                 logger.info('Processing skipped: platform not in transit')
-                rawpile = None
-                prepro  = None
-                jdx     = [0,0]
+                stream.reset()
                 
             # free up memory RAM
             if 'raw' in locals(): del raw
             if 'pro' in locals(): del pro
+            if 'data' in locals(): del data
             gc.collect()
         
-        # log error if process fails and reset rawpile        
+        # log error if process fails and drop pings not processed
         except Exception:
             logger.error('Failed to process file', exc_info=True)
-            rawpile = None
+            stream.drop()
+    
+    # report intervals held back at the end of the last transect
+    try:
+        pro = stream.flush()
+        if pro is not None:
+            report.console(pro)
+            report.log(pro, logname)
+    except Exception:
+        logger.error('Failed to process last file', exc_info=True)
+    
+    # wait for echogram images, and stop rendering them in the background
+    report.close()
+    if metrics is not None:
+        mt.disable()
             
+def decoding(rawfiles, workers=1, **kwargs):
+    """
+    Decode RAW files ahead, in a pool of processes, and yield them in order.
+    No more than twice as many files as workers are decoded ahead.
+    
+    Args:
+        rawfiles (list): Paths to the RAW files.
+        workers  (int ): Number of processes decoding RAW files. If 1, files
+                         are decoded on demand, in the current process.
+        kwargs         : Arguments passed to read.decode.
+    
+    Yields:
+        callable: Returns the decoded data of the next file, or raises the 
+                  error raised while decoding it.
+    """
+    if workers<=1:
+        for rawfile in rawfiles:
+            yield functools.partial(read.decode, rawfile, **kwargs)
+        return
+    
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        ahead = deque()
+        for rawfile in rawfiles:
+            ahead.append(pool.submit(read.decode, rawfile, **kwargs))
+            if len(ahead)>2*workers:
+                yield ahead.popleft().result
+        while ahead:
+            yield ahead.popleft().result
+
 # Excute desktop module if this script is run as the main program
 # Fill in module's arguments from console inputs                          
 if __name__ == "__main__":
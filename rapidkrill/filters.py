@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+RapidKrill filters. Box, morphological and median filters for echograms,
+working along one dimension at a time where possible, and the impulse noise
+filter built on them.
+
+Boundaries are handled as in scipy.ndimage "reflect" mode (same as
+scipy.signal.convolve2d "symm" boundary): the echogram is mirrored at its
+edges, including the edge sample.
+
+Created on Fri Oct 16 22:41:07 2026
+@author: British Antarctic Survey
+"""
+
+# import modules
+import numpy as np
+from scipy import ndimage
+from numpy.lib.stride_tricks import sliding_window_view
+
+def box(data, size):
+    """
+    Average data within a moving window, as a 2D convolution with a kernel
+    of ones divided by the window size. The window is summed along range and
+    then along pings, adding up shifted copies of the echogram, so it costs
+    a few additions per sample instead of a full 2D kernel. Sums are done in
+    double precision, and returned with the precision of data. As in
+    convolution, samples with any NaN in their window are NaN.
+
+    Args:
+        data (float): 2D array with data, in the linear domain for Sv.
+        size (tuple): Window size (rows, columns).
+
+    Returns:
+        float: 2D array with data averaged.
+    """
+    pad   = _pad(data, size)
+    total = _shiftsum(pad  , size[0], 0)
+    total = _shiftsum(total, size[1], 1)
+    total /= size[0]*size[1]
+    return total.astype(data.dtype, copy=False)
+
+def erosion(data, size):
+    """
+    Grey erosion with a flat rectangular window (minimum within the window),
+    same as skimage.morphology.erosion with a window of ones. The minimum is
+    worked out along one dimension and then along the other.
+
+    Args:
+        data (float): 2D array with data.
+        size (tuple): Window size (rows, columns).
+
+    Returns:
+        float: 2D array with data eroded.
+    """
+    return ndimage.minimum_filter(data, size=size, mode='reflect')
+
+def dilation(data, size):
+    """
+    Grey dilation with a flat rectangular window (maximum within the window),
+    same as skimage.morphology.dilation with a window of ones. The maximum is
+    worked out along one dimension and then along the other.
+
+    Args:
+        data (float): 2D array with data.
+        size (tuple): Window size (rows, columns).
+
+    Returns:
+        float: 2D array with data dilated.
+    """
+    return ndimage.maximum_filter(data, size=size, mode='reflect')
+
+def medianf(data, size, where=None, chunk=2**21):
+    """
+    Median within a moving window, same as scipy.ndimage.median_filter.
+    Windows are gathered in chunks and partitioned, rather than sorted, and
+    can be computed only where needed. Data must not contain NaNs.
+
+    Args:
+        data  (float): 2D array with data.
+        size  (tuple): Window size (rows, columns).
+        where (bool ): 2D array, True where the median is needed. None to
+                       compute it everywhere.
+        chunk (int  ): Maximum number of window samples gathered at once.
+
+    Returns:
+        float: 2D array with the median of data if where is None, or 1D
+               array with the median at every True sample of where, in
+               row-major order.
+    """
+    windows = sliding_window_view(_pad(data, size), size)
+    k       = size[0]*size[1]
+    rank    = k//2
+
+    # compute median at the samples requested, a chunk at a time
+    if where is not None:
+        i, j = np.nonzero(where)
+        out  = np.empty(len(i), dtype=data.dtype)
+        step = max(1, chunk//k)
+        for s in range(0, len(i), step):
+            w          = windows[i[s:s+step], j[s:s+step]].reshape(-1, k)
+            out[s:s+step] = np.partition(w, rank, axis=1)[:, rank]
+        return out
+
+    # or compute median everywhere, a chunk of rows at a time
+    out  = np.empty_like(data)
+    step = max(1, chunk//(k*max(1, data.shape[1])))
+    for s in range(0, data.shape[0], step):
+        w          = windows[s:s+step].reshape(-1, k)
+        out[s:s+step] = np.partition(w, rank, axis=1)[:, rank].reshape(
+                            -1, data.shape[1])
+    return out
+
+def wang(Sv, thr=(-70,-40), erode=[(3,3)], dilate=[(5,5),(7,7)],
+         median=[(7,7)]):
+    """
+    Clean impulse noise from Sv data following the method described by:
+
+        Wang et al. (2015) ’A noise removal algorithm for acoustic data with
+        strong interference based on post-processing techniques’, CCAMLR
+        SG-ASAM: 15/02.
+
+    Same steps and outputs as mIN.wang, but with the filters of this module.
+    Only the last median filter cycle is needed to correct vacant samples
+    inside biological features, so it is computed at those samples only.
+
+    Args:
+        Sv     (float)    : 2D numpy array with Sv data (dB).
+        thr    (int/float): 2-element tupple with bottom/top Sv thresholds (dB)
+        erode  (int)      : list of 2-element tupples indicating the window's
+                            size for each erosion cycle.
+        dilate (int)      : list of 2-element tupples indicating the window's
+                            size for each dilation cycle.
+        median (int)      : list of 2-element tupples indicating the window's
+                            size for each median filter cycle.
+
+    Returns:
+        float             : 2D array with clean Sv data.
+        bool              : 2D array with mask indicating valid clean Sv data.
+    """
+
+    # set weak noise and strong interference as vacant samples (-999)
+    Sv_thresholded                          = Sv.copy()
+    Sv_thresholded[(Sv<thr[0])|(Sv>thr[1])] = -999
+
+    # run erosion cycles, as in mIN.wang only the last one takes effect
+    Sv_eroded = Sv
+    for e in erode:
+        Sv_eroded = erosion(Sv_thresholded, e)
+
+    # run dilation cycles
+    Sv_dilated = Sv_eroded
+    for d in dilate:
+        Sv_dilated = dilation(Sv_dilated, d)
+
+    # correct biological features back to Sv before erosion/dilation
+    Sv_corrected1           = Sv_dilated.copy()
+    mask_bio                = (Sv_dilated>=thr[0]) & (Sv_dilated<thr[1])
+    Sv_corrected1[mask_bio] = Sv_thresholded[mask_bio]
+    del Sv_eroded, Sv_dilated, mask_bio
+
+    # correct vacant samples inside biological features with the median of
+    # neighbouring samples. As the median of linear Sv is the linear Sv of
+    # the median, it is computed in dB.
+    Sv_corrected2 = Sv_corrected1.copy()
+    mask          = (Sv>=thr[0]) & (Sv<thr[1]) & (Sv_corrected1==-999)
+    if len(median):
+        Sv_median = Sv_corrected1
+        for m in median[:-1]:
+            Sv_median = medianf(Sv_median, m)
+        Sv_corrected2[mask] = medianf(Sv_median, median[-1], where=mask)
+
+    # get mask indicating edges, where swarms analysis couldn't be performed
+    mask_ = np.ones_like(Sv_corrected2, dtype=bool)
+    idx   = int((max([erode[-1][0], dilate[-1][0]])-1)/2)
+    jdx   = int((max([erode[-1][1], dilate[-1][1]])-1)/2)
+    mask_[idx:-idx, jdx:-jdx] = False
+
+    return Sv_corrected2, mask_
+
+def _pad(data, size):
+    """
+    Mirror data at its edges, by half the window size on each side.
+    """
+    return np.pad(data, [(size[0]//2, (size[0]-1)//2),
+                         (size[1]//2, (size[1]-1)//2)], mode='symmetric')
+
+def _shiftsum(data, n, axis):
+    """
+    Add up n consecutive samples along an axis, in double precision. The
+    output is n-1 samples shorter.
+    """
+    length = data.shape[axis] - n + 1
+    index  = [slice(None)]*data.ndim
+    index[axis] = slice(0, length)
+    total  = data[tuple(index)].astype(np.float64)
+    for s in range(1, n):
+        index[axis] = slice(s, s + length)
+        total += data[tuple(index)]
+    return total
@@ -9,24 +9,36 @@ Created on Mon Aug 12 15:27:10 2019
 """
 
 # import modules
-import re, os, time, gc, logging, logging.config, datetime
-from rapidkrill import read, process, report
+import os, time, gc, logging, logging.config, datetime, queue, threading
+from rapidkrill import read, process, report, watch, checkpoint
+from rapidkrill import metrics as mt
 
 # log events while running
 logger = logging.getLogger()
 logging.config.fileConfig(os.path.join(os.path.dirname(__file__),'logging.conf'))
 
 def listen(path, calfile=None, transitspeed=3,
-           platform='Unknown', savepng=False, reportrows=10, recipient=None):
+           platform='Unknown', savepng=False, reportrows=10, recipient=None,
+           maxrange=None, queuesize=2, resume=None, float32=False,
+           layers=None, kernels='echopy', noise=None, tracking=False,
+           deliver=None, encoding=None, metrics=None):
     
     """
-    Listen for new raw files. When find a new one, it carries out the following
-    actions:
+    Listen for new raw files, and wait until the echosounder completes them. 
+    For every new file, it carries out the following actions:
         1) Read RAW data
         2) Process RAW data (calibration, de-noising and target identification)
         3) Report (summarise and deliver results)
     
-    Results are stored in log/.
+    Each stage runs concurrently in its own thread, connected to the next one
+    by a bounded queue, so that a slow report does not delay processing. Each
+    stage handles files one at a time and in order. Results are stored in 
+    log/.
+    
+    The state of the routine is saved after each file is reported, so that,
+    if restarted, it resumes where it left off: new files are processed as
+    part of the same transect, and results are logged and delivered to land
+    from the same CSV file, without reading preceeding files again.
     
     Args:
         path         (str)       : Path to the directory where the RAW files 
@@ -39,144 +51,291 @@ def listen(path, calfile=None, transitspeed=3,
                                    showing processsed echograms.
         reportrows   (int)       : number of rows in table reports.
         recipient    (str)       : recipient email to receive results.
+        maxrange     (int, float): Maximum range to read from RAW files (m).
+                                   None to read all samples, as needed for
+                                   background noise and seabed detection
+                                   down to the range recorded (see 
+                                   read.raw).
+        queuesize    (int)       : Maximum number of files waiting between 
+                                   stages. Reading waits for processing, and
+                                   processing for reporting, if exceeded.
+        resume       (str)       : Path to the checkpoint file, to save the
+                                   state and resume from it. By default, 
+                                   log/listen.npz.
+        float32      (bool)      : True to read and process Sv in single 
+                                   precision, to halve memory use.
+        layers       (list)      : Depth layers where to compute NASC too,
+                                   logged in extra columns. E.g. [(20, 50),
+                                   (50, 100), (-20, 0, 'seabed')] (see 
+                                   process.integrate).
+        kernels      (str)       : Filter kernels, "echopy" or "rapidkrill",
+                                   which are faster (see process.ccamlr).
+        noise        (Noise)     : Background noise model to reuse noise
+                                   estimates across files, e.g. 
+                                   background.Noise(every=1800, drift=1).
+                                   None to estimate noise in every file.
+        tracking     (bool)      : True to detect the seabed following it
+                                   along pings, which is faster (see 
+                                   seabed.track).
+        deliver      (callable)  : Function delivering reports to land (see
+                                   report.land). None to send them by email
+                                   with SendGrid.
+        encoding     (Binary)    : Binary encoding of reports to land, e.g.
+                                   codec.Binary(budget=340) to fit an 
+                                   Iridium SBD message (see report.land).
+                                   None to send CSV text.
+        metrics      (str, tuple): Path to the JSON lines file where the
+                                   time and memory of every stage are
+                                   recorded, or a pair of paths to it and to
+                                   a Prometheus textfile (see 
+                                   metrics.enable). None to not record them.
     """
     
     # Check if recipient email has been provided
     if recipient is None:
         raise Exception('Need to provide a recipient email address')
     
+    # Record metrics of every stage, if requested
+    if metrics is not None:
+        if isinstance(metrics, str):
+            metrics = (metrics,)
+        mt.enable(*metrics)
+    
     # Report path being listened
     logger.info('Listening at %s...', path)
      
-    # List preceeding RAW files in the directory
-    r = re.compile('.*raw$')
-    pre = [f for f in os.listdir(path) if r.match(f, re.IGNORECASE)]
-    pre.sort()
+    # Resume from checkpoint, if saved while listening at the same path
+    if resume is None:
+        resume = os.path.join(os.path.dirname(__file__), '..', 'log',
+                              'listen.npz')
+    state  = checkpoint.load(resume)
+    stream = process.CcamlrStream(output='png' if savepng else 'minimal',
+                                  layers=layers, kernels=kernels,
+                                  noise=noise, tracking=tracking)
+    if (state is not None) and (state['listen']['path']==path):
+        logger.info('Resuming from checkpoint %s', resume)
+        logname   = state['listen']['logname']
+        lastrow   = state['listen']['lastrow']
+        processed = state['listen']['processed']
+        preraw    = state.get('preraw')
+        if 'stream' in state:
+            stream.restore(state['stream'])
+    else:
+        logname   = datetime.datetime.now().strftime('D%Y%m%d-T%H%M%S')
+        lastrow   = 0
+        processed = None
+        preraw    = None
+    
+    # Watch the directory for new RAW files
+    watcher = watch.Watcher(path, interval=10, processed=processed)
        
-    # Preallocate variables and loop forever
-    logname = datetime.datetime.now().strftime('D%Y%m%d-T%H%M%S')
-    preraw  = None
-    rawpile = None
-    alr     = []
-    t       = '\n\t\t\t\t\t      > '
-    lastrow = 0
+    # Start processing and reporting stages, connected by bounded queues
+    toprocess = queue.Queue(maxsize=queuesize)
+    toreport  = queue.Queue(maxsize=queuesize)
+    threading.Thread(target=processing, args=(toprocess, toreport, stream),
+                     daemon=True).start()
+    threading.Thread(target=reporting, args=(toreport, logname, savepng,
+                                             reportrows, platform, recipient,
+                                             lastrow, resume, path, deliver,
+                                             encoding),
+                     daemon=True).start()
+    
+    # Loop forever
+    t = '\n\t\t\t\t\t      > '
     while 1:        
         
-        # List cumulated RAW files in the directory (preceeding + newcomers)
-        time.sleep(10)     
-        cum = [f for f in os.listdir(path) if r.match(f, re.IGNORECASE)]
-        cum.sort()
-        
-        # Report of "No new files", if cumulated and preeceding are equal
-        if len(cum)==len(pre):
+        # List new files completed, or wait for changes in the directory
+        new = watcher.completed()
+        if len(new)==0:
             logger.info('No new files')
+            watcher.wait()
+            continue
         
-        # Reset list of preeceding files, if files have been deleted
-        if len(cum)<len(pre):
-            logger.warning('Files have been deleted!')
-            pre = cum.copy()
+        # Report list of new files pending to be processed
+        if len(new)>3:
+            logger.info(t.join(['Files pending:'] + new[:3]
+                               + ['+ '+str(len(new)-3)+' more']))
+        else:
+            logger.info(t.join(['Files pending:'] + new))
         
-        # Identify new files as the difference between cumulated and preceeding
-        if len(cum)>len(pre):
-            new = cum.copy()
-            for filename in pre:
-                new.remove(filename)   
+        # Read every new file, without waiting in between
+        for filename in new:
+            watcher.done(filename)
+            try:
+                
+                # Read RAW
+                rawfile = os.path.join(path, filename)
+                start   = time.perf_counter()
+                raw     = read.raw(rawfile, transitspeed=transitspeed, 
+                                   calfile=calfile, maxrange=maxrange,
+                                   float32=float32,
+                                   preraw=preraw)     
+                preraw  = read.tail(raw)
+                logger.info('Reading stage: %.1f s, %d files to process'
+                            % (time.perf_counter()-start, toprocess.qsize()))
+                
+                # Pass RAW data to the processing stage, with the state of
+                # the reading stage
+                state = {'preraw'   : preraw,
+                         'processed': sorted(watcher.processed)}
+                toprocess.put((raw, state, time.perf_counter()))
+                del raw
             
-            # Identify repeated files (already processed but incoming again)
-            rep = list(set(new) & set(alr))
-            if len(rep)>0:
-                rep.sort()
-                rep.insert(0, 'Inconming files already processed:')
-                logger.warning(t.join(rep))
-                rep.remove('Inconming files already processed:')
-                for filename in rep:                   
-                    new.remove(filename)
-                    pre.append(filename)
-                pre=list(set(pre))
+            # log error if reading fails
+            except Exception:                                       
+                logger.error('Failed to read file', exc_info=True)
+
+def processing(toprocess, toreport, stream=None):
+    """
+    Processing stage of the listening routine. Takes RAW data from a queue,
+    and puts processed data in the queue to be reported. It stops when it 
+    takes None.
+    
+    Args:
+        toprocess (Queue       ): RAW data to process, state of the reading
+                                  stage, and time it was queued.
+        toreport  (Queue       ): Processed data to report (None if there is
+                                  nothing to report), state of the reading 
+                                  and processing stages, and time it was 
+                                  queued.
+        stream    (CcamlrStream): Processing stream to go on with. None to 
+                                  start a new one.
+    """
+    if stream is None:
+        stream = process.CcamlrStream()
+    while 1:
+        item = toprocess.get()
+        if item is None:
+            toreport.put(None)
+            break
+        raw, state, queued = item
+        start              = time.perf_counter()
+        pro                = None
+        try:
             
-            # Report list of new files pending to be processed
-            if len(new)>0:
-                new.insert(0, 'Files pending:')
-                if len(new)>3:
-                    logger.info(t.join(new[:3]+['+ '+str(len(new)-3)+' more']))
-                else:
-                    logger.info(t.join(new))
-                new.remove('Files pending:')                
+            # Start a new transect if raw is not continuous or changes 
+            # transect, reporting intervals held back first, and pile up raw
+            # data in the processing stream
+            if (not raw['continuous']) | (raw['transect']!=stream.transect):
+                flush(stream, toreport)
+                stream.reset()
+            stream.append(raw)
             
-            # If more than one new file, try to process the first one
-            if (len(new))>1:       
-                try:
-                    
-                    # Move file name to preceeding & already-processed lists
-                    pre.append(new[0])
-                    alr.append(new[0])
-                    
-                    # Read RAW
-                    rawfile = os.path.join(path, new[0])
-                    raw     = read.raw(rawfile, transitspeed=transitspeed, 
-                                       calfile=calfile, preraw=preraw)     
-                    preraw  = raw.copy()
-                    
-                    # If raw data is continuous with preceeding data...
-                    if raw['continuous']:
-                        
-                        # pile up current raw data in the rawpile
-                        if rawpile is not None:
-                            rawpile = read.join(rawpile, raw)            
-                        
-                        # or start a new rawpile if not created yet
-                        else:
-                            rawpile = raw.copy()            
-                    
-                    # Start a new rawpile if raw is not continuous         
-                    else:
-                        rawpile = raw.copy()
-                        prepro = None
-                        jdx    = [0,0]
-                        
-                    # Process rawpile if vessels is moving...
-                    if rawpile['transect']>0:
-                        
-                        # Process rawpile if it's got at least 1 nmi...
-                        if rawpile['nm'][-1]-rawpile['nm'][0]>1:
-                            pro = process.ccamlr(rawpile,prepro=prepro,jdx=jdx)
-                            
-                            # Report results
-                            report.console(pro)
-                            report.log(pro, logname, savepng=savepng)
-                            try:
-                                lastrow = report.land(logname, lastrow,
-                                                      reportrows,
-                                                      platform=platform, 
-                                                      recipient=recipient)
-                            except Exception:                                       
-                                logger.error('Failed to send report',exc_info=True)
-                            prepro  = rawpile                
-                            jdx     = process.next_jdx(pro)
-                            rawpile = None
-                        
-                        # or report it hasn't got 1 nmi yet
-                        else:
-                            logger.info('Processing pending: at least ' +
-                                        '1 nmi required')
-                    
-                    # or report the vessel is not moving, and reset parameters
-                    else:
-                        logger.info('Processing skipped: ' + 
-                                    'platform not in transit')
-                        rawpile = None
-                        prepro  = None
-                        jdx     = [0,0]                             
-                    
-                    # free up memory RAM
-                    if 'raw' in locals(): del raw
-                    if 'pro' in locals(): del pro
-                    gc.collect()                
+            # Process stream if vessels is moving...
+            if stream.transect>0:
                 
-                # log error if process fails and reset rawpile        
-                except Exception:                                       
-                    logger.error('Failed to process file', exc_info=True)
-                    rawpile = None
+                # Process stream, and report it hasn't got 1 nmi yet if no
+                # results
+                pro = stream.process(detach=True)
+                if pro is None:
+                    logger.info('Processing pending: at least 1 nmi required')
+            
+            # or report the vessel is not moving, and reset parameters (the
+            # transect in transit, if any, was flushed above)
+            else:
+                logger.info('Processing skipped: platform not in transit')
+                stream.reset()
+        
+        # log error if process fails and drop pings not processed
+        except Exception:
+            logger.error('Failed to process file', exc_info=True)
+            stream.drop()
+        
+        # Pass results to the reporting stage, with the state so far
+        try:
+            state['stream'] = stream.state()
+        except Exception:
+            logger.warning('Failed to get processing state', exc_info=True)
+        toreport.put((pro, state, time.perf_counter()))
+        
+        logger.info('Processing stage: %.1f s (%.1f s queued), '
+                    '%d results to report' % (time.perf_counter()-start,
+                                              start-queued, toreport.qsize()))
+        
+        # free up memory RAM
+        raw, pro = None, None
+        gc.collect()
+
+def flush(stream, toreport):
+    """
+    Put the intervals held back by the processing stream (see 
+    CcamlrStream.flush) in the queue to be reported, with no state to save,
+    as the RAW file being processed is not in the stream yet.
+    """
+    pro = stream.flush(detach=True)
+    if pro is not None:
+        toreport.put((pro, None, time.perf_counter()))
+
+def reporting(toreport, logname, savepng=False, reportrows=10,
+              platform='Unknown', recipient=None, lastrow=0, resume=None,
+              path=None, deliver=None, encoding=None):
+    """
+    Reporting stage of the listening routine. Takes processed data from a 
+    queue, logs it, and sends summary reports to land. Then, it saves the 
+    state of the listening routine. It stops when it takes None.
+    
+    Args:
+        toreport   (Queue): Processed data to report, state of the reading
+                            and processing stages (None to not save it), 
+                            and time it was queued.
+        logname    (str  ): Directory name under which results are logged.
+        savepng    (bool ): Whether or not to save PNG echograms.
+        reportrows (int  ): Number of rows in table reports.
+        platform   (str  ): Platform name.
+        recipient  (str  ): Recipient email to receive results.
+        lastrow    (int  ): Last row of results delivered to land.
+        resume     (str  ): Path to the checkpoint file. None to not save it.
+        path       (str  ): Path to the directory being listened.
+        deliver    (func ): Function delivering reports to land (see 
+                            report.land). None to send them by email.
+        encoding  (Binary): Binary encoding of reports to land (see 
+                            report.land). None to send CSV text.
+    """
+    while 1:
+        item = toreport.get()
+        if item is None:
+            break
+        pro, state, queued = item
+        start              = time.perf_counter()
+        
+        # Save state, and continue if there is nothing to report
+        if pro is None:
+            save(resume, state, path, logname, lastrow)
+            continue
+        
+        # Report results
+        try:
+            report.console(pro)
+            report.log(pro, logname, savepng=savepng)
+        except Exception:
+            logger.error('Failed to log results', exc_info=True)
+        try:
+            lastrow = report.land(logname, lastrow, reportrows,
+                                  platform=platform, recipient=recipient,
+                                  deliver=deliver, encoding=encoding)
+        except Exception:                                       
+            logger.error('Failed to send report',exc_info=True)
+        
+        save(resume, state, path, logname, lastrow)
+        logger.info('Reporting stage: %.1f s (%.1f s queued)'
+                    % (time.perf_counter()-start, start-queued))
+        pro = None
+
+def save(resume, state, path, logname, lastrow):
+    """
+    Save the state of the listening routine in the checkpoint file, logging
+    an error if it fails.
+    """
+    if (resume is None) or (state is None):
+        return
+    state = dict(state)
+    state['listen'] = {'path'     : path     , 'logname': logname,
+                       'lastrow'  : lastrow  ,
+                       'processed': state.pop('processed')}
+    try:
+        checkpoint.save(resume, state)
+    except Exception:
+        logger.error('Failed to save checkpoint', exc_info=True)
 
 # Excute listen module if this script is run as the main program
 # Fill in module's arguments from console inputs                        
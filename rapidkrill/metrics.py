@@ -0,0 +1,223 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+RapidKrill metrics. Opt-in instrumentation of reading, processing and
+reporting routines: wall time, CPU time and peak RSS increase of every stage
+of a routine, recorded every time the routine runs (e.g. for every RAW file).
+
+Routines mark where they start and end, and where every stage ends (see
+start, lap and end). Nothing is measured unless metrics are enabled (see
+enable). Records are appended to a JSON lines file, one line per routine
+run, and the last record of every routine can also be kept in a Prometheus
+textfile, to be exported by node_exporter:
+
+    {"time": "2019-01-01T00:10:00.000", "routine": "read.raw",
+     "file": "D20190101-T000000.raw",
+     "stages": {"decode": {"wall": 10.2, "cpu": 9.9, "rss": 250.1}, ...},
+     "total": {"wall": 12.1, "cpu": 11.6, "rss": 250.1}}
+
+Times are in seconds, and RSS in MB. CPU time is that of the thread running
+the routine, so that routines running concurrently (see listen) are not
+mixed up. Peak RSS is that of the process.
+
+Created on Fri Oct 16 21:02:17 2026
+@author: British Antarctic Survey
+"""
+
+# import modules
+import os, json, time, datetime, threading, resource, logging
+
+# log events while running
+logger = logging.getLogger()
+
+# settings and state, shared by all threads
+settings = {'jsonl': None, 'textfile': None}
+last     = {}
+runs     = {}
+lock     = threading.Lock()
+local    = threading.local()
+
+class Run(object):
+    """
+    Measurements of a routine run, stage by stage.
+
+    Args:
+        routine (str ): Routine name, e.g. "read.raw".
+        file    (str ): RAW file the routine runs for, if any.
+        fields  (dict): Other fields to record.
+    """
+
+    def __init__(self, routine, file=None, fields={}):
+        self.routine = routine
+        self.file    = file
+        self.fields  = dict(fields)
+        self.stages  = {}
+        self.start   = _now()
+        self.mark    = self.start
+
+    def lap(self, stage):
+        """
+        Record the stage that ends now, adding it up if already recorded.
+        """
+        now = _now()
+        s   = self.stages.setdefault(stage, {'wall': 0., 'cpu': 0., 'rss': 0.})
+        for k in s:
+            s[k] += now[k] - self.mark[k]
+        self.mark = now
+
+    def record(self):
+        """
+        Get the record of the run, with totals since the start.
+        """
+        now   = _now()
+        total = {k: now[k] - self.start[k] for k in now}
+        record = {'time'   : datetime.datetime.now().isoformat(
+                                 timespec='milliseconds'),
+                  'routine': self.routine,
+                  'file'   : self.file,
+                  'stages' : self.stages,
+                  'total'  : total}
+        record.update(self.fields)
+        return record
+
+def enable(jsonl, textfile=None):
+    """
+    Enable metrics.
+
+    Args:
+        jsonl    (str): Path to the JSON lines file where records are
+                        appended.
+        textfile (str): Path to the Prometheus textfile with the last record
+                        of every routine (e.g. in the node_exporter textfile
+                        collector directory). None to not write it.
+    """
+    with lock:
+        settings['jsonl'   ] = jsonl
+        settings['textfile'] = textfile
+        last.clear()
+        runs.clear()
+
+def disable():
+    """
+    Disable metrics.
+    """
+    with lock:
+        settings['jsonl'   ] = None
+        settings['textfile'] = None
+
+def enabled():
+    """
+    Whether or not metrics are enabled.
+    """
+    return settings['jsonl'] is not None
+
+def start(routine, file=None, **fields):
+    """
+    Mark the start of a routine run in this thread. Runs can be nested, and
+    stages are recorded in the innermost one. Runs of the same routine left
+    unfinished (e.g. after a failure) are dropped.
+
+    Args:
+        routine  (str): Routine name, e.g. "process.ccamlr".
+        file     (str): RAW file the routine runs for, if any.
+        **fields      : Other fields to record.
+    """
+    if not enabled():
+        return
+    stack = _stack()
+    for i, run in enumerate(stack):
+        if run.routine==routine:
+            del stack[i:]
+            break
+    stack.append(Run(routine, file, fields))
+
+def lap(stage):
+    """
+    Mark the end of a stage of the routine running in this thread, which
+    started where the preceeding stage ended, or where the routine started.
+
+    Args:
+        stage (str): Stage name, e.g. "decode".
+    """
+    stack = getattr(local, 'stack', None)
+    if stack:
+        stack[-1].lap(stage)
+
+def end(routine):
+    """
+    Mark the end of the routine running in this thread, and emit its record.
+
+    Args:
+        routine (str): Routine name, as given at the start.
+
+    Returns:
+        dict: Record of the routine run, None if metrics are not enabled.
+    """
+    stack = getattr(local, 'stack', None)
+    if not stack or stack[-1].routine!=routine:
+        return None
+    record = stack.pop().record()
+    try:
+        emit(record)
+    except Exception:
+        logger.warning('Failed to write metrics', exc_info=True)
+    return record
+
+def emit(record):
+    """
+    Append a record to the JSON lines file, and update the Prometheus
+    textfile.
+    """
+    with lock:
+        if settings['jsonl'] is None:
+            return
+        with open(settings['jsonl'], 'a') as f:
+            f.write(json.dumps(record) + '\n')
+        last[record['routine']] = record
+        runs[record['routine']] = runs.get(record['routine'], 0) + 1
+        if settings['textfile'] is not None:
+            textfile(settings['textfile'])
+
+def textfile(path):
+    """
+    Write the last record of every routine in a Prometheus textfile. The file
+    is replaced at once, so that it is never read half-written.
+    """
+    lines = []
+    names = [('wall', 'rapidkrill_stage_seconds',
+              'Wall time of the stage in the last run (s).'),
+             ('cpu' , 'rapidkrill_stage_cpu_seconds',
+              'CPU time of the stage in the last run (s).'),
+             ('rss' , 'rapidkrill_stage_rss_increase_megabytes',
+              'Peak RSS increase in the stage in the last run (MB).')]
+    for key, name, text in names:
+        lines += ['# HELP %s %s' % (name, text), '# TYPE %s gauge' % name]
+        for routine, record in sorted(last.items()):
+            stages = dict(record['stages'], total=record['total'])
+            for stage, values in stages.items():
+                lines.append('%s{routine="%s",stage="%s"} %.6g'
+                             % (name, routine, stage, values[key]))
+    name = 'rapidkrill_runs_total'
+    lines += ['# HELP %s Number of routine runs recorded.' % name,
+              '# TYPE %s counter' % name]
+    lines += ['%s{routine="%s"} %d' % (name, routine, n)
+              for routine, n in sorted(runs.items())]
+    name = 'rapidkrill_last_run_timestamp_seconds'
+    lines += ['# HELP %s Time the last run ended (s since epoch).' % name,
+              '# TYPE %s gauge' % name]
+    for routine, record in sorted(last.items()):
+        t = datetime.datetime.fromisoformat(record['time']).timestamp()
+        lines.append('%s{routine="%s"} %.3f' % (name, routine, t))
+    with open(path + '.tmp', 'w') as f:
+        f.write('\n'.join(lines) + '\n')
+    os.replace(path + '.tmp', path)
+
+def _stack():
+    if not hasattr(local, 'stack'):
+        local.stack = []
+    return local.stack
+
+def _now():
+    return {'wall': time.perf_counter(),
+            'cpu' : time.thread_time(),
+            'rss' : resource.getrusage(resource.RUSAGE_SELF).ru_maxrss/1024}
@@ -0,0 +1,238 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+RapidKrill navigation routines. Vectorized operations on GPS positions.
+
+Created on Fri Oct 16 10:02:17 2026
+@author: British Antarctic Survey
+"""
+
+# import modules
+import numpy as np
+import pandas as pd
+from scipy.signal import savgol_filter
+
+# WGS84 ellipsoid
+a = 6378137.0
+f = 1/298.257223563
+b = (1-f)*a
+
+# reference time for timestamps
+epoch = np.datetime64('1970-01-01T00:00:00')
+
+def timestamp(t):
+    """
+    Convert time to timestamp floats.
+    
+    Args:
+        t (datetime64): array with time.
+        
+    Returns:
+        float: array with milliseconds since 1970-01-01T00:00:00.
+    """
+    return (t - epoch)/np.timedelta64(1, 'ms')
+
+def interp(x, xp, fp, bounds='nan'):
+    """
+    Linearly interpolate several variables sharing the same coordinates. The
+    segments enclosing the new coordinates are found once, in a single 
+    searchsorted pass, and used to interpolate all variables at once.
+    
+    Args:
+        x     (float): 1D array with coordinates to interpolate to.
+        xp    (float): 1D array with coordinates of the data.
+        fp    (float): 2D array with data (variables x coordinates), or 1D
+                       array if there is only one variable.
+        bounds (str ): Behaviour for coordinates out of range: 'nan' to 
+                       return NaN, 'extrapolate' to extrapolate linearly from
+                       the edge segments, or 'raise' to raise an error.
+        
+    Returns:
+        float: 2D array with interpolated data (variables x coordinates), or
+               1D array if there is only one variable.
+    """
+    x  = np.asarray(x , dtype=float)
+    xp = np.asarray(xp, dtype=float)
+    fp = np.asarray(fp, dtype=float)
+    
+    # sort data coordinates, if they are not
+    if (np.diff(xp)<0).any():
+        order = np.argsort(xp, kind='mergesort')
+        xp    = xp[order]
+        fp    = fp[..., order]
+    
+    # find the segment enclosing each coordinate, edge segments if outside
+    hi = np.clip(np.searchsorted(xp, x), 1, len(xp)-1)
+    lo = hi - 1
+    
+    # interpolate all variables with the same segments and weights
+    with np.errstate(invalid='ignore', divide='ignore'):
+        w = (x - xp[lo])/(xp[hi] - xp[lo])
+    f = fp[..., lo] + (fp[..., hi] - fp[..., lo])*w
+    
+    # deal with coordinates out of range
+    out = (x<xp[0]) | (x>xp[-1])
+    if out.any():
+        if bounds=='nan':
+            f[..., out] = np.nan
+        elif bounds=='raise':
+            raise Exception('Coordinates out of interpolation range')
+        elif bounds!='extrapolate':
+            raise Exception('Unknown bounds behaviour: %s' % bounds)
+    
+    return f
+
+def distance(lat0, lon0, lat1, lon1, maxiter=200, tol=1e-12):
+    """
+    Compute ellipsoidal distances between two sets of positions on the WGS84
+    ellipsoid, using Vincenty's inverse formula for all the positions at once.
+
+    Distances match geopy's geodesic distance within 1 mm. Positions with NaN
+    values result in NaN distances. Nearly antipodal positions, for which the
+    formula does not converge, also result in NaN distances.
+
+    Args:
+        lat0 (float): 1D array or scalar with latitudes of first positions.
+        lon0 (float): 1D array or scalar with longitudes of first positions.
+        lat1 (float): 1D array or scalar with latitudes of second positions.
+        lon1 (float): 1D array or scalar with longitudes of second positions.
+        maxiter (int): maximum number of iterations.
+        tol (float): convergence tolerance for longitude on the auxiliary
+                     sphere (radians).
+
+    Returns:
+        float: 1D array or scalar with distances (kilometres).
+    """
+
+    # convert positions to radians
+    lat0, lon0, lat1, lon1 = np.broadcast_arrays(
+        *[np.radians(np.asarray(x, dtype=float)) for x in (lat0, lon0,
+                                                           lat1, lon1)])
+
+    # get reduced latitudes and difference in longitude
+    U0 = np.arctan((1-f)*np.tan(lat0))
+    U1 = np.arctan((1-f)*np.tan(lat1))
+    L  = lon1 - lon0
+    sinU0, cosU0 = np.sin(U0), np.cos(U0)
+    sinU1, cosU1 = np.sin(U1), np.cos(U1)
+
+    # iterate longitude on the auxiliary sphere until convergence
+    nans = np.isnan(lat0)|np.isnan(lon0)|np.isnan(lat1)|np.isnan(lon1)
+    lmb  = L.copy()
+    done = nans.copy()
+    with np.errstate(invalid='ignore', divide='ignore'):
+        for i in range(maxiter):
+            sinlmb, coslmb = np.sin(lmb), np.cos(lmb)
+            sinsig  = np.hypot(cosU1*sinlmb, cosU0*sinU1 - sinU0*cosU1*coslmb)
+            cossig  = sinU0*sinU1 + cosU0*cosU1*coslmb
+            sig     = np.arctan2(sinsig, cossig)
+            sinalp  = np.where(sinsig==0, 0, cosU0*cosU1*sinlmb/sinsig)
+            cos2alp = 1 - sinalp**2
+            cos2sm  = np.where(cos2alp==0, 0,
+                               cossig - 2*sinU0*sinU1/cos2alp)
+            C       = f/16*cos2alp*(4 + f*(4 - 3*cos2alp))
+            lmb_    = lmb
+            lmb     = L + (1-C)*f*sinalp*(sig + C*sinsig*(
+                      cos2sm + C*cossig*(-1 + 2*cos2sm**2)))
+            done    = done | (abs(lmb-lmb_)<=tol)
+            if done.all():
+                break
+
+        # compute ellipsoidal distance
+        u2 = cos2alp*(a**2-b**2)/b**2
+        A  = 1 + u2/16384*(4096 + u2*(-768 + u2*(320 - 175*u2)))
+        B  = u2/1024*(256 + u2*(-128 + u2*(74 - 47*u2)))
+        dsig = B*sinsig*(cos2sm + B/4*(cossig*(-1 + 2*cos2sm**2)
+               - B/6*cos2sm*(-3 + 4*sinsig**2)*(-3 + 4*cos2sm**2)))
+        s  = b*A*(sig - dsig)
+
+    # coincident positions are at zero distance, not converged ones are NaN
+    s = np.where(sinsig==0, 0, s)
+    s = np.where(done, s, np.nan)
+    s = np.where(nans, np.nan, s)
+
+    # return distance in kilometres
+    s = s/1000
+    if s.ndim==0:
+        return float(s)
+    return s
+
+def clean(T, LON, LAT, maxspeed=25, window=31, thr=100, smooth=51):
+    """
+    Clean GPS fixes. Fixes are rejected if they are not valid numbers, if 
+    they are reached and left at speeds above maxspeed, or if they are too far
+    from the rolling median track. Rejected fixes are linearly interpolated in
+    time from valid neighbours, and the positions around them are smoothed 
+    with a Savitzky-Golay filter. Positions far from rejected fixes are left 
+    untouched. Longitude is unwrapped beforehand, so that tracks crossing the
+    dateline are continuous, and wrapped back to [-180, 180) where changed.
+    All operations are vectorized and cost is linear with the 
+    number of fixes.
+    
+    Args:
+        T  (datetime64): 1D array with GPS time.
+        LON     (float): 1D array with longitude (deg).
+        LAT     (float): 1D array with latitude (deg).
+        maxspeed (int, float): Maximum speed allowed (knots).
+        window  (int): Length of the rolling median window (number of fixes).
+        thr     (int, float): Maximum distance allowed to the rolling median
+                              track (m).
+        smooth  (int): Length of the smoothing window (number of fixes).
+        
+    Returns:
+        float: 1D array with cleaned longitude (deg).
+        float: 1D array with cleaned latitude (deg).
+        bool : 1D array with quality mask (True for valid fixes, False for
+               rejected and interpolated fixes).
+    """
+    LON = np.array(LON, dtype=float)
+    LAT = np.array(LAT, dtype=float)
+    Tf  = timestamp(T)/1000
+    
+    # reject non-valid positions
+    Q = ~(np.isnan(LON) | np.isnan(LAT))
+    
+    # reject positions reached and left at speeds above maximum
+    with np.errstate(invalid='ignore', divide='ignore'):
+        KNT = distance(LAT[:-1], LON[:-1], LAT[1:], LON[1:]) / 1.852 \
+              / (np.diff(Tf)/3600)
+    fast  = ~(KNT<=maxspeed)
+    spike = np.zeros(len(Q), dtype=bool)
+    if len(fast):
+        spike[1:-1] = fast[:-1] & fast[1:]
+        spike[ 0  ] = fast[ 0 ] & ~spike[ 1]
+        spike[-1  ] = fast[-1 ] & ~spike[-2]
+    Q &= ~spike
+    
+    # unwrap longitude of valid positions, continuous across the dateline
+    LONu    = LON.copy()
+    LONu[Q] = np.degrees(np.unwrap(np.radians(LON[Q])))
+    
+    # reject positions away from the rolling median track
+    LONmed = pd.Series(np.where(Q, LONu, np.nan)).rolling(
+             window, center=True, min_periods=1).median().values
+    LATmed = pd.Series(np.where(Q, LAT, np.nan)).rolling(
+             window, center=True, min_periods=1).median().values
+    with np.errstate(invalid='ignore'):
+        Q &= ~(distance(LAT, LONu, LATmed, LONmed)*1000 > thr)
+    
+    # return if everything is valid, or if there is not enough to interpolate
+    if Q.all() | (Q.sum()<2):
+        return LON, LAT, Q
+    
+    # interpolate rejected positions from valid ones
+    LONu[~Q] = np.interp(Tf[~Q], Tf[Q], LONu[Q])
+    LAT [~Q] = np.interp(Tf[~Q], Tf[Q], LAT [Q])
+    
+    # smooth only the spans around rejected positions
+    span   = ~Q
+    smooth = min(smooth, len(LON) - (len(LON)+1)%2)
+    if smooth>3:
+        span = np.convolve(~Q, np.ones(smooth), 'same')>0
+        LONu[span] = savgol_filter(LONu, smooth, 3)[span]
+        LAT [span] = savgol_filter(LAT , smooth, 3)[span]
+    
+    # wrap longitude back where changed
+    LON[span] = (LONu[span] + 180) % 360 - 180
+    
+    return LON, LAT, Q
@@ -10,35 +10,73 @@ Created on Wed Apr 10 15:41:48 2019
 import os
 import numpy as np
 import logging, logging.config
+from scipy import ndimage
 from scipy.signal import convolve2d
-from scipy.interpolate import interp1d
 from echopy import transform as tf
-from echopy import resample as rs
 from echopy import mask_impulse as mIN
 from echopy import mask_seabed as mSB
 from echopy import get_background as gBN
 from echopy import mask_signal2noise as mSN
-from echopy import mask_range as mRG
 from echopy import mask_shoals as mSH
+from echopy import mask_range as mRG
+from rapidkrill import read, nav, binning, filters, background, cache, seabed
+from rapidkrill import metrics
 
 # log events while running
 logger = logging.getLogger()
 logging.config.fileConfig(os.path.join(os.path.dirname(__file__),'logging.conf'))
 
-def ccamlr(raw, prepro=None, jdx=[0,0]):
+# Sv-sized variables output by each profile. Variables resampled every nmi,
+# and variables along pings or range, are output by every profile.
+OUTPUTS = {'minimal': ['m120_'],
+           'png'    : ['m120_', 'Sv120', 'Sv120sw'],
+           'full'   : ['m120_', 'Sv120', 'Sv120sw', 'bn120', 'Sv120in',
+                       'Sv120clean', 'Sv120swrf', 'theta120', 'phi120']}
+
+def ccamlr(raw, prepro=None, jdx=[0,0], output='full', layers=None,
+           kernels='echopy', noise=None, tracking=False):
     """
     CCAMLR processing routine.
     
     Process EK60 raw data and returns its variables in a dictionary array.
+    Sv-sized variables are processed with the same precision as the Sv from
+    RAW data (e.g. float32, see read.raw), while variables resampled every 
+    nmi, and distance, time and position, are always float64.
+    
+    Sv-sized variables not in the output profile (see OUTPUTS) are freed up as
+    soon as they are no longer needed, to cut peak memory: "minimal" keeps
+    only the mask needed by next_jdx, "png" adds the Sv needed to plot 
+    echograms (see report.log), and "full" keeps every variable.
+    
+    NASC is computed from 20 to 250 m, or down to the seabed, and also in
+    other depth layers if requested (see integrate).
+    
+    Impulse noise filtering, background noise estimation and swarm smoothing
+    run with echopy by default, or with the faster routines of rapidkrill if
+    kernels is "rapidkrill" (see filters and background), which give the 
+    same results. Variables depending only on range and absorption are 
+    cached (see geometry).
+    
+    Background noise can also be reused from preceeding calls, passing the
+    same background.Noise model every time, so that it is only estimated
+    again on a schedule or when it drifts.
+    
+    The seabed is searched in the whole range of every ping, or following
+    it along pings if tracking is True (see seabed.track).
+    
+    Every processing stage is measured if metrics are enabled (see metrics).
     """
     #--------------------------------------------------------------------------
     # check for appropiate inputs
     if (isinstance(prepro, dict)) & (jdx[0]>=0):
         raise Exception('Preceeding raw data needs appropiate j indexes')
+    if kernels not in ('echopy', 'rapidkrill'):
+        raise Exception('Kernels must be "echopy" or "rapidkrill"')
         
     #--------------------------------------------------------------------------       
     # Load variables
     rawfiles    = raw['rawfiles']
+    metrics.start('process.ccamlr', rawfiles[-1])
     transect    = raw['transect']
     alpha120    = raw['alpha'   ]
     r120        = raw['r'       ]    
@@ -53,8 +91,10 @@ def ccamlr(raw, prepro=None, jdx=[0,0]):
     rollmax120  = raw['rollmax' ]
     heavemax120 = raw['heavemax']
     Sv120       = raw['Sv'      ]
-    theta120    = raw['theta'   ]
-    phi120      = raw['phi'     ]
+    angles120   = [(read.angleset(raw), None)]
+    dtype       = Sv120.dtype
+    geometry120 = geometry(r120, alpha120)
+    drop        = [k for k in OUTPUTS['full'] if k not in OUTPUTS[output]]
     
     #--------------------------------------------------------------------------    
     # join preceeding raw data, if there is continuity in the transect
@@ -68,11 +108,12 @@ def ccamlr(raw, prepro=None, jdx=[0,0]):
             knt120   = np.r_[prepro['knt'  ][   jdx[0]:], knt120  ]
             kph120   = np.r_[prepro['kph'  ][   jdx[0]:], kph120  ]
             Sv120    = np.c_[prepro['Sv'   ][:, jdx[0]:], Sv120   ]
-            theta120 = np.c_[prepro['theta'][:, jdx[0]:], theta120]
-            phi120   = np.c_[prepro['phi'  ][:, jdx[0]:], phi120  ]
+            angles120.insert(0, (read.angleset(prepro), jdx[0]))
         else:
             jdx[1]=0
-    else:
+    
+    # piled raw data (see read.RawPile) may already carry preceeding pings
+    elif not raw.get('carried', 0):
         jdx[1]=0 
     
     #--------------------------------------------------------------------------    
@@ -83,114 +124,152 @@ def ccamlr(raw, prepro=None, jdx=[0,0]):
 
     #--------------------------------------------------------------------------       
     # Clean impulse noise      
-    Sv120in, m120in_ = mIN.wang(Sv120, thr=(-70,-40), erode=[(3,3)],
-                                dilate=[(7,7)], median=[(7,7)])
+    wang             = mIN.wang if kernels=='echopy' else filters.wang
+    Sv120in, m120in_ = wang(Sv120, thr=(-70,-40), erode=[(3,3)],
+                            dilate=[(7,7)], median=[(7,7)])
+    Sv120in          = Sv120in.astype(dtype, copy=False)
+    metrics.lap('impulse')
     #TODO: True is valid
     # -------------------------------------------------------------------------
     # estimate and correct background noise       
-    p120           = np.arange(len(t120))                
-    s120           = np.arange(len(r120))                
-    bn120, m120bn_ = gBN.derobertis(Sv120, s120, p120, 5, 20, r120, alpha120)
+    if noise is not None:
+        bn120, m120bn_ = noise.estimate(Sv120, t120, geometry120['tvg'])
+    elif kernels=='echopy':
+        p120           = np.arange(len(t120))                
+        s120           = np.arange(len(r120))                
+        bn120, m120bn_ = gBN.derobertis(Sv120, s120, p120, 5, 20, r120,
+                                        alpha120)
+    else:
+        bn120, m120bn_ = background.derobertis(Sv120, 5, 20,
+                                               geometry120['tvg'])
+    bn120          = bn120.astype(dtype, copy=False)
     Sv120clean     = tf.log(tf.lin(Sv120in) - tf.lin(bn120))
+    Sv120clean     = Sv120clean.astype(dtype, copy=False)
+    if 'Sv120in' in drop:
+        Sv120in = None
+    metrics.lap('background')
     #TODO: True is valid
     # -------------------------------------------------------------------------
     # mask low signal-to-noise 
     m120sn             = mSN.derobertis(Sv120clean, bn120, thr=12)
     Sv120clean[m120sn] = -999
+    del m120sn
+    metrics.lap('SNR')
     
     # -------------------------------------------------------------------------
     # get mask for near-surface and deep data
-    m120rg = mRG.outside(Sv120clean, r120, 19.9, 250)
+    m120rg = np.broadcast_to(geometry120['outside'], Sv120clean.shape)
     
     # -------------------------------------------------------------------------
-    # get mask for seabed
-    m120sb = mSB.ariza(Sv120, r120, r0=20, r1=1000, roff=0,
-                       thr=-38, ec=1, ek=(3,3), dc=10, dk=(3,7))
+    # get mask for seabed, and seabed sample at every ping
+    if tracking:
+        idx    = seabed.track(Sv120, r120, r0=20, r1=1000,
+                              thr=-38, ec=1, ek=(3,3), dc=10, dk=(3,7))
+        m120sb = (np.arange(len(r120)).reshape(-1, 1) >= idx) & (idx>0)
+    else:
+        m120sb = mSB.ariza(Sv120, r120, r0=20, r1=1000, roff=0,
+                           thr=-38, ec=1, ek=(3,3), dc=10, dk=(3,7))
+        idx    = np.argmax(m120sb, axis=0)
     
     # -------------------------------------------------------------------------
     # get seabed line
-    idx                = np.argmax(m120sb, axis=0)
     sbline             = r120[idx]
     sbline[idx==0]     = np.inf
     sbline             = sbline.reshape(1,-1)
     sbline[sbline>250] = np.nan
+    metrics.lap('seabed')
     
     # -------------------------------------------------------------------------
     # get mask for non-usable range    
     m120nu = mSN.fielding(bn120, -80)[0]
+    if 'bn120' in drop:
+        bn120 = None
     
     # -------------------------------------------------------------------------
     # remove unwanted (near-surface & deep data, seabed & non-usable range)
     m120uw = m120rg|m120sb|m120nu
     Sv120clean[m120uw] = np.nan
+    metrics.lap('unwanted')
     
     # -------------------------------------------------------------------------
     # get swarms mask
-    k = np.ones((3, 3))/3**2
-    Sv120cvv = tf.log(convolve2d(tf.lin(Sv120clean), k,'same',boundary='symm'))   
+    if kernels=='echopy':
+        k = np.ones((3, 3), dtype=dtype)/3**2
+        Sv120cvv = tf.log(convolve2d(tf.lin(Sv120clean), k,'same',
+                                     boundary='symm'))
+    else:
+        Sv120cvv = tf.log(filters.box(tf.lin(Sv120clean), (3, 3)))
+    Sv120cvv = Sv120cvv.astype(dtype, copy=False)
     m120sh, m120sh_ = mSH.echoview(Sv120cvv, r120, km120*1000, thr=-70,
                                    mincan=(3,10), maxlink=(3,15), minsho=(3,15))
+    del Sv120cvv
      
     # -------------------------------------------------------------------------
     # get Sv with only swarms
-    Sv120sw                    = Sv120clean.copy()
+    if 'Sv120clean' in drop:
+        Sv120sw, Sv120clean    = Sv120clean, None
+    else:
+        Sv120sw                = Sv120clean.copy()
     Sv120sw[~m120sh & ~m120uw] = -999
+    del m120sh, m120uw
+    metrics.lap('shoals')
     
     # -------------------------------------------------------------------------
-    # resample Sv from 20 to 250 m, and every 1nm     
-    r120intervals                     = np.array([20, 250])
-    nm120intervals                    = np.arange(jdx[1], nm120[-1],   1) 
-    Sv120swr, r120r, nm120r, pc120swr = rs.twod(Sv120sw, r120, nm120,
-                                                r120intervals, nm120intervals,
-                                                log=True)
-        
-    # -------------------------------------------------------------------------
-    # remove seabed from pc120swr calculation, only water column is considered
-    m120sb_             = m120sb*1.0
-    m120sb_[m120sb_==1] = np.nan
-    pc120water          = rs.twod(m120sb_, r120, nm120,
-                                  r120intervals, nm120intervals)[3]
-    pc120swr            = pc120swr/pc120water * 100
+    # resample Sv from 20 to 250 m, and every 1nm, getting the percentage of 
+    # valid samples over water column samples (seabed not considered), and
+    # the seabed line, with bin indexes worked out only once, and samples
+    # straddling bin edges weighted as in rs.twod
+    r120intervals  = np.array([20, 250])
+    nm120intervals = np.arange(jdx[1], nm120[-1],   1) 
+    bins120        = binning.Bins(r120, nm120, r120intervals, nm120intervals,
+                                  iaxis=geometry120['rbins'], weights=True)
+    r120r          = r120intervals [:-1]
+    nm120r         = nm120intervals[:-1]
+    Sv120swr, n120 = bins120.mean(Sv120sw, log=True)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        pc120swr   = n120/bins120.sum(~m120sb) * 100
+    sbliner        = bins120.oned(sbline[0]).reshape(1, -1)
     
     # -------------------------------------------------------------------------
-    # resample seabed line every 1nm
-    sbliner = rs.oned(sbline, nm120, nm120intervals, 1)[0]
+    # -999 (no swarms) underflows to -inf if averaged in float32
+    Sv120swr[Sv120swr==-np.inf] = -999
     
     # -------------------------------------------------------------------------
     # get time resampled, interpolated from distance resampled
-    epoch  = np.datetime64('1970-01-01T00:00:00')
-    t120f  = np.float64(t120 - epoch)    
-    f      = interp1d(nm120, t120f)
-    t120rf = f(nm120r)
-    t120r  = np.array(t120rf, dtype='timedelta64[ms]') + epoch
+    epoch          = nav.epoch
+    t120f          = nav.timestamp(t120)
+    t120rf         = nav.interp(nm120r        , nm120, t120f, bounds='raise')
+    t120r          = np.array(t120rf, dtype='timedelta64[ms]') + epoch
     
-    t120intervalsf = f(nm120intervals)
+    t120intervalsf = nav.interp(nm120intervals, nm120, t120f, bounds='raise')
     t120intervals  = np.array(t120intervalsf, dtype='timedelta64[ms]') + epoch
     
     # -------------------------------------------------------------------------
     # get latitude & longitude resampled, interpolated from time resampled
-    f       = interp1d(t120f, lon120)
-    lon120r = f(t120rf)
-    f       = interp1d(t120f, lat120)
-    lat120r = f(t120rf)
+    lon120r, lat120r = nav.interp(t120rf, t120f, [lon120, lat120],
+                                  bounds='raise')
     
     # -------------------------------------------------------------------------
     # resample back to full resolution  
-    Sv120swrf, m120swrf_   = rs.full(Sv120swr, r120intervals, nm120intervals, 
-                                     r120, nm120)
+    Sv120swrf, m120swrf_   = bins120.full(Sv120swr, dtype=dtype)
+    if 'Sv120swrf' in drop:
+        Sv120swrf = None
     #TODO: True is valid
     
     # -------------------------------------------------------------------------
     # compute Sa and NASC from 20 to 250 m or down to the seabed depth
-    Sa120swr   = np.zeros_like(Sv120swr)*np.nan
-    NASC120swr = np.zeros_like(Sv120swr)*np.nan
-    for i in range(len(Sv120swr[0])):
-        if (np.isnan(sbliner[0,i])) | (sbliner[0,i]>250):
-            Sa120swr  [0,i] = tf.log(tf.lin(Sv120swr[0,i])*(250-20))
-            NASC120swr[0,i] = 4*np.pi*1852**2*tf.lin(Sv120swr[0,i])*(250-20)
-        else:
-            Sa120swr  [0,i] = tf.log(tf.lin(Sv120swr[0,i])*(sbliner[0,i]-20))
-            NASC120swr[0,i] = 4*np.pi*1852**2*tf.lin(Sv120swr[0,i])*(sbliner[0,i]-20)
+    thick120r  = np.where(np.isnan(sbliner) | (sbliner>250), 250, sbliner) - 20
+    Sa120swr   = tf.log(tf.lin(Sv120swr)*thick120r)
+    NASC120swr = 4*np.pi*1852**2*tf.lin(Sv120swr)*thick120r
+    metrics.lap('resample')
+    
+    # -------------------------------------------------------------------------
+    # compute Sv, Sa and NASC in other depth layers, if requested
+    if layers is not None:
+        Sv120swl, thick120l, Sa120swl, NASC120swl = integrate(
+            Sv120sw, r120, nm120, nm120intervals, sbline[0], sbliner[0],
+            layers)
+        metrics.lap('integrate')
     
     # -------------------------------------------------------------------------
     # return processed data outputs
@@ -211,8 +290,6 @@ def ccamlr(raw, prepro=None, jdx=[0,0]):
            'rollmax120'     : rollmax120 , # max value in last rolling cycle (deg)
            'heavemax120'    : heavemax120, # max value in last heave cycle (deg)
            'Sv120'          : Sv120      , # Sv (dB)
-           'theta120'       : theta120   , # Athwart-ship angle (deg)
-           'phi120'         : phi120     , # Alon-ship angle (deg)
            'bn120'          : bn120      , # Background noise (dB)
            'Sv120in'        : Sv120in    , # Sv without impulse noise (dB)
            'Sv120clean'     : Sv120clean , # Sv without background noise (dB)          
@@ -231,8 +308,141 @@ def ccamlr(raw, prepro=None, jdx=[0,0]):
            'NASC120swr'     : NASC120swr , # NASC from swarms, resampled (m2 nmi-2)
            'Sv120swrf'      : Sv120swrf  , # Sv with only swarms, resampled, full resolution (dB)         
            'm120_'          : m120_      } # Sv mask indicating valid processed data (where all filters could be applied)
+    if layers is not None:
+        pro.update({'layers120'  : layers    , # depth layers (see integrate)
+                    'Sv120swl'   : Sv120swl  , # Sv with only swarms, in layers (dB)
+                    'thick120l'  : thick120l , # Thickness of layers (m)
+                    'Sa120swl'   : Sa120swl  , # Sa from swarms, in layers (m2 m-2)
+                    'NASC120swl' : NASC120swl}) # NASC from swarms, in layers (m2 nmi-2)
+    
+    # add Along-ship (theta120) & Athwart-ship (phi120) angles (deg), which are
+    # not decoded until first accessed
+    if 'theta120' in drop:
+        lazy = {}
+    else:
+        angles120, lazy = read.lazyangles(angles120, 'theta120', 'phi120')
+        pro.update(angles120)
+    
+    # leave out variables not in the output profile
+    for k in drop:
+        pro.pop(k, None)
+    metrics.end('process.ccamlr')
     
-    return pro
+    return read.RawData(pro, lazy=lazy)
+
+def geometry(r, alpha):
+    """
+    Get variables that depend only on range and absorption, which rarely
+    change along a cruise. They are worked out only once for every range
+    and absorption, and then taken from cache.geometry.
+    
+    Args:
+        r     (float): 1D array with range (m).
+        alpha (float): Absorption coefficient (dB m-1).
+    
+    Returns:
+        dict: Read-only variables: TVG (dB), mask of samples outside 19.9 and
+              250 m (from mRG.outside, as a column), and range bins from 20
+              to 250 m (see binning.axis).
+    """
+    def compute():
+        logger.info('Computing range geometry (cache: %d hits, %d misses)'
+                    % (cache.geometry.hits, cache.geometry.misses))
+        return {'tvg'    : background.tvg(r, alpha),
+                'outside': mRG.outside(np.empty((len(r), 1)), r, 19.9, 250),
+                'rbins'  : binning.axis(r, np.array([20, 250]))}
+    
+    return cache.geometry.get(cache.key(r, alpha), compute)
+
+def integrate(Sv, r, nm, nmintervals, sbline, sbliner, layers, rmin=20,
+              rmax=250):
+    """
+    Integrate Sv in depth layers, every distance interval, in one pass. Sv is
+    cumulated only once along range, and the sum of Sv in every layer, at 
+    every ping, is the difference of cumulated Sv at the layer edges. Sums 
+    are then added up within distance intervals.
+    
+    Layers are cut by the integration limits and by the seabed. Samples 
+    where Sv is NaN are not integrated, and samples straddling layer edges
+    or distance intervals are weighted by the fraction within them, as in
+    resampling (see rs.twod and binning.Bins).
+    
+    Args:
+        Sv          (float): 2D array with Sv data (dB), range x pings.
+        r           (float): 1D array with range (m).
+        nm          (float): 1D array with distance (nmi).
+        nmintervals (float): 1D array with distance intervals edges (nmi).
+        sbline      (float): 1D array with seabed range at every ping (m), 
+                             NaN if not detected.
+        sbliner     (float): 1D array with seabed range at every interval 
+                             (m), NaN if not detected.
+        layers      (list ): Layers as (top, bottom) range pairs (m), or as
+                             (top, bottom, 'seabed') with range relative to 
+                             the seabed, negative above it. E.g. (-20, 0,
+                             'seabed') is the layer 20 m above the seabed.
+        rmin        (float): Minimum range to integrate (m).
+        rmax        (float): Maximum range to integrate (m).
+    
+    Returns:
+        float: 2D array with Sv mean (dB), layers x intervals.
+        float: 2D array with thickness integrated (m), layers x intervals.
+        float: 2D array with Sa (dB re 1 m2 m-2), layers x intervals.
+        float: 2D array with NASC (m2 nmi-2), layers x intervals.
+    """
+    
+    # get layer edges, relative to the surface or to the seabed
+    seabed = np.array([len(l)>2 and l[2]=='seabed' for l in layers])[:, None]
+    top    = np.array([l[0] for l in layers], dtype=float)[:, None]
+    bottom = np.array([l[1] for l in layers], dtype=float)[:, None]
+    
+    # cumulate linear Sv and valid samples along range, in double precision
+    valid = ~np.isnan(Sv)
+    sv    = tf.lin(Sv)
+    sv[~valid] = 0
+    svcum = np.zeros((len(r)+1, Sv.shape[1]))
+    ncum  = np.zeros((len(r)+1, Sv.shape[1]), dtype=np.int32)
+    np.cumsum(sv   , axis=0, dtype=np.float64, out=svcum[1:])
+    np.cumsum(valid, axis=0, dtype=np.int32  , out=ncum [1:])
+    del sv, valid
+    
+    # sum Sv and samples within layers at every ping, from cumulated values
+    # at the layer edges, interpolated within samples straddling them
+    floor = np.fmin(rmax, sbline)
+    ref   = np.where(seabed, sbline, 0)
+    j     = np.arange(Sv.shape[1])
+    svsum, nsum = 0, 0
+    for edge, sign in [(bottom, 1), (top, -1)]:
+        edge  = np.clip(ref + edge, rmin, floor)
+        i     = np.searchsorted(r, edge)
+        frac  = np.zeros(edge.shape)
+        a     = (i>0) & (i<len(r))
+        frac[a] = (r[i[a]] - edge[a])/(r[i[a]] - r[i[a]-1])
+        svsum = svsum + sign*(svcum[i, j] - frac*(svcum[i, j] -
+                                                   svcum[np.maximum(i-1, 0), j]))
+        nsum  = nsum  + sign*(ncum [i, j] - frac*(ncum [i, j] -
+                                                   ncum [np.maximum(i-1, 0), j]))
+    
+    # add up sums within intervals, for all layers at once
+    nl    = len(layers)
+    bins  = binning.Bins(np.arange(nl), nm, np.arange(nl+1), nmintervals,
+                         weights=True)
+    svsum = bins.sum(svsum)
+    nsum  = bins.sum(nsum )
+    with np.errstate(divide='ignore', invalid='ignore'):
+        sv = svsum/nsum
+    
+    # get thickness of layers at every interval
+    floor     = np.fmin(rmax, sbliner)
+    ref       = np.where(seabed, sbliner, 0)
+    thickness = (np.clip(ref + bottom, rmin, floor) - 
+                 np.clip(ref + top   , rmin, floor))
+    
+    # get Sv, Sa and NASC
+    Sv   = tf.log(sv)
+    Sa   = tf.log(sv*thickness)
+    NASC = 4*np.pi*1852**2*sv*thickness
+    
+    return Sv, thickness, Sa, NASC
 
 def next_jdx(pro):
     """
@@ -280,4 +490,272 @@ def next_jdx(pro):
     jdx1  = pro['nm120intervals'][-1]
     jdx   = [jdx0, jdx1] 
     
-    return jdx 
\ No newline at end of file
+    return jdx
+
+class CcamlrStream(object):
+    """
+    Stateful CCAMLR processing of RAW data coming in sequence, file by file.
+    
+    Only complete 1-nmi intervals whose results can not change with further
+    pings are delivered. Between calls, only the minimal state is carried in
+    a read.RawPile: the pings of the next interval not delivered yet, plus a
+    halo of pings to their left. The halo covers the kernels of the impulse 
+    noise filters (mIN.wang), seabed erosion and dilations (mSB.ariza) and 
+    swarm smoothing (3x3 convolution), and starts at a multiple of the
+    background noise window (gBN.derobertis) counted from the transect start,
+    so that noise blocks are the same as if the whole transect was processed
+    at once. Swarms still open at the right edge, and swarms crossing the 
+    start of the halo, are carried entirely too, since their detection could
+    change with pings to come. Each call then processes only the new pings 
+    plus this carried state, and results are the same as processing the 
+    whole transect at once with ccamlr (unless background noise estimates
+    are reused, see noise).
+    
+    Args:
+        halo     (int  ): Number of pings needed on each side of a ping to 
+                          compute its filters as in a continuous transect.
+        block    (int  ): Number of pings in background noise windows.
+        link     (tuple): Vertical (m) and horizontal (m) distances at which
+                          swarms are linked.
+        output   (str  ): Output profile of processed data (see ccamlr).
+        layers   (list ): Depth layers to integrate (see integrate).
+        kernels  (str  ): Filter kernels, "echopy" or "rapidkrill" (see 
+                          ccamlr).
+        noise    (Noise): Background noise model to reuse noise estimates 
+                          (see background.Noise). None to estimate noise 
+                          every time.
+        tracking (bool ): True to detect the seabed following it along 
+                          pings (see seabed.track).
+    """
+    
+    def __init__(self, halo=40, block=20, link=(3, 15), output='full',
+                 layers=None, kernels='echopy', noise=None, tracking=False):
+        self.halo     = halo
+        self.block    = block
+        self.link     = link
+        self.output   = output
+        self.layers   = layers
+        self.kernels  = kernels
+        self.noise    = noise
+        self.tracking = tracking
+        self.pile     = read.RawPile()
+        self.reset()
+    
+    @property
+    def transect(self):
+        return self.pile.transect
+    
+    def reset(self):
+        """
+        Reset the stream to start a new transect.
+        """
+        self.pile.reset()
+        self.nmstart  = 0   # start of the next interval to deliver (nmi)
+        self.ping     = 0   # ping number of the window start in the transect
+        self.rawfiles = []  # RAW files piled up last
+    
+    def drop(self):
+        """
+        Drop pings not processed yet, keeping the carried state.
+        """
+        self.pile.drop()
+    
+    def append(self, raw):
+        """
+        Pile up RAW data to be processed.
+        
+        Args:
+            raw (dict): RAW data from read.raw.
+        """
+        if (self.pile.transect is not None) & (len(self.pile)>0):
+            if raw['transect']!=self.pile.transect:
+                self.pile.reset()
+                self.nmstart = 0
+                self.ping    = 0
+        self.pile.append(raw)
+        self.rawfiles = raw['rawfiles']
+
+    def state(self):
+        """
+        Get the state of the stream, to restore it later (see restore).
+
+        Returns:
+            dict: State of the stream, with arrays, numbers and strings only,
+                  including the noise estimated last, if noise is reused
+                  (see background.Noise).
+        """
+        state = {'nmstart' : self.nmstart, 'ping': self.ping,
+                 'rawfiles': self.rawfiles, 'pile': self.pile.state()}
+        if self.noise is not None:
+            state['noise'] = self.noise.state()
+        return state
+
+    def restore(self, state):
+        """
+        Restore the stream from a state (see state), to go on processing
+        the same transect.
+
+        Args:
+            state (dict): State of the stream.
+        """
+        self.pile.restore(state['pile'])
+        self.nmstart  = state['nmstart']
+        self.ping     = state['ping'   ]
+        self.rawfiles = list(state.get('rawfiles', []))
+        if self.noise is not None:
+            self.noise.restore(state.get('noise'))
+
+    def process(self, detach=False):
+        """
+        Process RAW data piled up, and deliver the new intervals that are
+        complete.
+        
+        Args:
+            detach (bool): True to copy processed variables that are views of
+                           the pile, so that they remain unchanged while more
+                           RAW data is piled up (e.g. if they are used in 
+                           another thread).
+        
+        Returns:
+            dict: Processed data as from ccamlr, restricted to the new 
+                  intervals. None if there is no new complete interval yet.
+        """
+        raw = self.pile.window()
+        nm  = raw['nm']
+        
+        # return if no complete interval can be delivered yet
+        if (len(nm)<=self.halo) or not (nm[-self.halo-1]>=self.nmstart+1):
+            return None
+        
+        # process all the pings in the window, keeping swarms at least
+        output = 'png' if self.output=='minimal' else self.output
+        pro    = ccamlr(raw, jdx=[0, self.nmstart], output=output,
+                        layers=self.layers, kernels=self.kernels,
+                        noise=self.noise, tracking=self.tracking)
+        
+        # deliver up to the last ping with full halo on its right, or up to
+        # the start of swarms open at the right edge
+        swarms = self._swarms(pro)
+        edge   = len(nm) - self.halo - 1
+        edge   = min([edge] + [swarm.start for swarm in swarms
+                               if swarm.stop > edge])
+        edges  = pro['nm120intervals']
+        k      = np.searchsorted(edges, nm[edge], side='right')
+        if k<2:
+            return None
+        pro = self._trim(pro, k)
+        if self.output=='minimal':
+            pro.pop('Sv120'  )
+            pro.pop('Sv120sw')
+        
+        # carry the next interval, its halo, and any swarm across the halo,
+        # starting at a background noise window
+        self.nmstart = edges[k-1]
+        start = np.searchsorted(nm, self.nmstart) - self.halo
+        start = min([start] + [swarm.start - self.halo for swarm in swarms
+                               if swarm.stop > start])
+        start = max(start, 0)
+        start = (self.ping + start)//self.block*self.block - self.ping
+        self.pile.carry([start - len(nm), 0])
+        self.ping += start
+        
+        # copy variables that are views of the pile
+        if detach:
+            for k, v in pro.items():
+                if isinstance(v, np.ndarray):
+                    if any(np.may_share_memory(v, b)
+                           for b in self.pile.buffers.values()):
+                        pro[k] = v.copy()
+        
+        return pro
+    
+    def flush(self, detach=False):
+        """
+        Process RAW data piled up as the end of the transect, with no halo
+        on the right, and deliver every interval left that is complete. Call
+        it before resetting the stream (see reset), or when there is no more
+        RAW data, so that intervals held back are not lost.
+        
+        Args:
+            detach (bool): True to copy processed variables that are views of
+                           the pile (see process).
+        
+        Returns:
+            dict: Processed data as from ccamlr, restricted to the intervals
+                  left. None if there is no complete interval left.
+        """
+        if (len(self.pile)==0) or not (self.transect>0):
+            return None
+        raw = self.pile.window()
+        nm  = raw['nm']
+        if (len(nm)==0) or not (nm[-1]>=self.nmstart+1):
+            return None
+        
+        # only carried pings may be left, from the RAW files piled up last
+        if not raw['rawfiles']:
+            raw['rawfiles'] = self.rawfiles
+        
+        # process all the pings in the window, delivering every interval
+        output = 'png' if self.output=='minimal' else self.output
+        pro    = ccamlr(raw, jdx=[0, self.nmstart], output=output,
+                        layers=self.layers, kernels=self.kernels,
+                        noise=self.noise, tracking=self.tracking)
+        edges  = pro['nm120intervals']
+        if len(edges)<2:
+            return None
+        pro = self._trim(pro, len(edges))
+        if self.output=='minimal':
+            pro.pop('Sv120'  )
+            pro.pop('Sv120sw')
+        self.nmstart = edges[-1]
+        
+        # copy variables that are views of the pile
+        if detach:
+            for k, v in pro.items():
+                if isinstance(v, np.ndarray):
+                    if any(np.may_share_memory(v, b)
+                           for b in self.pile.buffers.values()):
+                        pro[k] = v.copy()
+        
+        return pro
+    
+    def _swarms(self, pro):
+        """
+        Get the ping slices of swarms, linking those closer than the link 
+        distances.
+        """
+        sw = pro['Sv120sw']
+        with np.errstate(invalid='ignore'):
+            sw = np.isfinite(sw) & (sw>-999)
+        
+        # get linking distances in samples and pings
+        dr = np.nanmedian(np.diff(pro['r120']))
+        dp = np.diff(pro['km120']*1000)
+        dp = np.nanmedian(dp[dp>0]) if (dp>0).any() else np.nan
+        ni = int(np.ceil(self.link[0]/dr))
+        if np.isfinite(dp):
+            nj = int(np.ceil(self.link[1]/dp))
+        else:
+            nj = self.halo
+        
+        # label linked swarms and get their ping slices
+        sw = ndimage.binary_dilation(sw, np.ones((2*ni+1, 2*nj+1)))
+        labels, n = ndimage.label(sw, np.ones((3, 3)))
+        return [s[1] for s in ndimage.find_objects(labels) if s is not None]
+    
+    def _trim(self, pro, k):
+        """
+        Restrict processed data to the first k-1 intervals.
+        """
+        pro = pro.copy()
+        for key in ['nm120r', 't120r', 'lon120r', 'lat120r']:
+            pro[key] = pro[key][:k-1]
+        for key in ['Sv120swr', 'pc120swr', 'Sa120swr', 'NASC120swr',
+                    'sbliner', 'Sv120swl', 'thick120l', 'Sa120swl',
+                    'NASC120swl']:
+            if key not in pro:
+                continue
+            pro[key] = pro[key][:, :k-1]
+        for key in ['nm120intervals', 't120intervals']:
+            pro[key] = pro[key][:k]
+        return pro
@@ -7,46 +7,142 @@ Created on Wed Apr 10 15:00:04 2019
 """
 
 # import modules
-import os, logging, logging.config, sys
+import os, logging, logging.config, sys, functools
 import numpy as np
 import pandas as pd
-from geopy.distance import distance
-from scipy.interpolate import interp1d
-from scipy.signal import savgol_filter
 from echolab2.instruments import EK60
 from echopy import read_calibration as readCAL
+from rapidkrill import nav, cache, metrics
 
 # log events while running
 logger = logging.getLogger()
 logging.config.fileConfig(os.path.join(os.path.dirname(__file__),'logging.conf'))
 
+# sample interval (s) and sound speed (m s-1) of the last file read, for
+# every frequency channel (see readchannel)
+sampling = {}
+
+class RawData(dict):
+    """
+    Dictionary of RAW data variables that can hold lazy variables. Lazy 
+    variables are not computed until first accessed, and then are kept in the
+    dictionary as any other variable. Variables computed together by the same
+    loader (e.g. theta and phi) are kept together too.
+    
+    Args:
+        lazy (dict): Lazy variables, mapping variable names to pairs of
+                     (loader, field), where loader is a callable returning a
+                     dictionary and field the name of the variable in it.
+    """
+    
+    def __init__(self, *args, **kwargs):
+        self.lazy = dict(kwargs.pop('lazy', {}))
+        dict.__init__(self, *args, **kwargs)
+    
+    def __missing__(self, key):
+        if key not in self.lazy:
+            raise KeyError(key)
+        loader = self.lazy[key][0]
+        values = loader()
+        for k, (l, field) in list(self.lazy.items()):
+            if l is loader:
+                self[k] = values[field]
+                del self.lazy[k]
+        return self[key]
+    
+    def __contains__(self, key):
+        return dict.__contains__(self, key) | (key in self.lazy)
+    
+    def get(self, key, default=None):
+        return self[key] if key in self else default
+    
+    def copy(self):
+        return RawData(self, lazy=self.lazy)
+
 def raw(rawfile, channel=120, transitspeed=3, calfile=None,
-        soundspeed=None, absorption=None, preraw=None):
+        soundspeed=None, absorption=None, preraw=None, maxrange=None,
+        allchannels=False, float32=False):
+    """
+    Read EK60 raw data. Decodes the RAW file (see decode), and stitches it to
+    the preceeding RAW data (see stitch).
+    
+    By default, only the requested frequency channel and the NMEA datagrams
+    are decoded, and samples beyond the maximum range are not read at all.
+    
+    The maximum range is not set by default: processing (see process.ccamlr)
+    only integrates down to 250 m, but it estimates background noise in the
+    deepest samples, and searches the seabed down to 1000 m, so that results
+    change if samples are not read down to the range recorded. Set it to
+    the range recorded in the survey, or to a range where there is only
+    noise, to read faster and with less memory.
+    
+    Args:
+        rawfile      (str)       : Path to the RAW file.
+        channel      (int)       : Frequency channel to read (kHz).
+        transitspeed (int, float): Minimum speed to consider the platform in 
+                                   transit (knots).
+        calfile      (str)       : Path to the calibration file.
+        soundspeed   (int, float): Sound speed to correct data (m s-1).
+        absorption   (int, float): Water absorption to correct data (dB m-1).
+        preraw       (dict)      : RAW data from the preceeding file.
+        maxrange     (int, float): Maximum range to decode (m). None to 
+                                   decode all samples (see above).
+        allchannels  (bool)      : True to decode every channel and sample,
+                                   as in older versions (slower).
+        float32      (bool)      : True to get Sv and angles in single 
+                                   precision, to be processed in single 
+                                   precision too (half the memory).
     """
-    Read EK60 raw data.
+    metrics.start('read.raw', os.path.split(rawfile)[-1])
+    decoded = decode(rawfile, channel=channel, calfile=calfile,
+                     soundspeed=soundspeed, absorption=absorption,
+                     maxrange=maxrange, allchannels=allchannels,
+                     float32=float32)
+    raw     = stitch(decoded, transitspeed=transitspeed, preraw=preraw)
+    metrics.end('read.raw')
+    
+    return raw
+
+def decode(rawfile, channel=120, calfile=None, soundspeed=None,
+           absorption=None, maxrange=None, allchannels=False, float32=False):
     """
+    Decode EK60 raw data from a RAW file, on its own. Decoding does not depend
+    on preceeding files, so that several files can be decoded in parallel.
     
-    # -------------------------------------------------------------------------
-    # load rawfile    
-    ek60 = EK60.EK60()
-    ek60.read_raw(rawfile)
+    Args:
+        rawfile      (str)       : Path to the RAW file.
+        channel      (int)       : Frequency channel to read (kHz).
+        calfile      (str)       : Path to the calibration file.
+        soundspeed   (int, float): Sound speed to correct data (m s-1).
+        absorption   (int, float): Water absorption to correct data (dB m-1).
+        maxrange     (int, float): Maximum range to decode (m). None to 
+                                   decode all samples.
+        allchannels  (bool)      : True to decode every channel and sample,
+                                   as in older versions (slower).
+        float32      (bool)      : True to get Sv and angles in single 
+                                   precision.
+    
+    Returns:
+        dict: Decoded data (Sv, angles, time, range, absorption, and GPS and
+              motion NMEA datagrams), to be stitched to preceeding data.
+    """
     
     # -------------------------------------------------------------------------
-    # read frequency channel data
+    # load rawfile    
     logger.info('Reading File '+rawfile.split('/')[-1]+'...')
-    ch = None
-    for i in ek60.channel_id_map:
-        if str(channel)+' kHz' in ek60.channel_id_map[i]:        
-            ch = i
-            break
-    if ch is None:
-        sys.exit(str(channel) + ' kHz channel not found!')    
-    raw = ek60.get_raw_data(channel_number=ch)
+    if allchannels:
+        ek60 = EK60.EK60()
+        ek60.read_raw(rawfile)
+        raw  = ek60.get_raw_data(channel_number=channelnumber(ek60, channel))
+    else:
+        ek60, raw, nsamples = readchannel(rawfile, channel, maxrange,
+                                          soundspeed=soundspeed)
+    metrics.lap('decode')
     
     # -------------------------------------------------------------------------
     # apply 38 kHz calibration parameters
     if calfile is not None:
-        params = readCAL.ices(calfile, channel)
+        params = calibration(calfile, channel)
     
     # -------------------------------------------------------------------------
     # correct data for speed of sound and absorption
@@ -59,13 +155,63 @@ def raw(rawfile, channel=120, transitspeed=3, calfile=None,
         params.absorption_coefficient = absorption
     
     # -------------------------------------------------------------------------
-    # get raw data    
-    Sv    = np.transpose(raw.get_Sv(calibration = params).data)
-    theta = np.transpose(raw.angles_alongship_e)
-    phi   = np.transpose(raw.angles_athwartship_e)
-    t     = raw.get_Sv(calibration = params).ping_time
-    r     = raw.get_Sv(calibration = params).range
+    # get raw data, computing calibration and TVG only once
+    Sv    = raw.get_Sv(calibration = params)
+    t     = Sv.ping_time
+    r     = Sv.range
+    Sv    = np.transpose(Sv.data)
     alpha = raw.absorption_coefficient[0]
+    dtype = np.float32 if float32 else np.float64
+    Sv    = Sv.astype(dtype, copy=False)
+    metrics.lap('Sv')
+    
+    # -------------------------------------------------------------------------
+    # get angles, or a loader to decode them from file when first accessed
+    if allchannels:
+        angles_ = {'theta': np.transpose(raw.angles_alongship_e  ),
+                   'phi'  : np.transpose(raw.angles_athwartship_e)}
+        angles_ = {k: v.astype(dtype, copy=False) for k, v in angles_.items()}
+    else:
+        angles_ = functools.partial(angles, rawfile, channel=channel,
+                                    maxsamples=nsamples, float32=float32)
+    
+    # -------------------------------------------------------------------------
+    # get GPS and motion datagrams
+    gps = ek60.nmea_data.get_datagrams(['GGA', 'GLL', 'RMC'],
+                                       return_fields=['longitude','latitude'])
+    shr = ek60.nmea_data.get_datagrams('SHR',
+                                       return_fields=['pitch','roll','heave'])
+    
+    # -------------------------------------------------------------------------
+    # delete objects to free up memory RAM 
+    del ek60, raw
+    metrics.lap('decode')
+    
+    return {'rawfile': rawfile, 'Sv'    : Sv , 'angles': angles_,
+            't'      : t      , 'r'     : r  , 'alpha' : alpha  ,
+            'gps'    : gps    , 'shr'   : shr}
+
+def stitch(decoded, transitspeed=3, preraw=None):
+    """
+    Stitch decoded RAW data to the preceeding RAW data. It checks continuity,
+    computes distances and transect numbers, and interpolates navigation and
+    motion data to ping time. Files must be stitched sequentially, in order.
+    
+    Args:
+        decoded      (dict)      : Decoded RAW data, from decode.
+        transitspeed (int, float): Minimum speed to consider the platform in 
+                                   transit (knots).
+        preraw       (dict)      : RAW data from the preceeding file.
+        
+    Returns:
+        RawData: RAW data.
+    """
+    rawfile = decoded['rawfile']
+    Sv      = decoded['Sv'     ]
+    angles_ = decoded['angles' ]
+    t       = decoded['t'      ]
+    r       = decoded['r'      ]
+    alpha   = decoded['alpha'  ]
     
     # -------------------------------------------------------------------------
     # check continuity with preceeding RAW file  
@@ -95,7 +241,9 @@ def raw(rawfile, channel=120, transitspeed=3, calfile=None,
 
     # -------------------------------------------------------------------------
     # get nmea data
-    transect,Tpos,LON,LAT,lon,lat,nm,km,kph,knt = nmea(ek60, t, preraw=preraw)
+    transect,Tpos,LON,LAT,Qpos,lon,lat,nm,km,kph,knt = nmea(decoded['gps'], t,
+                                                            preraw=preraw)
+    metrics.lap('nmea')
     if preraw is not None:
         if transect!=preraw['transect']:
             continuous = False
@@ -131,11 +279,8 @@ def raw(rawfile, channel=120, transitspeed=3, calfile=None,
                 km -= np.nanmin(km)
                 nm -= np.nanmin(nm)
     
-    Tmot,PITCH,ROLL,HEAVE,pitch,roll,heave,pitchmax,rollmax,heavemax =motion(ek60, t, preraw=preraw)              
-    
-    # -------------------------------------------------------------------------
-    # delete objects to free up memory RAM 
-    del ek60, raw  
+    Tmot,PITCH,ROLL,HEAVE,pitch,roll,heave,pitchmax,rollmax,heavemax =motion(decoded['shr'], t, preraw=preraw)              
+    metrics.lap('motion')
     
     # -------------------------------------------------------------------------
     # return RAW data  
@@ -143,8 +288,6 @@ def raw(rawfile, channel=120, transitspeed=3, calfile=None,
            'continuous': continuous                  ,
            'transect'  : transect                    ,
            'Sv'        : Sv                          ,
-           'theta'     : theta                       ,
-           'phi'       : phi                         ,
            'alpha'     : alpha                       ,
            'r'         : r                           ,
            't'         : t                           ,       
@@ -163,29 +306,277 @@ def raw(rawfile, channel=120, transitspeed=3, calfile=None,
            'Tpos'      : Tpos                        ,
            'LON'       : LON                         ,
            'LAT'       : LAT                         ,
+           'Qpos'      : Qpos                        ,
            'Tmot'      : Tmot                        ,
            'PITCH'     : PITCH                       ,
            'ROLL'      : ROLL                        ,
            'HEAVE'     : HEAVE                       }
+    values, lazy = lazyangles([(angles_, None)])
+    raw.update(values)
     
-    return raw
+    return RawData(raw, lazy=lazy)
+
+def angles(rawfile, channel=120, maxsamples=None, float32=False):
+    """
+    Decode split-beam angles from a RAW file.
+    
+    Args:
+        rawfile    (str ): Path to the RAW file.
+        channel    (int ): Frequency channel to read (kHz).
+        maxsamples (int ): Number of samples to read. None to read all.
+        float32    (bool): True to get angles in single precision.
+        
+    Returns:
+        dict: Alongship (theta) and athwartship (phi) angles (deg).
+    """
+    ek60 = EK60.EK60()
+    ek60.read_raw(rawfile, frequencies=[channel*1000.], power=False,
+                  angles=True, max_sample_count=maxsamples)
+    raw  = ek60.get_raw_data(channel_number=channelnumber(ek60, channel))
+    dtype = np.float32 if float32 else np.float64
+    
+    return {'theta': np.transpose(raw.angles_alongship_e  ).astype(dtype),
+            'phi'  : np.transpose(raw.angles_athwartship_e).astype(dtype)}
+
+def angleset(data, theta='theta', phi='phi'):
+    """
+    Get angles from RAW or processed data, without decoding them if they are
+    still lazy.
+    
+    Args:
+        data  (dict): RAW or processed data.
+        theta (str ): Name of the alongship angle variable.
+        phi   (str ): Name of the athwartship angle variable.
+    
+    Returns:
+        dict or callable: Angles, or the loader that decodes them.
+    """
+    lazy = getattr(data, 'lazy', {})
+    if theta in lazy:
+        return lazy[theta][0]
+    return {'theta': data[theta], 'phi': data[phi]}
+
+def stack(parts):
+    """
+    Join angles from several sources along the ping dimension.
+    
+    Args:
+        parts (list): (source, start) pairs, where source is a dictionary with
+                      theta and phi angles or a loader returning it, and start
+                      is the first ping to take from the source.
+    
+    Returns:
+        dict: Alongship (theta) and athwartship (phi) angles (deg).
+    """
+    theta, phi = [], []
+    for source, start in parts:
+        if callable(source):
+            source = source()
+        theta.append(source['theta'][:, start:])
+        phi  .append(source['phi'  ][:, start:])
+    
+    return {'theta': np.concatenate(theta, axis=1),
+            'phi'  : np.concatenate(phi  , axis=1)}
 
-def nmea(ek60, t, preraw=None, maxspeed=25):
+def lazyangles(parts, theta='theta', phi='phi'):
+    """
+    Join angles from several sources, keeping them lazy if any source is lazy.
+    
+    Args:
+        parts (list): (source, start) pairs, as in stack().
+        theta (str ): Name for the alongship angle variable.
+        phi   (str ): Name for the athwartship angle variable.
+        
+    Returns:
+        dict: Angle variables, if all sources were already decoded.
+        dict: Lazy angle variables for RawData, otherwise.
+    """
+    if any(callable(source) for source, start in parts):
+        if (len(parts)==1) & (parts[0][1] is None):
+            loader = parts[0][0]
+        else:
+            loader = functools.partial(stack, parts)
+        return {}, {theta: (loader, 'theta'), phi: (loader, 'phi')}
+    values = stack(parts)
+    return {theta: values['theta'], phi: values['phi']}, {}
+
+def calibration(calfile, channel):
+    """
+    Read calibration parameters from an ICES metadata toml file (see 
+    readCAL.ices). The file is parsed only once while it does not change
+    (see cache.calibration), but a new object is returned every time, so
+    that parameters can be corrected (e.g. sound speed) without changing the 
+    cache.
+    
+    Args:
+        calfile (str): Path to the calibration file.
+        channel (int): Frequency channel (kHz).
+        
+    Returns:
+        object: Calibration parameters.
+    """
+    def parse():
+        params = readCAL.ices(calfile, channel)
+        return {k: v for k, v in vars(params).items() if not k.startswith('__')}
+    
+    st     = os.stat(calfile)
+    key    = cache.key(os.path.abspath(calfile), st.st_mtime_ns, st.st_size,
+                       channel)
+    values = cache.calibration.get(key, parse)
+    return type('params', (object,), dict(values))
+
+def readchannel(rawfile, channel, maxrange=None, soundspeed=None):
+    """
+    Read a frequency channel from a RAW file, without angles, down to a
+    maximum range. The number of samples is worked out from the sample 
+    interval and sound speed of the last file read, and checked against the
+    first ping read, so that the file is read again only if they changed.
+    Otherwise, the file is read only once. They are read from the first ping
+    beforehand only for the first file (see maxsamples).
+    
+    Args:
+        rawfile    (str)       : Path to the RAW file.
+        channel    (int)       : Frequency channel (kHz).
+        maxrange   (int, float): Maximum range (m). None to read all samples.
+        soundspeed (int, float): Sound speed (m s-1). If None, the sound 
+                                 speed recorded in the file is used.
+    
+    Returns:
+        EK60  : RAW data, as read with pyEcholab.
+        object: Channel data, as read with pyEcholab.
+        int   : Number of samples read (None if maxrange is None).
+    """
+    if maxrange is None:
+        nsamples = None
+    elif channel in sampling:
+        nsamples = samplecount(maxrange, *sampling[channel],
+                               soundspeed=soundspeed)
+    else:
+        nsamples = maxsamples(rawfile, channel, maxrange, soundspeed=soundspeed)
+    
+    while 1:
+        ek60 = EK60.EK60()
+        ek60.read_raw(rawfile, frequencies=[channel*1000.], angles=False,
+                      max_sample_count=nsamples)
+        raw  = ek60.get_raw_data(channel_number=channelnumber(ek60, channel))
+        if maxrange is None:
+            return ek60, raw, None
+        
+        # read again if sampling changed since the last file read
+        sampling[channel] = (raw.sample_interval[0], raw.sound_velocity[0])
+        n = samplecount(maxrange, *sampling[channel], soundspeed=soundspeed)
+        if n==nsamples:
+            return ek60, raw, nsamples
+        logger.info('Sampling changed, reading %d samples' % n)
+        nsamples = n
+
+def maxsamples(rawfile, channel, maxrange, soundspeed=None):
+    """
+    Get the number of samples needed to read a RAW file down to a maximum 
+    range, using the sample interval and sound speed of its first ping.
+    
+    Args:
+        rawfile    (str)       : Path to the RAW file.
+        channel    (int)       : Frequency channel (kHz).
+        maxrange   (int, float): Maximum range (m).
+        soundspeed (int, float): Sound speed (m s-1). If None, the sound 
+                                 speed recorded in the file is used.
+        
+    Returns:
+        int: Number of samples to read (None if maxrange is None).
+    """
+    
+    if maxrange is None:
+        return None
+    
+    # read the first ping of the channel only
+    ek60 = EK60.EK60()
+    ek60.read_raw(rawfile, frequencies=[channel*1000.], end_ping=1)
+    raw  = ek60.get_raw_data(channel_number=channelnumber(ek60, channel))
+    
+    sampling[channel] = (raw.sample_interval[0], raw.sound_velocity[0])
+    
+    return samplecount(maxrange, *sampling[channel], soundspeed=soundspeed)
+
+def samplecount(maxrange, interval, soundvelocity, soundspeed=None):
+    """
+    Get the number of samples down to a maximum range.
+    
+    Args:
+        maxrange      (int, float): Maximum range (m).
+        interval      (float)     : Sample interval (s).
+        soundvelocity (float)     : Sound speed recorded (m s-1).
+        soundspeed    (int, float): Sound speed to correct data (m s-1). If
+                                    None, the sound speed recorded is used.
+    
+    Returns:
+        int: Number of samples.
+    """
+    
+    # sample thickness is half the distance sound travels in a sample interval
+    if soundspeed is None:
+        soundspeed = soundvelocity
+    thickness = soundspeed*interval/2
+    
+    return int(np.ceil(maxrange/thickness)) + 1
+
+def channelnumber(ek60, channel):
+    """
+    Get the number of a frequency channel in RAW data read with pyEcholab,
+    exiting if the channel is not there.
+    
+    Args:
+        ek60    (EK60): RAW data, as read with pyEcholab.
+        channel (int ): Frequency channel (kHz).
+        
+    Returns:
+        int: Channel number.
+    """
+    for i in ek60.channel_id_map:
+        if str(channel)+' kHz' in ek60.channel_id_map[i]:
+            return i
+    sys.exit(str(channel) + ' kHz channel not found!')
+
+def tail(raw):
+    """
+    Get the tail of RAW data needed to stitch the next RAW file (see stitch),
+    so that the rest can be freed up or does not need to be saved.
+    
+    Args:
+        raw (dict): RAW data, as from stitch.
+    
+    Returns:
+        dict: Last ping, range, and last GPS and motion datagrams.
+    """
+    tail = {'transect': raw['transect'], 'r': raw['r']}
+    for k in ['t', 'lon', 'lat', 'nm', 'km']:
+        tail[k] = raw[k][-1:]
+    for k, n in [('Tpos', 7), ('LON', 7), ('LAT', 7), ('Tmot', 14),
+                 ('PITCH', 14), ('ROLL', 14), ('HEAVE', 14)]:
+        tail[k] = None if raw[k] is None else raw[k][-n:]
+    
+    return tail
+
+def nmea(GPS, t, preraw=None, maxspeed=25):
     """
     Reads NMEA time, longitude, and latitude, and use these variables to
     compute cumulated distance and speed.
     
     Args:
-        ek60  (object): PyechoLab's object containing EK60 raw data
+        GPS     (dict): PyEcholab's GGA, GLL and RMC NMEA datagrams, with
+                        time, longitude and latitude fields.
         t (datetime64): 1D array with ping time.
-        maxspeed (int): Maximum speed allowed in knots. If above, there is 
-                        probably an error in longitude and latitude positions
-                        and data shouldn't be trusted. An error will be raised.
+        maxspeed (int): Maximum speed allowed in knots. GPS fixes reached 
+                        and left above this speed are rejected and 
+                        interpolated (see nav.clean). If still above after
+                        cleaning, data shouldn't be trusted and an error will
+                        be raised.
         
     Returns:
         datetime64: 1D array with NMEA time
         float     : 1D array with NMEA longitude
         float     : 1D array with NMEA latitude
+        bool      : 1D array with NMEA quality mask (False if interpolated)
         float     : 1D array with ping-interpolated longitude
         float     : 1D array with ping-interpolated latitude
         float     : 1D array with ping-interpolated distance (nautical miles)
@@ -194,10 +585,6 @@ def nmea(ek60, t, preraw=None, maxspeed=25):
         float     : 1D array with ping interpolated speed (knots) 
     """
     
-    # get GPS datagrams
-    GPS = ek60.nmea_data.get_datagrams(['GGA', 'GLL', 'RMC'],
-                                      return_fields=['longitude','latitude'])
-    
     # find NMEA datagrams with time, longitude, and latitude
     T, LON, LAT = None, None, None
     for k,v in GPS.items():
@@ -228,31 +615,21 @@ def nmea(ek60, t, preraw=None, maxspeed=25):
                     transect   = abs(preraw['transect']) +1
                     continuous = False
             
-            # filter LON/LAT to smooth out anomalies
-            for i in range(3):        
-                LAT = savgol_filter(LAT, 51, 3)
-                LON = savgol_filter(LON, 51, 3)
-                # TODO: so far, smoothing is applied whether or not the data
-                #       needs to smoothed. Need to find a robust way for
-                #       detecting noisy data, and apply the smoothing after
-                #       warning the user.
+            # reject anomalous positions, interpolating and smoothing over them
+            LON, LAT, Q = nav.clean(T, LON, LAT, maxspeed=maxspeed)
+            if (~Q).any():
+                logger.warning('%d anomalous GPS fixes interpolated'
+                               % np.sum(~Q))
             
             # calculate distance in kilometres and nautical miles
-            KM = np.zeros(len(LON))*np.nan
-            NM = np.zeros(len(LON))*np.nan
-            for i in range(len(LON)-1):
-                if np.isnan(LAT[i]) | np.isnan(LON[i]) | np.isnan(LAT[i+1]) | np.isnan(LON[i+1]):
-                    KM[i+1] = np.nan
-                    NM[i+1] = np.nan
-                else:
-                    KM[i+1] = distance((LAT[i], LON[i]), (LAT[i+1], LON[i+1])).km
-                    NM[i+1] = distance((LAT[i], LON[i]), (LAT[i+1], LON[i+1])).nm
+            KM = np.r_[np.nan, nav.distance(LAT[:-1], LON[:-1], LAT[1:], LON[1:])]
+            NM = KM/1.852
             
             # calculate speed in kilometers per hour and knots
             KPH = KM[1:]/(np.float64(np.diff(T))/1000)*3600
             KNT = NM[1:]/(np.float64(np.diff(T))/1000)*3600
             
-            if max(KNT)>maxspeed:
+            if np.nanmax(KNT)>maxspeed:
                 raise Exception(str('Incoherent maximum speed (>%s knts). NMEA'
                                     +' data shouldn\'t be trusted.')% maxspeed)
             
@@ -261,9 +638,8 @@ def nmea(ek60, t, preraw=None, maxspeed=25):
             NM  = np.nancumsum(NM)
             
             # convert time arrays to timestamp floats
-            epoch = np.datetime64('1970-01-01T00:00:00')
-            Tf = np.float64(T-epoch)
-            tf = np.float64(t-epoch)
+            Tf = nav.timestamp(T)
+            tf = nav.timestamp(t)
             
             # match array lengths (screwed up due to cumsum & diff operations)
             KM  = KM [1:]
@@ -272,34 +648,23 @@ def nmea(ek60, t, preraw=None, maxspeed=25):
             KNT = KNT[ :] 
             LON = LON[1:]
             LAT = LAT[1:]
+            Q   = Q  [1:]
             T   = T  [1:]
             Tf  = Tf [1:]            
             
-            # get time-position, time-distance, & time-speed interpolated functions
-            fLON = interp1d(Tf, LON, bounds_error=False, fill_value='extrapolate')
-            fLAT = interp1d(Tf, LAT, bounds_error=False, fill_value='extrapolate')
-            fNM  = interp1d(Tf, NM , bounds_error=False, fill_value='extrapolate')
-            fKM  = interp1d(Tf, KM , bounds_error=False, fill_value='extrapolate')
-            fKPH = interp1d(Tf, KPH, bounds_error=False, fill_value='extrapolate')
-            fKNT = interp1d(Tf, KNT, bounds_error=False, fill_value='extrapolate')
-            
             # get interpolated position, distance and speed for pingtime
-            lon = fLON(tf)
-            lat = fLAT(tf)
-            nm  = fNM (tf)
-            km  = fKM (tf)
-            kph = fKPH(tf)
-            knt = fKNT(tf)       
+            lon, lat, nm, km, kph, knt = nav.interp(tf, Tf,
+                                                    [LON, LAT, NM, KM, KPH, KNT],
+                                                    bounds='extrapolate')
             
             # Cumulated distance should continue the distance array from
             # the preceeding raw file, if there is continuity
             if continuous:
                 
                 # measure file gap distances
-                kmgap = distance((preraw['lat'][-1], preraw['lon'][-1]),
-                                 (lat[0]           , lon[0]           )).km
-                nmgap = distance((preraw['lat'][-1], preraw['lon'][-1]),
-                                 (lat[0]           , lon[0]           )).nm
+                kmgap = nav.distance(preraw['lat'][-1], preraw['lon'][-1],
+                                     lat[0]           , lon[0]           )
+                nmgap = kmgap/1.852
                 
                 # reset current distances to zero and...
                 km -= np.nanmin(km)
@@ -322,7 +687,7 @@ def nmea(ek60, t, preraw=None, maxspeed=25):
     if (T is None) | (LON is None) | (LAT is None):
         logger.warn('GPS data not found')
         
-        T, LON, LAT= None, None, None
+        T, LON, LAT, Q = None, None, None, None
         lon = np.zeros_like(t)*np.nan
         lat = np.zeros_like(t)*np.nan
         nm  = np.zeros_like(t)*np.nan
@@ -330,16 +695,18 @@ def nmea(ek60, t, preraw=None, maxspeed=25):
         kph = np.zeros_like(t)*np.nan
         knt = np.zeros_like(t)*np.nan
         
-    return transect, T, LON, LAT, lon, lat, nm, km, kph, knt
+    return transect, T, LON, LAT, Q, lon, lat, nm, km, kph, knt
 
 
-def motion(ek60, t, preraw=None):
+def motion(shr, t, preraw=None):
     """
     Get motion data. Experimental. 
-    """
     
-    # get motion datagram
-    shr= ek60.nmea_data.get_datagrams('SHR', return_fields=['pitch','roll','heave'])
+    Args:
+        shr     (dict): PyEcholab's SHR NMEA datagrams, with time, pitch, roll
+                        and heave fields.
+        t (datetime64): 1D array with ping time.
+    """
     
     # return empty if motion data not found
     if any(v is None for v in shr['SHR'].values()):        
@@ -399,25 +766,12 @@ def motion(ek60, t, preraw=None):
                                             center=False).max()).flatten()
                
         # convert time arrays to timestamp floats
-        epoch = np.datetime64('1970-01-01T00:00:00')
-        Tf    = np.float64(T-epoch)
-        tf    = np.float64(t-epoch)           
-        
-        # get time-motion interpolated functions
-        fPITCH    = interp1d(Tf, PITCH   , bounds_error=False)
-        fROLL     = interp1d(Tf, ROLL    , bounds_error=False)
-        fHEAVE    = interp1d(Tf, HEAVE   , bounds_error=False)
-        fPITCHmax = interp1d(Tf, PITCHmax, bounds_error=False)
-        fROLLmax  = interp1d(Tf, ROLLmax , bounds_error=False)
-        fHEAVEmax = interp1d(Tf, HEAVEmax, bounds_error=False)
+        Tf    = nav.timestamp(T)
+        tf    = nav.timestamp(t)
         
         # get ping-interpolated motion
-        pitch    = fPITCH   (tf)
-        roll     = fROLL    (tf)
-        heave    = fHEAVE   (tf)
-        pitchmax = fPITCHmax(tf)
-        rollmax  = fROLLmax (tf)
-        heavemax = fHEAVEmax(tf)
+        pitch, roll, heave, pitchmax, rollmax, heavemax = nav.interp(
+            tf, Tf, [PITCH, ROLL, HEAVE, PITCHmax, ROLLmax, HEAVEmax])
         
         return T, PITCH, ROLL, HEAVE, pitch, roll, heave, pitchmax, rollmax, heavemax
     
@@ -430,8 +784,6 @@ def join(preraw, raw):
     # join variables
     rawfiles =       preraw['rawfiles']+ raw['rawfiles']
     Sv       = np.c_[preraw['Sv'      ], raw['Sv'      ]]
-    theta    = np.c_[preraw['theta'   ], raw['theta'   ]]
-    phi      = np.c_[preraw['phi'     ], raw['phi'     ]]
     t        = np.r_[preraw['t'       ], raw['t'       ]]
     lon      = np.r_[preraw['lon'     ], raw['lon'     ]]
     lat      = np.r_[preraw['lat'     ], raw['lat'     ]]
@@ -452,13 +804,16 @@ def join(preraw, raw):
     LON      = raw['LON'     ]
     LAT      = raw['LAT'     ]
     
+    # -------------------------------------------------------------------------
+    # join angles, without decoding them if not decoded yet
+    angles_, lazy = lazyangles([(angleset(preraw), None),
+                                (angleset(raw   ), None)])
+    
     # -------------------------------------------------------------------------
     # return RAW data 
     raw = {'rawfiles': rawfiles,
            'transect': transect,
            'Sv'      : Sv      ,
-           'theta'   : theta   ,
-           'phi'     : phi     ,
            'alpha'   : alpha   ,
            'r'       : r       ,
            't'       : t       ,      
@@ -474,5 +829,267 @@ def join(preraw, raw):
            'T'       : T       ,
            'LON'     : LON     ,
            'LAT'     : LAT     }
+    raw.update(angles_)
+    
+    return RawData(raw, lazy=lazy)
+
+class RawPile(object):
+    """
+    Ping-indexed buffer to pile up RAW data from consecutive files. 
+    
+    Memory is preallocated, and new pings are appended in place without 
+    copying the pings already piled up. The pile returns its window of pings 
+    as views (zero-copy), ready to be processed. Once processed, the pings 
+    released are dropped from the left of the window, and the tail of pings 
+    to be processed again with the next file (see process.next_jdx) is kept 
+    where it is. When there is no room left at the end of the buffer, the 
+    window is moved back to the start of the buffer, or to a new buffer twice
+    as large, so that the cost of piling up remains linear with the number of
+    pings.
+    
+    Args:
+        capacity (int): Initial number of pings allocated. If None, it is 
+                        twice the number of pings in the first RAW data.
+    """
+    
+    # variables piled up along pings: 2D (range x pings), and 1D (pings)
+    variables2d = ['Sv']
+    variables1d = ['t', 'lon', 'lat', 'nm', 'km', 'kph', 'knt',
+                   'pitchmax', 'rollmax', 'heavemax']
+    
+    def __init__(self, capacity=None):
+        self.capacity = capacity
+        self.reset()
+    
+    def __len__(self):
+        return self.end - self.start
+    
+    def reset(self):
+        """
+        Empty the pile, including pings carried from preceeding processing.
+        """
+        self.buffers  = {}
+        self.base     = 0    # ping number at the start of the buffer
+        self.start    = 0    # buffer index at the start of the window
+        self.end      = 0    # buffer index at the end of the window
+        self.carried  = 0    # pings in the window carried from processing
+        self.sources  = []   # angle sources and their first ping number
+        self.rawfiles = []
+        self.transect = None
+        self.metadata = {}
+    
+    def drop(self):
+        """
+        Drop pings not processed yet, keeping those carried from preceeding
+        processing.
+        """
+        self.end     = self.start + self.carried
+        self.sources = [s for s in self.sources
+                        if s[1] < self.base + self.end]
+    
+    def append(self, raw):
+        """
+        Pile up RAW data at the end of the window.
+        
+        Args:
+            raw (dict): RAW data from read.raw.
+        """
+        
+        # drop carried pings if they belong to another transect
+        if (self.carried>0) & (raw['transect']!=self.transect):
+            self.start  += self.carried
+            self.carried = 0
+            self.sources = [s for s in self.sources
+                            if s[1] >= self.base + self.start]
+        
+        # allocate buffers, or make room at the end of the buffers
+        n = len(raw['t'])
+        if not self.buffers:
+            capacity = max(self.capacity or 0, 2*n)
+            self.buffers = {k: np.empty(raw[k].shape[:-1] + (capacity,),
+                                        dtype=raw[k].dtype)
+                            for k in self.variables2d + self.variables1d}
+        elif self.end + n > self.size:
+            self._move(n)
+        
+        # write RAW data in place
+        for k in self.variables2d + self.variables1d:
+            self.buffers[k][..., self.end:self.end+n] = raw[k]
+        self.sources.append((angleset(raw), self.base + self.end))
+        self.end += n
+        
+        # keep the rest of variables from the latest RAW data
+        self.rawfiles = self.rawfiles + raw['rawfiles']
+        self.transect = raw['transect']
+        self.metadata = {'alpha': raw['alpha'], 'r'  : raw['r'  ],
+                         'T'    : raw['Tpos' ], 'LON': raw['LON'],
+                         'LAT'  : raw['LAT'  ]}
+    
+    @property
+    def size(self):
+        return self.buffers[self.variables1d[0]].shape[-1]
+    
+    def _move(self, n):
+        """
+        Move the window to the start of the buffers, or to new buffers twice
+        as large, to make room for n pings more.
+        """
+        live = self.end - self.start
+        if live + n > self.size//2:
+            size    = 2*(live + n)
+            buffers = {k: np.empty(v.shape[:-1] + (size,), dtype=v.dtype)
+                       for k, v in self.buffers.items()}
+        else:
+            buffers = self.buffers
+        for k, v in self.buffers.items():
+            buffers[k][..., :live] = v[..., self.start:self.end]
+        self.buffers = buffers
+        self.base   += self.start
+        self.end    -= self.start
+        self.start   = 0
+    
+    def window(self):
+        """
+        Get the window of pings in the pile, with the carried pings first.
+        
+        Returns:
+            RawData: Piled RAW data, as from read.join, with 1D and 2D 
+                     variables as views of the pile (not copies). "carried"
+                     is the number of pings at the start of the window that
+                     come from preceeding processing.
+        """
+        window = {k: self.buffers[k][..., self.start:self.end]
+                  for k in self.variables2d + self.variables1d}
+        window.update(self.metadata)
+        window.update({'rawfiles': self.rawfiles,
+                       'transect': self.transect,
+                       'carried' : self.carried })
+        
+        # get angles from the sources overlapping the window
+        first = self.base + self.start
+        parts = [(source, max(first - ping, 0) or None)
+                 for source, ping in self.sources
+                 if ping + self._pings(source, ping) > first]
+        angles_, lazy = lazyangles(parts)
+        window.update(angles_)
+        
+        return RawData(window, lazy=lazy)
+    
+    def _pings(self, source, ping):
+        """
+        Number of pings from an angle source, given its first ping number.
+        """
+        i = [s[1] for s in self.sources].index(ping)
+        if i+1 < len(self.sources):
+            return self.sources[i+1][1] - ping
+        return self.base + self.end - ping
     
-    return raw 
\ No newline at end of file
+    def pending(self):
+        """
+        Distance covered by the pings not processed yet (nmi).
+        """
+        nm = self.buffers['nm'][self.start+self.carried:self.end]
+        if nm.size==0:
+            return 0
+        return nm[-1] - nm[0]
+    
+    def carry(self, jdx):
+        """
+        Release the pings already processed, keeping the tail that needs to 
+        be processed again with the next RAW data.
+        
+        Args:
+            jdx (list): 2-elements j index, from process.next_jdx.
+        """
+        if jdx[0]>=0:
+            raise Exception('Preceeding raw data needs appropiate j indexes')
+        self.carried = min(-jdx[0], len(self))
+        self.start   = self.end - self.carried
+        first        = self.base + self.start
+        self.sources = [s for s in self.sources
+                        if s[1] + self._pings(*s) > first]
+        self.rawfiles = []
+    
+    def state(self):
+        """
+        Get the state of the pile: its window of pings, copied, and what 
+        is needed to restore it (see restore). Angles are not decoded, but 
+        referenced by the RAW file to decode them from.
+        
+        Returns:
+            dict: State of the pile, with arrays, numbers and strings only.
+        """
+        state = {k: v[..., self.start:self.end].copy()
+                 for k, v in self.buffers.items()}
+        state.update(self.metadata)
+        state.update({'first'   : self.base + self.start,
+                      'carried' : self.carried          ,
+                      'rawfiles': self.rawfiles         ,
+                      'transect': self.transect         })
+        
+        # angle sources: RAW file, channel and samples to decode them, or
+        # angles themselves if already decoded
+        sources = {'ping': [], 'rawfile': [], 'channel': [], 'maxsamples': [],
+                   'float32': []}
+        for i, (source, ping) in enumerate(self.sources):
+            if callable(source):
+                if getattr(source, 'func', None) is not angles:
+                    raise Exception('Angles can not be saved without decoding')
+                rawfile = source.args[0]
+                channel = source.keywords.get('channel', 120)
+                nmax    = source.keywords.get('maxsamples', None)
+                single  = source.keywords.get('float32', False)
+            else:
+                rawfile, channel, nmax, single = '', 0, None, False
+                sources['theta%d' % i] = source['theta']
+                sources['phi%d'   % i] = source['phi'  ]
+            sources['ping'      ].append(ping)
+            sources['rawfile'   ].append(rawfile)
+            sources['channel'   ].append(channel)
+            sources['maxsamples'].append(-1 if nmax is None else nmax)
+            sources['float32'   ].append(single)
+        state['sources'] = {k: np.array(v) if k in ['ping', 'channel', 
+                                                    'maxsamples', 'float32']
+                            else v for k, v in sources.items()}
+        
+        return state
+    
+    def restore(self, state):
+        """
+        Restore the pile from a state (see state).
+        
+        Args:
+            state (dict): State of the pile.
+        """
+        self.reset()
+        n = len(state['t']) if 't' in state else 0
+        if n>0:
+            capacity     = max(self.capacity or 0, 2*n)
+            self.buffers = {}
+            for k in self.variables2d + self.variables1d:
+                v = state[k]
+                self.buffers[k] = np.empty(v.shape[:-1] + (capacity,),
+                                           dtype=v.dtype)
+                self.buffers[k][..., :n] = v
+        self.base     = state['first']
+        self.end      = n
+        self.carried  = state['carried']
+        self.rawfiles = list(state['rawfiles'])
+        self.transect = state.get('transect')
+        self.metadata = {k: state.get(k) for k in 
+                         ['alpha', 'r', 'T', 'LON', 'LAT']}
+        
+        # angle sources, decoding angles only if accessed
+        sources = state['sources']
+        for i, ping in enumerate(sources['ping']):
+            if sources['rawfile'][i]:
+                nmax   = sources['maxsamples'][i]
+                nmax   = None if nmax<0 else int(nmax)
+                single = bool(sources['float32'][i])
+                source = functools.partial(angles, sources['rawfile'][i],
+                                           channel=int(sources['channel'][i]),
+                                           maxsamples=nmax, float32=single)
+            else:
+                source = {'theta': sources['theta%d' % i],
+                          'phi'  : sources['phi%d'   % i]}
+            self.sources.append((source, int(ping)))
@@ -12,10 +12,16 @@ import os, logging, logging.config, io, sendgrid, base64
 from sendgrid.helpers.mail import Mail, Email, Content, Attachment
 import numpy as np
 import pandas as pd
-import matplotlib.pyplot as plt
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, wait as waitfor
+from concurrent.futures.process import BrokenProcessPool
+import matplotlib
 import matplotlib.dates as mdates
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
 from echopy.cmaps import cmaps
 import toml
+from rapidkrill import metrics, binning, store, codec
 
 # Explicitly register pandas datetime converter for matplotlib
 # It prevents Pandas FutureWarnings to pop up in the console
@@ -27,23 +33,47 @@ logger = logging.getLogger()
 logging.config.fileConfig(os.path.join(os.path.dirname(__file__),
                                        '..','rapidkrill','logging.conf'))
 
-def log(pro, logname, savepng=True):
+# Echogram images: maximum depth (m), and pixels Sv is reduced to before
+# rendering, at least those of every echogram in the 800x800 image
+YMAX   = 270
+PIXELS = (400, 800)
+
+# Background process rendering echogram images, started when first needed,
+# images not saved yet, and figure reused by the background process
+renderer = None
+pending  = []
+figure   = None
+
+def log(pro, logname, savepng=True, decimation='mean', wait=False,
+        savecsv=True):
     """
-    Log processed data (*.csv) and echograms (*.png) in rapidkrill/log/.
+    Log processed data (*.sqlite and *.csv) and echograms (*.png) in
+    rapidkrill/log/. Results are appended to the log store (see store), and
+    to the CSV log file, which can also be exported from the store later.
 
     Args:
-        pro     (dict): processed data output from "process" routine.
-        logname (str ): directory name under which log results will be saved.
-        savepng (bool): True to save echogram images, False to skip it.
+        pro        (dict): processed data output from "process" routine.
+                           Sv120 and Sv120sw are only needed to save
+                           echogram images (see process.OUTPUTS). NASC in
+                           depth layers, if any, is logged in extra columns
+                           (see process.integrate).
+        logname    (str ): directory name under which log results will be
+                           saved.
+        savepng    (bool): True to save echogram images, False to skip it.
+        decimation (str ): How Sv is reduced to the image resolution, "mean"
+                           or "max" (see echogram).
+        wait       (bool): True to wait until echogram images are saved,
+                           False to render them in the background.
+        savecsv    (bool): True to append results to the CSV log file too,
+                           False to only append them to the log store.
     """
 
     # Load processed data variables
     rawfiles    = pro['rawfiles']
+    metrics.start('report.log', rawfiles[-1])
     transect    = pro['transect']
     t120        = pro['t120'    ]
     r120        = pro['r120'    ]
-    Sv120       = pro['Sv120'   ]
-    Sv120sw     = pro['Sv120sw' ]
     t120r       = pro['t120r'   ]
     t120intrvls = pro['t120intervals']
     nm120r      = pro['nm120r'  ]
@@ -66,67 +96,234 @@ def log(pro, logname, savepng=True):
                                               'Latitude' , 'Transect' ,
                                               'Miles'    , 'Seabed'   ,
                                               'NASC'     , '% samples'])
+    
+    # Add NASC in depth layers
+    layers = pro.get('layers120', [])
+    for layer, NASC in zip(layers, pro.get('NASC120swl', [])):
+        results['NASC ' + layername(layer)] = np.round(NASC, 2)
         
     # Create new log subdirectory
     path    = os.path.join(os.path.dirname(__file__), '..', 'log', logname, '')
     if not os.path.exists(path):
         os.makedirs(path)
     
-    # Write results in CSV log file
-    with open(path+logname+'.csv', 'a') as f:
-        results.to_csv(path+logname+'.csv', index=False, mode='a',
-                       header=f.tell()==0) 
+    # Append results to the log store, and to the CSV log file
+    store.append(logstore(logname), results)
+    metrics.lap('store')
+    if savecsv:
+        with open(path+logname+'.csv', 'a') as f:
+            results.to_csv(path+logname+'.csv', index=False, mode='a',
+                           header=f.tell()==0) 
+        metrics.lap('csv')
     
-    # save png image
+    # save png image, rendered in the background
     if savepng:
-    
-        # set figure
-        plt.close()
-        plt.figure(figsize=(8, 8))
-        plt.subplots_adjust(left=0.066, right=1.055, bottom=0.065, top=0.985,
-                            wspace=0, hspace=0.05)
-        plt.rcParams.update({'font.size': 9, 'lines.linewidth': 1})
+        pf = rawfiles[0].split('-')[0]
+        fn = pd.to_datetime(str(t120[0])).strftime(pf + '-D%Y%m%d-T%H%M%S')
+        echogram(path+fn+'.png', pro, how=decimation, wait=wait)
+        metrics.lap('png')
+    metrics.end('report.log')
+           
+def echogram(pngfile, pro, how='mean', wait=False):
+    """
+    Save raw and processed echograms (Sv120 and Sv120sw) in a PNG image,
+    with distance and NASC of every interval overlaid. Sv down to YMAX is
+    reduced to the image resolution first (see decimate), and then rendered
+    by a background process, so that the next RAW file can be processed
+    meanwhile. Failures in the background are logged.
+
+    Args:
+        pngfile (str ): Path to the PNG image.
+        pro     (dict): Processed data output from "process" routine.
+        how     (str ): How Sv is reduced, "mean" or "max" (see decimate).
+        wait    (bool): True to wait until the image is saved.
+    """
+    t120 = pro['t120']
+    r120 = pro['r120']
+    k    = max(1, np.searchsorted(r120, YMAX, side='right'))
+
+    # reduce Sv to the image resolution, and get the extent of pixels
+    Sv120   = decimate(pro['Sv120'  ][:k], PIXELS, how=how)
+    Sv120sw = decimate(pro['Sv120sw'][:k], PIXELS, how=how)
+    t       = mdates.date2num(t120[[0, -1]])
+    extent  = (t[0], t[-1], r120[k-1], r120[0])
+
+    # render it in the background
+    args = (pngfile, Sv120, Sv120sw, extent, pro['transect'], pro['t120r'],
+            pro['nm120r'], pro['NASC120swr'][0,:], pro['t120intervals'])
+    try:
+        future = _renderer().submit(render, *args)
+    except BrokenProcessPool:
+        _restart()
+        future = _renderer().submit(render, *args)
+    future.add_done_callback(_rendered)
+    pending[:] = [f for f in pending if not f.done()] + [future]
+    if wait:
+        future.result()
+
+def decimate(Sv, shape, how='mean'):
+    """
+    Reduce Sv to a maximum number of rows and columns, getting the mean (in
+    the linear domain) or the maximum of the samples in every pixel, and
+    ignoring NaNs. Rows or columns already within the maximum are kept.
+
+    Args:
+        Sv    (float): 2D array with Sv (dB).
+        shape (tuple): Maximum number of rows and columns.
+        how   (str  ): "mean" or "max".
+
+    Returns:
+        float: 2D array with reduced Sv (dB), single precision.
+    """
+    edges = [np.linspace(0, n, min(n, m) + 1) for n, m in zip(Sv.shape, shape)]
+    bins  = binning.Bins(np.arange(Sv.shape[0]), np.arange(Sv.shape[1]),
+                         edges[0], edges[1])
+    if how=='mean':
+        Svr = bins.mean(Sv, log=True)[0]
+    elif how=='max':
+        Svr = bins.max(Sv)
+    else:
+        raise Exception('Decimation "%s" not recognised' % how)
+    return Svr.astype(np.float32)
+
+def render(pngfile, Sv120, Sv120sw, extent, transect, t120r, nm120r,
+           NASC120swr, t120intrvls):
+    """
+    Render raw and processed echograms, already reduced to the image
+    resolution, and save them in a PNG image. Axes, colorbars and images are
+    drawn once and reused for every image.
+
+    Args:
+        pngfile     (str  ): Path to the PNG image.
+        Sv120       (float): 2D array with raw Sv (dB).
+        Sv120sw     (float): 2D array with processed Sv (dB).
+        extent      (tuple): Time (matplotlib dates) and range (m) of the
+                             first and last columns and the last and first
+                             rows, as (left, right, bottom, top).
+        transect    (int  ): Transect number.
+        t120r       (float): 1D array with time of every interval.
+        nm120r      (float): 1D array with distance of every interval (nmi).
+        NASC120swr  (float): 1D array with NASC of every interval.
+        t120intrvls (float): 1D array with time of interval edges.
+    """
+    global figure
+    with matplotlib.rc_context({'font.size': 9, 'lines.linewidth': 1}):
         
-        # plot raw echogram
-        plt.subplot(211).invert_yaxis()
-        im=plt.pcolormesh(t120, r120, Sv120,
-                          vmin=-80, vmax=-50, cmap=cmaps().ek500)
-        plt.colorbar(im).set_label('Sv raw (dB re 1m$^{-1}$)')
-        plt.gca().set_ylim(270,0)
-        plt.gca().set_ylabel('Depth (m)')
-        plt.gca().set_xlim(t120intrvls[0], t120intrvls[-1])
-        plt.gca().set_xticks(t120intrvls[[0,-1]])
-        plt.tick_params(labelright=False, labelbottom=False)
-    
-        # plot processed echogram
-        ax= plt.subplot(212)
-        ax = [ax, ax.twinx()]
-        im=ax[0].pcolormesh(t120, r120, Sv120sw,
-                            vmin=-80,vmax=-50, cmap=cmaps().ek500)
-        plt.colorbar(im).set_label('Sv pro (dB re 1m$^{-1}$)')
-        ax[0].invert_yaxis()
-        ax[0].set_ylim(270,0)
-        ax[0].set_ylabel('Depth (m)')
+        # set figure, with raw and processed echograms, the first time
+        if figure is None:
+            fig = Figure(figsize=(8, 8))
+            FigureCanvasAgg(fig)
+            fig.subplots_adjust(left=0.066, right=1.055, bottom=0.065,
+                                top=0.985, wspace=0, hspace=0.05)
+            ax, im = [], []
+            for i, label in enumerate(['Sv raw', 'Sv pro']):
+                ax.append(fig.add_subplot(2, 1, i+1))
+                im.append(ax[i].imshow(np.zeros((1, 1)), aspect='auto',
+                                       interpolation='nearest', vmin=-80,
+                                       vmax=-50, cmap=cmaps().ek500))
+                fig.colorbar(im[i], ax=ax[i]).set_label(
+                    label + ' (dB re 1m$^{-1}$)')
+                ax[i].set_ylabel('Depth (m)')
+            ax[0].tick_params(labelright=False, labelbottom=False)
+            ax.append(ax[1].twinx())
+            ax[2].set_ylim(0, 1)
+            ax[2].tick_params(labelright=False)
+            figure = {'fig': fig, 'ax': ax, 'im': im}
+        fig, ax, im = figure['fig'], figure['ax'], figure['im']
         
-        # overlay distance/NASC info
+        # update echograms
+        for i, Sv in enumerate([Sv120, Sv120sw]):
+            im[i].set_data(Sv)
+            im[i].set_extent(extent)
+            ax[i].set_ylim(YMAX, 0)
+        
+        # overlay distance/NASC info, replacing that of the last image
+        for artist in list(ax[2].lines) + list(ax[2].texts):
+            artist.remove()
         for t, nm, NASC in zip(t120r, nm120r, NASC120swr):
-            ax[1].plot([t, t], [0, 1], color=[0,.8,0], linewidth=2)
-            ax[1].text(t, .95, ' ' + str(transect) + ': ' + str(round(nm,2)),
+            ax[2].plot([t, t], [0, 1], color=[0,.8,0], linewidth=2)
+            ax[2].text(t, .95, ' ' + str(transect) + ': ' + str(round(nm,2)),
                        fontweight='bold', color=[0,.8,0])
-            ax[1].text(t, .02, ' ' + str(round(NASC,2)),
-                       fontweight='bold', color=[1,0,0])    
-        ax[1].set_ylim(0, 1)
-        ax[1].set_xlim(t120intrvls[0], t120intrvls[-1])
-        ax[1].set_xticks(t120intrvls[[0,-1]])
-        ax[1].tick_params(labelright=False)
-        ax[1].xaxis.set_major_formatter(mdates.DateFormatter('%d%b-%H:%M:%S'))
-           
+            ax[2].text(t, .02, ' ' + str(round(NASC,2)),
+                       fontweight='bold', color=[1,0,0])
+        for a in ax:
+            a.set_xlim(t120intrvls[0], t120intrvls[-1])
+            a.set_xticks(t120intrvls[[0,-1]])
+        ax[2].xaxis.set_major_formatter(mdates.DateFormatter('%d%b-%H:%M:%S'))
+        
         # save figure
-        pf = rawfiles[0].split('-')[0]
-        fn = pd.to_datetime(str(t120[0])).strftime(pf + '-D%Y%m%d-T%H%M%S')
-        plt.savefig(path+fn+'.png' ,figsize=(8, 8), dpi=100)
-        plt.close()
-           
+        fig.savefig(pngfile, dpi=100)
+
+def flush():
+    """
+    Wait until all echogram images rendering in the background are saved.
+    """
+    waitfor(list(pending))
+    pending.clear()
+
+def close():
+    """
+    Wait until all echogram images rendering in the background are saved,
+    and stop the background process. It is started again if needed. Call it
+    when done logging, e.g. before a process running report.log exits, as
+    the background process would keep it waiting otherwise.
+    """
+    global renderer
+    flush()
+    if renderer is not None:
+        renderer.shutdown(wait=True)
+    renderer = None
+
+def _renderer():
+    global renderer
+    if renderer is None:
+        renderer = ProcessPoolExecutor(
+            max_workers=1, mp_context=multiprocessing.get_context('spawn'))
+    return renderer
+
+def _restart():
+    global renderer
+    if renderer is not None:
+        renderer.shutdown(wait=False)
+    renderer = None
+
+def _rendered(future):
+    try:
+        future.result()
+    except Exception:
+        logger.error('Failed to save echogram image', exc_info=True)
+
+def logstore(logname):
+    """
+    Get the path to the results store of a log (see store). If there is
+    none, but there is a CSV log file (e.g. logged by older versions), the
+    store is created with its results first.
+
+    Args:
+        logname (str): directory name under which log results are saved.
+
+    Returns:
+        str: Path to the SQLite database.
+    """
+    path = os.path.join(os.path.dirname(__file__), '..', 'log', logname, '')
+    db   = path + logname + '.sqlite'
+    csv  = path + logname + '.csv'
+    if not os.path.exists(db) and os.path.exists(csv) \
+       and os.path.getsize(csv)>0:
+        logger.info('Loading results from %s' % os.path.basename(csv))
+        store.load(csv, db)
+    return db
+
+def layername(layer):
+    """
+    Get the name of a depth layer (see process.integrate), e.g. "20-50m" or 
+    "seabed-20-0m".
+    """
+    name = '%g-%gm' % tuple(layer[:2])
+    if len(layer)>2 and layer[2]=='seabed':
+        name = 'seabed' + name
+    return name
+
 def console(pro):
     """
     Print summary report in the console while running RapidKrill. Data is
@@ -166,73 +363,115 @@ def console(pro):
     table = table.getvalue()              
     print(table)
     
+def email(sender, recipient, subject, text, data):
+    """
+    Send an email with SendGrid, with data attached as a file. The 
+    SendGrid key is read from config.toml.
+    
+    Args:
+        sender    (str): Sender email address.
+        recipient (str): Recipient email address.
+        subject   (str): Email subject.
+        text      (str): Email text.
+        data      (str): CSV data to attach, or bytes if encoded in
+                         binary (see codec).
+    
+    Returns:
+        bool: True if the email was accepted for delivery.
+    """
+    config     = os.path.join(os.path.dirname(__file__),'config.toml')
+    if not toml.load(config)['sendgrid']['key'].strip():
+        raise Exception('No sendgrid key in config.file. Report not sent.')
+    apikey     = toml.load(config)['sendgrid']['key']
+    sg         = sendgrid.SendGridAPIClient(apikey=apikey)                
+    content    = Content('text/plain', text)
+    attachment = Attachment()
+    binary     = isinstance(data, bytes)
+    encoded    = base64.b64encode(data if binary else str.encode(data))
+    attachment.content=encoded.decode()
+    attachment.type='application/octet-stream' if binary else 'application/csv'
+    attachment.filename='data.rkb' if binary else 'data.csv'
+    mail       = Mail(Email(sender), subject, Email(recipient), content)
+    mail.add_attachment(attachment)               
+    response   = sg.client.mail.send.post(request_body=mail.get())
+    return response.status_code==202
+    
 def land(logname, lastrow, nrows, platform='Unknown',
-         sender='rapidkrill@bas.ac.uk', recipient=None):
+         sender='rapidkrill@bas.ac.uk', recipient=None, deliver=None,
+         encoding=None):
     """
     Sends summary report to land via email.
     
     Args:
-        logname  (str): directory name under which log results are saved.
-        lastrow  (int): Last row of data delivered in past email.
-        nrows    (int): Number of rows to sent in current email.
-        platform (str): Name of platform, the "callsign" for ships.        
+        logname   (str     ): directory name under which log results are 
+                              saved.
+        lastrow   (int     ): Last row of data delivered in past email.
+        nrows     (int     ): Number of rows to sent in current email.
+        platform  (str     ): Name of platform, the "callsign" for ships.
+        sender    (str     ): Sender email address.
+        recipient (str     ): Recipient email address.
+        deliver   (callable): Function delivering the report, with the same
+                              arguments as email, and returning True if 
+                              delivered. None to send it with email.
+        encoding  (Binary  ): Binary encoding of the data, e.g. 
+                              codec.Binary(budget=340) to fit an Iridium
+                              SBD message, in which case only the rows
+                              fitting are sent. None to send CSV text.
+    
+    Returns:
+        int: Last row of data delivered.
     """
   
-    # Get dataframe from CSV log file
-    path = os.path.join(os.path.dirname(__file__),'..','log', logname, '')
-    csv  = path + logname + '.csv'
-    df   = pd.read_csv(csv)
+    # Count rows in the log store
+    metrics.start('report.land', None, logname=logname, lastrow=lastrow)
+    db   = logstore(logname)
+    rows = store.count(db)
+    metrics.lap('read')
     
-    # Return last row sent and exit if dataframe has less than n new rows
-    if len(df[lastrow:])<nrows:
+    # Return last row sent and exit if there are less than n new rows
+    if rows - lastrow<nrows:
+        metrics.end('report.land')
         return lastrow
         
-    # Proceed with new delivery otherwise
+    # Proceed with new delivery otherwise, reading only the rows to send
     else:
-        delivery = df[lastrow : lastrow+nrows]
+        delivery = store.tail(db, lastrow, nrows)
+        metrics.lap('read')
         
-        # Set sender, recipient, and subject
-        sender    = Email(sender)
+        # Check there is a recipient
         if recipient is None:
             raise Exception('No recipient email address')
-        recipient = Email(recipient)
-        subject   = 'RapidKrill report: %s_%s'%(
-                    platform, delivery.Time.tail(1).values[0])
+        
+        # Prepare attachment data, with NASC in depth layers in extra 
+        # columns, encoding as many rows as fit if in binary
+        if encoding is None:
+            data = codec.text(delivery)
+        else:
+            data, n = encoding.encode(delivery)
+            if n<len(delivery):
+                logger.info('%d of %d rows fit in report' % (n, nrows))
+                delivery = delivery[:n]
         
         # Prepare text content
         text = io.StringIO()
-        text.write('Attachment header: %s, %s, %s, %s, %s, %s, %s, %s\n'
-                   % tuple(delivery.columns))
+        text.write('Attachment header: %s\n' % ', '.join(delivery.columns))
+        if encoding is not None:
+            text.write('Attachment encoded in binary (see codec.decode)\n')
         text = text.getvalue()
         
-        # Prepare attachment data
-        data = io.StringIO()
-        for i, row in delivery.iterrows():
-            data.write('%s, %10.5f, %9.5f, %4.0f, %5.1f, %6.1f, %10.2f, %5.1f\n'
-                       % tuple(row))   
-        data = data.getvalue()
-        
-        # Build email and send 
+        # Build email, with the time of the last row in the subject, and send
+        subject   = 'RapidKrill report: %s_%s'%(
+                    platform, delivery.Time.tail(1).values[0])
         logger.info('Sending report to land')
-        config     = os.path.join(os.path.dirname(__file__),'config.toml')
-        if not toml.load(config)['sendgrid']['key'].strip():
-            raise Exception('No sendgrid key in config.file. Report not sent.')
-        apikey     = toml.load(config)['sendgrid']['key']
-        sg         = sendgrid.SendGridAPIClient(apikey=apikey)                
-        content    = Content('text/plain', text)
-        attachment = Attachment()
-        encoded    = base64.b64encode(str.encode(data)).decode()
-        attachment.content=encoded
-        attachment.type='application/csv'
-        attachment.filename='data.csv'
-        mail       = Mail(sender, subject, recipient, content)
-        mail.add_attachment(attachment)               
-        response   = sg.client.mail.send.post(request_body=mail.get())
-        if response.status_code==202:
+        if deliver is None:
+            deliver = email
+        if deliver(sender, recipient, subject, text, data):
             logger.info('Report sent')
         else:
             logger.warning('Sending report failed')
+        metrics.lap('send')
         
         # Return new last row sent
-        lastrow = lastrow+nrows
+        lastrow = lastrow+len(delivery)
+        metrics.end('report.land')
         return lastrow
\ No newline at end of file
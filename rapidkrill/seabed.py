@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+RapidKrill seabed detection. Follows the seabed along pings, searching only
+a window of range around the seabed found in preceeding pings.
+
+Created on Fri Oct 16 18:38:14 2026
+@author: British Antarctic Survey
+"""
+
+# import modules
+import numpy as np
+from scipy import ndimage
+
+def track(Sv, r, r0=20, r1=1000, thr=-38, ec=1, ek=(3,3), dc=10, dk=(3,7),
+          window=20, block=20):
+    """
+    Detect the seabed as mSB.ariza, but following it along pings. Sv above
+    a threshold is eroded to get rid of fake seabeds (spikes, small shoals),
+    and the seabed is the first sample remaining, raised by the dilation
+    cycles along range and taking the shallowest seabed among pings within
+    the dilation cycles along pings, so that seabed breaches are filled in.
+
+    The seabed is searched in blocks of pings, only within a window of range
+    around the seabed of the preceeding block. Range is searched all the way
+    from r0 to r1 only in the first block, and in pings where the seabed is
+    lost: it is not found within the window, or it is found at the top of
+    the window, where it might be even shallower. Unlike mSB.ariza, strong
+    echoes well above the seabed being tracked (e.g. dense shoals) are not
+    taken as seabed.
+
+    Args:
+        Sv     (float): 2D array with Sv data (dB).
+        r      (float): 1D array with range (m).
+        r0     (int  ): Minimum range where seabed is searched (m).
+        r1     (int  ): Maximum range where seabed is searched (m).
+        thr    (int  ): Sv threshold above which seabed might occur (dB).
+        ec     (int  ): Number of erosion cycles.
+        ek     (int  ): 2-elements tuple with vertical and horizontal
+                        dimensions of the erosion kernel.
+        dc     (int  ): Number of dilation cycles.
+        dk     (int  ): 2-elements tuple with vertical and horizontal
+                        dimensions of the dilation kernel.
+        window (float): Range searched above and below the seabed of the
+                        preceeding block of pings (m).
+        block  (int  ): Number of pings in blocks.
+
+    Returns:
+        int: 1D array with the seabed sample at every ping, 0 if there is no
+             seabed (as np.argmax of a seabed mask).
+    """
+
+    # get sample limits, and erosion and dilation reach in samples and pings
+    nsamples, npings = Sv.shape
+    i0 = np.nanargmin(abs(r - r0))
+    i1 = np.nanargmin(abs(r - r1))
+    ei = ec*(ek[0]//2)
+    ej = ec*(ek[1]//2)
+    di = dc*(dk[0]//2)
+    dj = dc*(dk[1]//2)
+    w  = int(np.ceil(window/np.nanmedian(np.diff(r))))
+
+    # find the first sample remaining after erosion, block by block
+    none  = nsamples + di
+    first = np.full(npings, none)
+    found = None
+    for j0 in range(0, npings, block):
+        j1 = min(j0 + block, npings)
+
+        # search the window around the seabed in the preceeding block...
+        if found is not None:
+            lo   = max(i0, found[0] - w)
+            hi   = min(i1, found[1] + w + 1)
+            f    = _first(Sv, lo, hi, j0, j1, i0, i1, thr, ei, ej, none)
+            lost = (f==none) | ((f==lo) & (lo>i0))
+        else:
+            f    = np.full(j1 - j0, none)
+            lost = np.ones(j1 - j0, dtype=bool)
+
+        # ...and the whole range where the seabed is lost
+        if lost.any():
+            f[lost] = _first(Sv, i0, i1, j0, j1, i0, i1, thr, ei, ej,
+                             none)[lost]
+        first[j0:j1] = f
+        f     = f[f<none]
+        found = (f.min(), f.max()) if f.size else None
+
+    # raise the seabed by dilation, taking the shallowest one among pings
+    # within dilation reach
+    idx = ndimage.minimum_filter1d(first, 2*dj + 1, mode='nearest') - di
+    idx[idx>=nsamples] = 0
+    idx[idx<0        ] = 0
+
+    return idx
+
+def _first(Sv, lo, hi, j0, j1, i0, i1, thr, ei, ej, none):
+    """
+    Find the first sample between lo and hi, in pings from j0 to j1, above
+    the threshold after erosion. Samples out of i0 and i1 are not seabed.
+    """
+
+    # get samples within erosion reach, with edges as in mSB.ariza
+    a, b = max(0, lo - ei), min(Sv.shape[0], hi + ei)
+    c, d = max(0, j0 - ej), min(Sv.shape[1], j1 + ej)
+    sb   = Sv[a:b, c:d] >= thr
+    sb[:max(0, i0 - a)] = False
+    sb[max(0, i1 - a):] = False
+
+    # erode, and get the first sample remaining at every ping
+    sb = ndimage.minimum_filter(sb, size=(2*ei + 1, 2*ej + 1),
+                                mode='nearest')[lo - a:hi - a, j0 - c:j1 - c]
+    f  = np.argmax(sb, axis=0) + lo
+    f[~sb.any(axis=0)] = none
+
+    return f
@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+RapidKrill results store. Results logged for every RAW file (see report.log)
+are appended to a SQLite database, with one table and one row per interval,
+so that the last rows can be read without reading the whole log (see
+report.land), however long the cruise.
+
+Every row has a row number, from 0, in the order rows were appended, which
+is the primary key of the table. Time and transect are indexed too. Other
+columns are those of the results, as in the CSV log file, and new ones are
+added as they appear (e.g. NASC in new depth layers).
+
+Created on Fri Oct 16 22:31:08 2026
+@author: British Antarctic Survey
+"""
+
+# import modules
+import os, sqlite3, contextlib
+import pandas as pd
+
+# table, row number, and indexed columns
+TABLE   = 'results'
+ROW     = 'row'
+INDEXES = {'Time': 'results_time', 'Transect': 'results_transect'}
+
+def append(path, results):
+    """
+    Append results to the store, creating it if it does not exist.
+
+    Args:
+        path    (str      ): Path to the SQLite database.
+        results (DataFrame): Results to append, one row per interval.
+
+    Returns:
+        int: Number of rows in the store.
+    """
+    with _connect(path) as con, con:
+        columns = _columns(con)
+        if not columns:
+            con.execute('CREATE TABLE %s (%s INTEGER PRIMARY KEY)'
+                        % (TABLE, _quote(ROW)))
+        for name, dtype in results.dtypes.items():
+            if name not in columns:
+                con.execute('ALTER TABLE %s ADD COLUMN %s %s'
+                            % (TABLE, _quote(name), _type(dtype)))
+            if name in INDEXES:
+                con.execute('CREATE INDEX IF NOT EXISTS %s ON %s (%s)'
+                            % (INDEXES[name], TABLE, _quote(name)))
+        n    = _count(con)
+        rows = results.copy()
+        rows.insert(0, ROW, range(n, n + len(rows)))
+        rows.to_sql(TABLE, con, if_exists='append', index=False)
+        return n + len(rows)
+
+def count(path):
+    """
+    Get the number of rows in the store, 0 if it does not exist.
+    """
+    if not os.path.exists(path):
+        return 0
+    with _connect(path) as con:
+        return _count(con) if _columns(con) else 0
+
+def tail(path, offset, nrows=None):
+    """
+    Read rows from an offset on, in the order they were appended.
+
+    Args:
+        path   (str): Path to the SQLite database.
+        offset (int): Row number of the first row to read.
+        nrows  (int): Maximum number of rows to read. None to read them all.
+
+    Returns:
+        DataFrame: Rows read, with the results columns.
+    """
+    return _select(path, '%s>=?' % _quote(ROW), [int(offset)],
+                   -1 if nrows is None else int(nrows))
+
+def query(path, start=None, end=None, transect=None):
+    """
+    Read rows within a time window and/or of a transect.
+
+    Args:
+        path     (str): Path to the SQLite database.
+        start    (str): First time to read, as logged (ISO 8601). None to
+                        read from the beginning.
+        end      (str): Time to read up to, not included. None to read up to
+                        the end.
+        transect (int): Transect number. None to read all transects.
+
+    Returns:
+        DataFrame: Rows read, with the results columns.
+    """
+    where, params = ['1'], []
+    for condition, value in [('"Time">=?', start), ('"Time"<?', end),
+                             ('"Transect"=?', None if transect is None
+                                              else int(transect))]:
+        if value is not None:
+            where.append(condition)
+            params.append(value)
+    return _select(path, ' AND '.join(where), params, -1)
+
+def export(path, csv, chunksize=10000):
+    """
+    Export the store to a CSV file, as the CSV log file written by
+    report.log. The file is written aside and then renamed, chunk by chunk
+    of rows, so that the store is never read at once.
+
+    Args:
+        path      (str): Path to the SQLite database.
+        csv       (str): Path to the CSV file.
+        chunksize (int): Number of rows read at once.
+    """
+    tmp = csv + '.tmp'
+    with open(tmp, 'w') as f:
+        for offset in range(0, max(1, count(path)), chunksize):
+            rows = tail(path, offset, chunksize)
+            rows.to_csv(f, index=False, header=offset==0)
+    os.replace(tmp, csv)
+
+def load(csv, path):
+    """
+    Create a store with the results in a CSV log file (e.g. logged by older
+    versions). The store is written aside and then renamed, so that it is
+    never left half-loaded.
+
+    Args:
+        csv  (str): Path to the CSV file.
+        path (str): Path to the SQLite database.
+    """
+    tmp = path + '.tmp'
+    if os.path.exists(tmp):
+        os.remove(tmp)
+    for rows in pd.read_csv(csv, chunksize=10000):
+        append(tmp, rows)
+    if not os.path.exists(tmp):
+        append(tmp, pd.read_csv(csv))
+    os.replace(tmp, path)
+
+def _select(path, where, params, nrows):
+    if not count(path):
+        return pd.DataFrame()
+    with _connect(path) as con:
+        sql  = 'SELECT * FROM %s WHERE %s ORDER BY %s LIMIT ?' % (
+               TABLE, where, _quote(ROW))
+        rows = pd.read_sql_query(sql, con, params=params + [nrows])
+        
+        # NaNs are stored as NULL, read as None if all rows are NULL, so
+        # numeric columns are cast back to their declared type
+        for name, dtype in _types(con).items():
+            if dtype=='REAL':
+                rows[name] = rows[name].astype(float)
+            elif dtype=='INTEGER' and rows[name].dtype==object:
+                rows[name] = rows[name].astype(float)
+    return rows.drop(columns=ROW)
+
+def _connect(path):
+    return contextlib.closing(sqlite3.connect(path))
+
+def _columns(con):
+    return [r[1] for r in con.execute('PRAGMA table_info(%s)' % TABLE)]
+
+def _types(con):
+    return {r[1]: r[2] for r in con.execute('PRAGMA table_info(%s)' % TABLE)}
+
+def _count(con):
+    n = con.execute('SELECT MAX(%s) FROM %s' % (_quote(ROW), TABLE)
+                    ).fetchone()[0]
+    return 0 if n is None else n + 1
+
+def _quote(name):
+    return '"%s"' % name.replace('"', '""')
+
+def _type(dtype):
+    if pd.api.types.is_integer_dtype(dtype):
+        return 'INTEGER'
+    if pd.api.types.is_float_dtype(dtype):
+        return 'REAL'
+    return 'TEXT'
@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+RapidKrill directory watcher. Detects RAW files completed by the echosounder,
+using inotify events when available, or polling otherwise (e.g. SMB mounts).
+
+Created on Fri Oct 16 19:04:38 2026
+@author: British Antarctic Survey
+"""
+
+# import modules
+import os, re, time, errno, select, struct, logging, ctypes, ctypes.util
+
+# log events while running
+logger = logging.getLogger()
+
+# inotify events
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM  = 0x00000040
+IN_MOVED_TO    = 0x00000080
+IN_CREATE      = 0x00000100
+IN_DELETE      = 0x00000200
+IN_NONBLOCK    = os.O_NONBLOCK
+IN_CLOEXEC     = getattr(os, 'O_CLOEXEC', 0o2000000)
+
+def inotify(path, mask=IN_CLOSE_WRITE|IN_MOVED_TO|IN_MOVED_FROM|IN_CREATE|
+                       IN_DELETE):
+    """
+    Start watching a directory with inotify.
+
+    Args:
+        path (str): Path to the directory.
+        mask (int): inotify events to watch.
+
+    Returns:
+        int: inotify file descriptor, to be read with events().
+    """
+    libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+    fd   = libc.inotify_init1(IN_NONBLOCK|IN_CLOEXEC)
+    if fd<0:
+        raise OSError(ctypes.get_errno(), 'inotify_init1 failed')
+    if libc.inotify_add_watch(fd, os.fsencode(path), mask)<0:
+        os.close(fd)
+        raise OSError(ctypes.get_errno(), 'inotify_add_watch failed')
+    return fd
+
+def events(fd):
+    """
+    Read pending inotify events, without blocking.
+
+    Args:
+        fd (int): inotify file descriptor.
+
+    Returns:
+        list: (mask, name) of every event pending.
+    """
+    out = []
+    while 1:
+        try:
+            buf = os.read(fd, 65536)
+        except OSError as e:
+            if e.errno in (errno.EAGAIN, errno.EWOULDBLOCK):
+                return out
+            raise
+        i = 0
+        while i<len(buf):
+            wd, mask, cookie, size = struct.unpack_from('iIII', buf, i)
+            name = buf[i+16:i+16+size].rstrip(b'\0')
+            out.append((mask, os.fsdecode(name)))
+            i   += 16 + size
+
+class Watcher(object):
+    """
+    Watch a directory for new RAW files, and tell which ones are complete and
+    not processed yet. Files already in the directory when the watcher starts
+    are not considered new.
+
+    Files already processed can be given instead, e.g. to resume watching
+    after a restart. Then, files in the directory that are not among them are
+    considered new.
+
+    A file is complete if inotify reported it was closed after writing, if a
+    newer file has been created after it, or if its size and modification
+    time have not changed for a while.
+
+    Args:
+        path      (str  ): Path to the directory.
+        pattern   (str  ): Regular expression matching RAW file names.
+        interval  (float): Maximum time waiting for changes in the directory
+                           (s), and time a file must remain unchanged to be
+                           considered complete.
+        notify    (bool ): Whether or not to use inotify. If not, or if it is
+                           not available, the directory is polled.
+        processed (list ): Names of the files already processed. None to 
+                           take those in the directory.
+    """
+    def __init__(self, path, pattern='.*raw$', interval=10, notify=True,
+                 processed=None):
+        self.path      = path
+        self.regex     = re.compile(pattern, re.IGNORECASE)
+        self.interval  = interval
+        self.present   = set(self._list())
+        if processed is None:
+            self.processed = set(self.present)
+        else:
+            self.processed = set(processed)
+        self.closed    = set()
+        self.stat      = {}
+        self.fd        = None
+        if notify:
+            try:
+                self.fd = inotify(path)
+            except Exception:
+                logger.warning('inotify not available, polling %s every %s s',
+                               path, interval)
+
+    def close(self):
+        """
+        Stop watching the directory.
+        """
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+    def _list(self):
+        return sorted(f for f in os.listdir(self.path) if self.regex.match(f))
+
+    def wait(self):
+        """
+        Wait until there are changes in the directory, or the interval has
+        elapsed. Without inotify, it just waits for the interval.
+        """
+        if self.fd is None:
+            time.sleep(self.interval)
+            return
+        if select.select([self.fd], [], [], self.interval)[0]:
+            for mask, name in events(self.fd):
+                if mask & IN_CLOSE_WRITE and self.regex.match(name):
+                    self.closed.add(name)
+
+    def completed(self):
+        """
+        List complete files, not processed yet, in order.
+
+        Returns:
+            list: Names of the files.
+        """
+        now   = time.monotonic()
+        files = self._list()
+
+        # warn about deleted files, and files processed that come in again
+        listed = set(files)
+        if self.present - listed:
+            logger.warning('Files have been deleted!')
+        again = sorted((listed - self.present) & self.processed)
+        if again:
+            logger.warning('Incoming files already processed: %s',
+                           ', '.join(again))
+        self.present = listed
+        self.closed &= listed
+
+        # files are complete if closed, followed by a newer one, or unchanged
+        new  = [f for f in files if f not in self.processed]
+        done = []
+        for i, f in enumerate(new):
+            if f in self.closed or i<len(new)-1:
+                done.append(f)
+                continue
+            try:
+                st = os.stat(os.path.join(self.path, f))
+            except FileNotFoundError:
+                continue
+            key = (st.st_size, st.st_mtime_ns)
+            if self.stat.get(f, (None,))[0]!=key:
+                self.stat = {f: (key, now)}
+            elif now - self.stat[f][1] >= self.interval:
+                done.append(f)
+        return done
+
+    def done(self, name):
+        """
+        Mark a file as processed.
+
+        Args:
+            name (str): Name of the file.
+        """
+        self.processed.add(name)
+        self.closed.discard(name)
+        self.stat.pop(name, None)
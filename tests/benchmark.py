@@ -0,0 +1,378 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+RapidKrill benchmarks. Measure time and peak memory (RSS) of RapidKrill
+routines over the RAW files in the "echosounder" directory, or over
+synthetic RAW files (see synthetic.py).
+
+Usage:
+    python benchmark.py read [maxrange]
+    python benchmark.py distance [nfixes]
+    python benchmark.py float32
+    python benchmark.py outputs
+    python benchmark.py kernels
+    python benchmark.py synthetic [nfiles] [npings] [maxrange]
+    python benchmark.py baseline [nfiles] [npings] [maxrange]
+
+Created on Fri Oct 16 09:12:40 2026
+@author: British Antarctic Survey
+"""
+
+#------------------------------------------------------------------------------
+# import modules
+import os, sys, glob, time, json, shutil, resource, cProfile, pstats
+import platform
+import multiprocessing as mp
+import numpy as np
+
+#------------------------------------------------------------------------------
+# Get path to the directory "echosounder"
+path = os.path.join(os.path.dirname(__file__), 'echosounder', '')
+
+# Get path to the baseline of the synthetic benchmark
+baseline = os.path.join(os.path.dirname(__file__), 'benchmark.json')
+
+def measure(queue, function, args, kwargs):
+    """
+    Run function in a child process and return its wall time (s), the peak 
+    RSS (MB) reached by the process, and the function output.
+    """
+    start  = time.perf_counter()
+    output = function(*args, **kwargs)
+    wall   = time.perf_counter() - start
+    rss    = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss/1024
+    queue.put((wall, rss, output))
+
+def isolated(function, *args, **kwargs):
+    """
+    Run function in a fresh process, so that peak RSS is not polluted by
+    previous runs. Returns wall time (s) and peak RSS (MB), and the function
+    output if any.
+    """
+    ctx   = mp.get_context('spawn')
+    queue = ctx.Queue()
+    p     = ctx.Process(target=measure, args=(queue, function, args, kwargs))
+    p.start()
+    wall, rss, output = queue.get()
+    p.join()
+    if output is None:
+        return wall, rss
+    return wall, rss, output
+
+def readraw(rawfile, **kwargs):
+    """
+    Read a RAW file with rapidkrill.
+    """
+    from rapidkrill import read
+    read.raw(rawfile, **kwargs)
+
+def processraws(rawfiles, output='full', kernels='echopy', **kwargs):
+    """
+    Read and process RAW files in sequence, as in the desktop application, 
+    and return distance and NASC of the intervals delivered.
+    """
+    from rapidkrill import read, process
+    preraw = None
+    stream = process.CcamlrStream(output=output, kernels=kernels)
+    nm, NASC = [], []
+    for rawfile in rawfiles:
+        raw    = read.raw(rawfile, preraw=preraw, **kwargs)
+        preraw = read.tail(raw)
+        if not raw['continuous']:
+            stream.reset()
+        stream.append(raw)
+        if stream.transect>0:
+            pro = stream.process()
+            if pro is not None:
+                nm  .append(pro['nm120r'])
+                NASC.append(pro['NASC120swr'][0])
+        else:
+            stream.reset()
+    if not nm:
+        raise Exception('No intervals processed, at least 1 nmi required')
+    return np.concatenate(nm), np.concatenate(NASC)
+
+def bench_float32():
+    """
+    Compare time, peak RSS and NASC when reading and processing the RAW files
+    in double and in single precision.
+    """
+    rawfiles = np.sort(glob.glob(path + '*.raw'))
+    if rawfiles.size==0:
+        raise Exception('No RAW files in the echosounder directory')
+    
+    t0, m0, (nm0, NASC0) = isolated(processraws, rawfiles)
+    t1, m1, (nm1, NASC1) = isolated(processraws, rawfiles, float32=True)
+    if not np.array_equal(nm0, nm1):
+        raise Exception('Intervals processed differ')
+    
+    diff = np.abs(NASC1 - NASC0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        rel = np.where(NASC0>0, diff/NASC0, 0)
+    print('%d files, %d intervals' % (len(rawfiles), len(nm0)))
+    print('float64: %.2f s, %.1f MB' % (t0, m0))
+    print('float32: %.2f s, %.1f MB' % (t1, m1))
+    print('NASC max difference: %.3e m2 nmi-2 (%.3e relative)'
+          % (np.nanmax(diff), np.nanmax(rel)))
+    print('NASC valid in one precision only: %d'
+          % np.sum(np.isnan(NASC0)!=np.isnan(NASC1)))
+
+def bench_outputs():
+    """
+    Compare time and peak RSS when reading and processing the RAW files with
+    each output profile.
+    """
+    from rapidkrill.process import OUTPUTS
+    rawfiles = np.sort(glob.glob(path + '*.raw'))
+    if rawfiles.size==0:
+        raise Exception('No RAW files in the echosounder directory')
+    
+    line = '{:<10} {:>10} {:>10}'
+    print(line.format('Profile', 'time (s)', 'RSS (MB)'))
+    for output in OUTPUTS:
+        t, m, _ = isolated(processraws, rawfiles, output=output)
+        print(line.format(output, '%.2f' % t, '%.1f' % m))
+
+def bench_kernels():
+    """
+    Compare time and NASC when reading and processing the RAW files with
+    echopy and with rapidkrill filter kernels.
+    """
+    rawfiles = np.sort(glob.glob(path + '*.raw'))
+    if rawfiles.size==0:
+        raise Exception('No RAW files in the echosounder directory')
+    
+    t0, m0, (nm0, NASC0) = isolated(processraws, rawfiles)
+    t1, m1, (nm1, NASC1) = isolated(processraws, rawfiles,
+                                    kernels='rapidkrill')
+    if not np.array_equal(nm0, nm1):
+        raise Exception('Intervals processed differ')
+    
+    print('%d files, %d intervals' % (len(rawfiles), len(nm0)))
+    print('echopy    : %.2f s, %.1f MB' % (t0, m0))
+    print('rapidkrill: %.2f s, %.1f MB' % (t1, m1))
+    print('NASC max difference: %.3e m2 nmi-2'
+          % np.nanmax(np.abs(NASC1 - NASC0)))
+
+def bench_read(maxrange=None):
+    """
+    Compare time and peak RSS per file when decoding all channels and samples
+    against decoding the 120 kHz channel only, down to maxrange.
+    """
+    rawfiles = np.sort(glob.glob(path + '*.raw'))
+    if rawfiles.size==0:
+        raise Exception('No RAW files in the echosounder directory')
+
+    line = '{:<32} {:>10} {:>10} {:>10} {:>10}'
+    print(line.format('File', 'all (s)', 'all (MB)', 'sel (s)', 'sel (MB)'))
+    for rawfile in rawfiles:
+        t0, m0 = isolated(readraw, rawfile, allchannels=True)
+        t1, m1 = isolated(readraw, rawfile, maxrange=maxrange)
+        print(line.format(os.path.split(rawfile)[-1], '%.2f' % t0,
+                          '%.1f' % m0, '%.2f' % t1, '%.1f' % m1))
+
+def bench_distance(nfixes=86400):
+    """
+    Compare time to compute distances between consecutive GPS fixes with
+    geopy, one pair at a time, and with rapidkrill vectorized routine. 
+    """
+    from geopy.distance import distance
+    from rapidkrill import nav
+    
+    # simulate 1 Hz GPS fixes of a vessel steaming at 10 knots
+    nfixes = int(nfixes)
+    lat    = -60 + np.cumsum(np.random.normal(0, 1e-5, nfixes) + 4.6e-5)
+    lon    = -45 + np.cumsum(np.random.normal(0, 1e-5, nfixes))
+    
+    start = time.perf_counter()
+    kmg   = [distance((lat[i], lon[i]), (lat[i+1], lon[i+1])).km
+             for i in range(nfixes-1)]
+    t0    = time.perf_counter() - start
+    start = time.perf_counter()
+    km    = nav.distance(lat[:-1], lon[:-1], lat[1:], lon[1:])
+    t1    = time.perf_counter() - start
+    
+    print('%d fixes: geopy %.2f s, rapidkrill %.3f s (x%.0f), '
+          'max difference %.2e mm' % (nfixes, t0, t1, t0/t1,
+                                      np.max(np.abs(km-kmg))*1e6))
+
+def stages(function, *args, **kwargs):
+    """
+    Profile function, and return the time (s) spent in every routine that
+    it calls directly, as a dictionary keyed by module and routine name.
+    """
+    profile = cProfile.Profile()
+    profile.runcall(function, *args, **kwargs)
+    code    = function.__code__
+    times   = {}
+    for (file, line, name), (_, _, _, _, callers) in pstats.Stats(
+            profile).stats.items():
+        for (cfile, cline, cname), (_, _, _, ct) in callers.items():
+            if (cfile, cline, cname)!=(code.co_filename, code.co_firstlineno,
+                                        code.co_name):
+                continue
+            if file!='~':
+                name = os.path.splitext(os.path.basename(file))[0] + '.' + name
+            times[name] = times.get(name, 0) + ct
+    return times
+
+def synthstep(step, nfiles, npings, maxrange):
+    """
+    Simulate RAW files (see synthetic.decoded) and run one step of reading,
+    processing or reporting over all of them. Returns the wall time of the
+    step (s), without simulation and preparation, and the time of every 
+    processing stage if the step is process.ccamlr.
+    """
+    from rapidkrill import read, process, report
+    from synthetic import decoded
+    files = decoded(nfiles=nfiles, npings=npings, maxrange=maxrange)
+    
+    # stitch files, and get the tail of the preceeding file for every file
+    raws, tails = [], [None]
+    for d in files:
+        raws .append(read.stitch(d, preraw=tails[-1]))
+        tails.append(read.tail(raws[-1]))
+    
+    # join files, and process them, as needed for the step
+    if step in ('process.ccamlr', 'process.ccamlr (fast)', 'report.log'):
+        raw = raws[0]
+        for r in raws[1:]:
+            raw = read.join(raw, r)
+        fast = {'kernels': 'rapidkrill', 'tracking': True}
+    if step=='report.log':
+        pro     = process.ccamlr(raw, jdx=[0, 0], output='png')
+        logname = 'benchmark-%d' % os.getpid()
+    
+    # run the step
+    start = time.perf_counter()
+    if step=='read.stitch':
+        for d, preraw in zip(files, tails):
+            read.stitch(d, preraw=preraw)
+    elif step=='read.nmea':
+        for d, preraw in zip(files, tails):
+            read.nmea(d['gps'], d['t'], preraw=preraw)
+    elif step=='read.motion':
+        for d, preraw in zip(files, tails):
+            read.motion(d['shr'], d['t'], preraw=preraw)
+    elif step=='read.join':
+        raw = raws[0]
+        for r in raws[1:]:
+            raw = read.join(raw, r)
+    elif step=='process.ccamlr':
+        process.ccamlr(raw, jdx=[0, 0])
+    elif step=='process.ccamlr (fast)':
+        process.ccamlr(raw, jdx=[0, 0], **fast)
+    elif step=='report.log':
+        try:
+            report.log(pro, logname, wait=True)
+        finally:
+            report.close()
+            shutil.rmtree(os.path.join(os.path.dirname(report.__file__), '..',
+                                       'log', logname), ignore_errors=True)
+    wall = time.perf_counter() - start
+    
+    # profile processing stages
+    times = {}
+    if step=='process.ccamlr':
+        times = stages(process.ccamlr, raw, jdx=[0, 0])
+    elif step=='process.ccamlr (fast)':
+        times = stages(process.ccamlr, raw, jdx=[0, 0], **fast)
+    return wall, times
+
+def machine():
+    """
+    Return the computer and the versions of the libraries the synthetic
+    benchmark runs on. A baseline is only comparable on the same ones.
+    """
+    import echopy
+    return {'node'     : platform.node(),
+            'processor': platform.processor() or platform.machine(),
+            'cpus'     : os.cpu_count(),
+            'python'   : platform.python_version(),
+            'numpy'    : np.__version__,
+            'echopy'   : getattr(echopy, '__version__',
+                                 os.path.dirname(echopy.__file__))}
+
+def bench_synthetic(nfiles=3, npings=1800, maxrange=300, save=False):
+    """
+    Measure pings per second and peak RSS of reading (without decoding),
+    processing and reporting synthetic RAW files, every step in a fresh
+    process, and the time of every processing stage. Results are compared
+    with the baseline saved before, if any, or saved as the new baseline.
+    The baseline is only compared if measured with the same synthetic data
+    on the same computer and libraries (see machine), since pings per
+    second are not comparable across them.
+    
+    RAW files are simulated already decoded, so read.raw is measured as
+    read.stitch, and decoding real RAW files with the "read" benchmark.
+    """
+    nfiles, npings, maxrange = int(nfiles), int(npings), float(maxrange)
+    steps = ['read.stitch', 'read.nmea', 'read.motion', 'read.join',
+             'process.ccamlr', 'process.ccamlr (fast)', 'report.log']
+    
+    # load the baseline, if measured with the same data on the same machine
+    base = {'steps': {}, 'stages': {}}
+    if not save and os.path.isfile(baseline):
+        with open(baseline) as f:
+            base = json.load(f)
+        if base['data']!=[nfiles, npings, maxrange]:
+            print('Baseline measured with %d files, %d pings, %g m: not '
+                  'compared' % tuple(base['data']))
+            base = {'steps': {}, 'stages': {}}
+        elif base.get('machine')!=machine():
+            print('Baseline measured on %s: not compared'
+                  % json.dumps(base.get('machine'), sort_keys=True))
+            base = {'steps': {}, 'stages': {}}
+    
+    # measure every step
+    results = {'data'   : [nfiles, npings, maxrange],
+               'machine': machine(),
+               'steps'  : {},
+               'stages' : {}}
+    line = '{:<52} {:>10} {:>10} {:>10} {:>10}'
+    print('%d files x %d pings, %g m' % (nfiles, npings, maxrange))
+    print(line.format('Step', 'pings/s', 'RSS (MB)', 'base p/s', 'base MB'))
+    for step in steps:
+        _, m, (t, times) = isolated(synthstep, step, nfiles, npings, maxrange)
+        results['steps'][step] = [nfiles*npings/t, m]
+        b = base['steps'].get(step, [np.nan, np.nan])
+        print(line.format(step, '%.0f' % (nfiles*npings/t), '%.1f' % m,
+                          '%.0f' % b[0], '%.1f' % b[1]))
+        for stage, ts in times.items():
+            results['stages'][step + ': ' + stage] = ts
+    
+    # report processing stages taking 1% of the time or more
+    print(line.format('Stage', 'time (s)', '', 'base (s)', ''))
+    for stage, ts in sorted(results['stages'].items(),
+                            key=lambda x: (x[0].split(': ')[0], -x[1])):
+        step = stage.split(': ')[0]
+        if ts < .01*nfiles*npings/results['steps'][step][0]:
+            continue
+        print(line.format(stage, '%.3f' % ts, '',
+                          '%.3f' % base['stages'].get(stage, np.nan), ''))
+    
+    # save the baseline
+    if save:
+        with open(baseline, 'w') as f:
+            json.dump(results, f, indent=1, sort_keys=True)
+        print('Baseline saved in %s' % baseline)
+
+def bench_baseline(nfiles=3, npings=1800, maxrange=300):
+    """
+    Run the synthetic benchmark, and save its results as the baseline.
+    """
+    bench_synthetic(nfiles, npings, maxrange, save=True)
+
+# run benchmarks if this script is run as the main program
+if __name__ == '__main__':
+    benchmarks = {'read'     : bench_read     ,
+                  'distance' : bench_distance ,
+                  'float32'  : bench_float32  ,
+                  'outputs'  : bench_outputs  ,
+                  'kernels'  : bench_kernels  ,
+                  'synthetic': bench_synthetic,
+                  'baseline' : bench_baseline }
+    if len(sys.argv)<2 or sys.argv[1] not in benchmarks:
+        raise Exception('Choose a benchmark: %s' % ', '.join(benchmarks))
+    args = [float(a) for a in sys.argv[2:]]
+    benchmarks[sys.argv[1]](*args)
@@ -19,8 +19,11 @@ os.chdir(wd)
 path = os.path.join(os.path.dirname(__file__),'echosounder','')
 
 #------------------------------------------------------------------------------
-# import RapidKrill desktop module, and process all RAW files in the directory
+# import RapidKrill desktop module, and process all RAW files in the directory.
+# Echogram images are rendered by a background process, which imports this
+# script again, so it must only run as the main program
 from rapidkrill.desktop import desktop
-desktop(path)
+if __name__ == '__main__':
+    desktop(path)
 
 # Check results in the console and in the "log" folder.
\ No newline at end of file
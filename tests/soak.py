@@ -0,0 +1,250 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Soak test of the RapidKrill listening routine. Replays RAW files into a
+collector directory at a multiple of the rate they were recorded, while the
+listening routine runs in this same process, to find out whether it keeps
+up with the echosounder. It measures:
+    - latency, from a RAW file being closed to the results that needed it
+      being written in the CSV log,
+    - backlog, number of RAW files closed but not reported yet,
+    - RSS of the process, over time.
+
+RAW files are taken from the "echosounder" directory, or simulated (see
+synthetic.py). Reports to land are not emailed but kept in memory.
+
+Usage:
+    python soak.py [speedup] [nfiles]
+    python soak.py synthetic [speedup] [nfiles] [npings] [maxrange]
+
+Created on Fri Oct 16 20:41:12 2026
+@author: British Antarctic Survey
+"""
+
+#------------------------------------------------------------------------------
+# import modules
+import os, re, sys, glob, time, shutil, tempfile, threading, resource, logging
+import numpy as np
+import pandas as pd
+
+#------------------------------------------------------------------------------
+# Get path to the directory "echosounder"
+path = os.path.join(os.path.dirname(__file__), 'echosounder', '')
+
+def rss():
+    """
+    Get the current RSS of this process (MB), or the peak RSS if the current
+    one is not available.
+    """
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1])*resource.getpagesize()/2**20
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss/1024
+
+def recorded(rawfiles):
+    """
+    Get the time every RAW file was closed by the echosounder, since the
+    start of the first file (s), from the date and time in file names (e.g.
+    D20190101-T000000.raw). Files are closed when the next one starts, and
+    the last one after the median duration of the others.
+    """
+    start = []
+    for rawfile in rawfiles:
+        match = re.search(r'D(\d{8})-T(\d{6})', os.path.basename(rawfile))
+        if match is None:
+            raise Exception('No date and time in RAW file name %s' % rawfile)
+        start.append(pd.to_datetime(''.join(match.groups()),
+                                    format='%Y%m%d%H%M%S'))
+    start = np.array([(s - start[0]).total_seconds() for s in start])
+    d     = np.diff(start)
+    return np.r_[start[1:], start[-1] + (np.median(d) if len(d) else 0)]
+
+def synthesize(directory, nfiles, npings, maxrange):
+    """
+    Simulate RAW files (see synthetic.rawfile) as placeholder files in a
+    directory, and make read.decode simulate their data when they are read.
+
+    Returns:
+        list: Paths to the RAW files.
+        float: 1D array with time every file is closed since the start (s).
+    """
+    from rapidkrill import read
+    from synthetic import rawfile
+
+    # name files as the echosounder, and simulate their data when decoded
+    names = [rawfile(i, npings=npings, maxrange=1)['rawfile']
+             for i in range(nfiles)]
+    def decode(rawfile_, float32=False, **kwargs):
+        i = names.index(os.path.basename(rawfile_))
+        return rawfile(i, npings=npings, maxrange=maxrange, float32=float32)
+    read.decode = decode
+
+    rawfiles = []
+    for name in names:
+        rawfiles.append(os.path.join(directory, name))
+        with open(rawfiles[-1], 'w') as f:
+            f.write('synthetic')
+    return rawfiles, np.arange(1, nfiles+1)*npings*2.
+
+def soak(rawfiles, closed, collector, speedup=1, drain=600, **kwargs):
+    """
+    Replay RAW files into a collector directory at a multiple of their
+    recorded rate, while listening to it, and report latency, backlog and
+    RSS.
+
+    Args:
+        rawfiles (list ): Paths to the RAW files.
+        closed   (float): 1D array with the time every file was closed by
+                          the echosounder, since the start (s).
+        collector (str ): Path to an empty directory where files are 
+                          replayed.
+        speedup  (float): Multiple of the recorded rate at which files are
+                          replayed.
+        drain    (float): Maximum time to wait for the listening routine to
+                          catch up after the last file (s).
+        **kwargs        : Arguments for the listening routine (see
+                          listen.listen).
+
+    Returns:
+        DataFrame: Latency of every result logged, and the files needed.
+        DataFrame: Backlog and RSS every second, and whether files were 
+                   still being replayed.
+        list     : Reports delivered to land.
+    """
+    from rapidkrill import listen, report
+    resume    = os.path.join(collector, 'listen.npz')
+    closing   = {}
+    logged    = []
+    done      = []
+    reports   = []
+
+    # note when results are logged, when files are through the routine, and
+    # the reports delivered
+    def log(pro, logname, savepng=True):
+        log_(pro, logname, savepng=savepng)
+        logged.append((time.monotonic(), pro['rawfiles'][-1],
+                       len(pro['nm120r'])))
+    def save(resume, state, *args):
+        save_(resume, state, *args)
+        if state is not None:
+            done.append(time.monotonic())
+    def deliver(sender, recipient, subject, text, data):
+        reports.append((time.monotonic(), subject, len(data)))
+        return True
+    log_, save_ = report.log, listen.save
+    report.log, listen.save = log, save
+
+    # listen to the collector, in the background
+    kwargs.setdefault('recipient', 'soak@localhost')
+    threading.Thread(target=listen.listen, args=(collector,),
+                     kwargs=dict(kwargs, resume=resume, deliver=deliver),
+                     daemon=True).start()
+    time.sleep(1)
+
+    # replay files, sampling backlog and RSS every second
+    samples = []
+    start   = time.monotonic()
+    i       = 0
+    while (len(done)<len(rawfiles)) & (time.monotonic()-start <
+                                        closed[-1]/speedup + drain):
+        now = time.monotonic()
+        while (i<len(rawfiles)) and (now - start >= closed[i]/speedup):
+            name = os.path.basename(rawfiles[i])
+            shutil.copyfile(rawfiles[i], os.path.join(collector, name))
+            closing[name] = time.monotonic()
+            i            += 1
+        samples.append((now - start, i - len(done), rss(), i<len(rawfiles)))
+        time.sleep(max(0, 1 - (time.monotonic() - now)))
+    samples.append((time.monotonic() - start, i - len(done), rss(), False))
+    report.log, listen.save = log_, save_
+
+    # work out latency, from the last file needed being closed
+    latency = pd.DataFrame([(t - start, f, n, t - closing[f])
+                            for t, f, n in logged],
+                           columns=['time', 'file', 'rows', 'latency'])
+    samples = pd.DataFrame(samples, columns=['time', 'backlog', 'RSS',
+                                             'replaying'])
+    return latency, samples, reports
+
+def summary(latency, samples, reports, rate=None):
+    """
+    Print latency, backlog and RSS over the soak test, and whether the
+    listening routine kept up with the rate files were replayed (pings per
+    second, if known).
+    """
+    line = '{:>10} {:>10} {:>12} {:>10}'
+    print(line.format('time (s)', 'backlog', 'latency (s)', 'RSS (MB)'))
+    step = max(1, len(samples)//20)
+    for t, backlog, m, _ in samples.values[::step]:
+        before = latency[latency.time<=t]
+        print(line.format('%.0f' % t, '%d' % backlog,
+                          '%.1f' % before.latency.values[-1]
+                          if len(before) else '-', '%.1f' % m))
+
+    # backlog growth, as the trend of backlog while files were replayed
+    feeding = samples[samples.replaying]
+    growth  = np.polyfit(feeding.time, feeding.backlog, 1)[0]*60 \
+              if len(feeding)>1 else np.nan
+    print('%d rows logged, %d reports delivered'
+          % (latency.rows.sum(), len(reports)))
+    if len(latency):
+        print('Latency: median %.1f s, max %.1f s'
+              % (latency.latency.median(), latency.latency.max()))
+    print('Backlog: max %d files, growth %.2f files/min'
+          % (samples.backlog.max(), growth))
+    print('RSS: start %.1f MB, end %.1f MB, max %.1f MB'
+          % (samples.RSS.values[0], samples.RSS.values[-1],
+             samples.RSS.max()))
+    if rate is not None:
+        print('Replayed at %.1f pings/s' % rate)
+    if samples.backlog.values[-1]>0:
+        print('Not sustainable: %d files not reported'
+              % samples.backlog.values[-1])
+    elif growth*(feeding.time.values[-1] - feeding.time.values[0])/60>=1:
+        print('Not sustainable: backlog growing')
+    else:
+        print('Sustainable')
+
+def main(args):
+    """
+    Run the soak test from console arguments (see Usage).
+    """
+    if args and args[0]=='synthetic':
+        speedup, nfiles, npings, maxrange = (list(map(float, args[1:]))
+                                             + [60, 10, 900, 300][
+                                               len(args)-1:])
+        nfiles, npings   = int(nfiles), int(npings)
+        source           = tempfile.mkdtemp(prefix='synthetic')
+        rawfiles, closed = synthesize(source, nfiles, npings, maxrange)
+        rate             = nfiles*npings/(closed[-1]/speedup)
+    else:
+        speedup, nfiles = (list(map(float, args)) + [1, 0][len(args):])[:2]
+        rawfiles = np.sort(glob.glob(path + '*.raw'))
+        if rawfiles.size==0:
+            raise Exception('No RAW files in the echosounder directory')
+        if nfiles:
+            rawfiles = rawfiles[:int(nfiles)]
+        closed = recorded(rawfiles)
+        source, rate = None, None
+    print('Replaying %d files at x%g the recorded rate' % (len(rawfiles),
+                                                           speedup))
+
+    # replay files, and remove them afterwards. The listening routine keeps
+    # watching the collector until exiting, so the collector is left empty
+    # and its logging silenced.
+    collector = tempfile.mkdtemp(prefix='collector')
+    try:
+        latency, samples, reports = soak(rawfiles, closed, collector,
+                                         speedup=speedup)
+        summary(latency, samples, reports, rate)
+    finally:
+        logging.disable(logging.CRITICAL)
+        for f in os.listdir(collector):
+            os.remove(os.path.join(collector, f))
+        if source is not None:
+            shutil.rmtree(source, ignore_errors=True)
+
+# run the soak test if this script is run as the main program
+if __name__ == '__main__':
+    main(sys.argv[1:])
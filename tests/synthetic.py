@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Synthetic EK60 data for RapidKrill tests and benchmarks. Simulate the 120 kHz
+echogram of a vessel steaming along a transect, with background noise, a
+seabed and krill swarms, together with its GPS (GGA and RMC) and motion (SHR)
+NMEA datagrams.
+
+Data are delivered as decoded RAW files (see read.decode), to be stitched
+with read.stitch, or as RAW data already stitched (see read.stitch).
+
+Created on Fri Oct 16 19:47:05 2026
+@author: British Antarctic Survey
+"""
+
+# import modules
+import functools
+import numpy as np
+import pandas as pd
+from rapidkrill import read
+
+def echogram(npings, nsamples, resolution=.5, alpha=.026, depth=220, seed=0,
+             offset=0):
+    """
+    Simulate Sv with background noise, a seabed undulating 40 m above and
+    below depth, and a krill swarm every 60 pings, between 30 and 190 m.
+
+    Args:
+        npings     (int  ): Number of pings.
+        nsamples   (int  ): Number of samples.
+        resolution (float): Sample thickness (m).
+        alpha      (float): Absorption coefficient (dB m-1).
+        depth      (float): Mean seabed depth (m).
+        seed       (int  ): Seed of the random number generator.
+        offset     (int  ): Number of pings preceeding, to continue the 
+                            seabed of a preceeding echogram.
+
+    Returns:
+        float: 1D array with range (m).
+        float: 2D array with Sv (dB).
+    """
+    rng = np.random.default_rng(seed)
+    r   = np.arange(1, nsamples+1)*resolution
+
+    # background noise
+    Sv  = -150 + 20*np.log10(r)[:, None] + 2*alpha*r[:, None] \
+          + rng.normal(0, 1, (nsamples, npings))
+
+    # seabed
+    sb  = (depth + 40*np.sin(np.arange(offset, offset+npings)/300)).astype(int)
+    Sv[np.arange(nsamples)[:, None]*resolution >= sb[None, :]] = -20
+
+    # swarms
+    for i in range(npings//60):
+        j0 = rng.integers(0, npings-20)
+        i0 = rng.integers(int(30/resolution), int(190/resolution))
+        Sv[i0:i0+rng.integers(int(5/resolution), int(20/resolution)),
+           j0:j0+rng.integers(3, 20)] = -60
+
+    return r, Sv
+
+def transect(npings=3000, nsamples=600, seed=0):
+    """
+    Simulate RAW data of a transect at 10 knots, pinging every 2 seconds
+    down to 300 m, as stitched with read.stitch. There are no NMEA
+    datagrams, but navigation is complete.
+    """
+    alpha = .026
+    r, Sv = echogram(npings, nsamples, alpha=alpha, seed=seed)
+    t     = np.datetime64('2019-01-01T00:00:00') \
+            + np.arange(npings)*np.timedelta64(2000, 'ms')
+    nm    = np.arange(npings)*10/1800
+
+    raw = {'rawfiles': ['D20190101-T000000.raw'], 'transect': 1,
+           'alpha': alpha, 'r': r, 't': t, 'Sv': Sv, 'nm': nm, 'km': nm*1.852,
+           'lon': -45 + nm/60, 'lat': -60 + 0*nm, 'kph': 18.52 + 0*nm,
+           'knt': 10 + 0*nm, 'pitchmax': 0*nm, 'rollmax': 0*nm,
+           'heavemax': 0*nm, 'Tpos': t, 'LON': -45 + nm/60, 'LAT': -60 + 0*nm}
+    return raw
+
+def split(raw, sizes):
+    """
+    Split RAW data in files with the given number of pings, with angles to
+    be decoded on demand.
+    """
+    edges = np.r_[0, np.cumsum(sizes)]
+    for j0, j1 in zip(edges[:-1], edges[1:]):
+        part = {k: (v[..., j0:j1] if isinstance(v, np.ndarray) and
+                    v.shape[-1]==len(raw['t']) else v) for k, v in raw.items()}
+        loader = functools.partial(angles, part['Sv'].shape)
+        yield read.RawData(part, lazy={'theta': (loader, 'theta'),
+                                       'phi'  : (loader, 'phi'  )})
+
+def angles(shape, dtype=np.float64):
+    """
+    Simulate split-beam angles, all zero.
+    """
+    return {'theta': np.zeros(shape, dtype=dtype),
+            'phi'  : np.zeros(shape, dtype=dtype)}
+
+def decoded(nfiles=3, npings=1800, maxrange=300, resolution=.19,
+            pingrate=2, speed=10, start='2019-01-01T00:00:00', seed=0,
+            float32=False):
+    """
+    Simulate consecutive RAW files, as decoded with read.decode (see 
+    rawfile).
+
+    Args:
+        nfiles (int): Number of RAW files.
+        Rest of arguments as in rawfile.
+
+    Returns:
+        list: Decoded RAW files (see read.decode).
+    """
+    return [rawfile(i, npings=npings, maxrange=maxrange,
+                    resolution=resolution, pingrate=pingrate, speed=speed,
+                    start=start, seed=seed, float32=float32)
+            for i in range(nfiles)]
+
+def rawfile(i, npings=1800, maxrange=300, resolution=.19, pingrate=2,
+            speed=10, start='2019-01-01T00:00:00', seed=0, float32=False):
+    """
+    Simulate the i-th of a sequence of consecutive RAW files, as decoded with
+    read.decode, of a vessel steaming eastwards at 60 S. GPS fixes (GGA and
+    RMC) and motion (SHR) come every second, with half a metre of GPS noise,
+    and pitch, roll and heave from a gentle swell. Every file is simulated on
+    its own, so that files can be simulated as they are needed.
+
+    Args:
+        i          (int  ): Number of the RAW file in the sequence, from 0.
+        npings     (int  ): Number of pings per RAW file.
+        maxrange   (float): Maximum range (m).
+        resolution (float): Sample thickness (m).
+        pingrate   (float): Time between pings (s).
+        speed      (float): Vessel speed (knots).
+        start      (str  ): Time of the first ping of the sequence (ISO 8601).
+        seed       (int  ): Seed of the random number generator.
+        float32    (bool ): True to simulate Sv and angles in single
+                            precision (see read.raw).
+
+    Returns:
+        dict: Decoded RAW file (see read.decode).
+    """
+    dtype    = np.float32 if float32 else np.float64
+    nsamples = int(maxrange/resolution)
+    alpha    = .026
+    depth    = min(220, .75*maxrange)
+    r, Sv    = echogram(npings, nsamples, resolution=resolution, alpha=alpha,
+                        depth=depth, seed=[seed, i], offset=i*npings)
+
+    # ping time, and NMEA time every second from 1 s before the first ping
+    # to 1 s before the first ping of the next file
+    dt = np.timedelta64(int(pingrate*1000), 'ms')
+    t0 = np.datetime64(start, 'ms')
+    t  = t0 + np.arange(i*npings, (i+1)*npings)*dt
+    T  = np.arange(t[0] - np.timedelta64(1, 's'), t[-1] + dt - 
+                   np.timedelta64(1, 's'), np.timedelta64(1, 's'))
+    s  = np.float64(T - t0)/1000
+
+    # GPS positions, and pitch, roll and heave
+    rng   = np.random.default_rng([seed, i, 1])
+    LAT   = -60 + rng.normal(0, 5e-6, len(T))
+    LON   = -45 + s*speed/3600/60/np.cos(np.radians(60)) \
+            + rng.normal(0, 1e-5, len(T))
+    PITCH = 2*np.sin(2*np.pi*s/9)
+    ROLL  = 5*np.sin(2*np.pi*s/11)
+    HEAVE = 1*np.sin(2*np.pi*s/8 )
+
+    # name the file after its first ping, as the echosounder
+    name = pd.Timestamp(t[0]).strftime('D%Y%m%d-T%H%M%S.raw')
+    gps  = {'GGA': {'time': T, 'longitude': LON, 'latitude': LAT},
+            'GLL': {'time': None, 'longitude': None, 'latitude': None},
+            'RMC': {'time': T, 'longitude': LON, 'latitude': LAT}}
+    shr  = {'SHR': {'time': T, 'pitch': PITCH, 'roll': ROLL, 'heave': HEAVE}}
+
+    return {'rawfile': name,
+            'Sv'     : Sv.astype(dtype, copy=False),
+            'angles' : angles((nsamples, npings), dtype),
+            't'      : t,
+            'r'      : r,
+            'alpha'  : alpha,
+            'gps'    : gps,
+            'shr'    : shr}
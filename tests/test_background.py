@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Tests for RapidKrill background noise estimation.
+
+Created on Fri Oct 16 23:59:04 2026
+@author: British Antarctic Survey
+"""
+
+# import modules
+import numpy as np
+import pytest
+from rapidkrill import background
+
+@pytest.mark.parametrize('shape', [(600, 400), (603, 417)])
+def test_derobertis(shape):
+    """
+    Background noise must match echopy, with NaNs and incomplete blocks.
+    """
+    gBN   = pytest.importorskip('echopy.get_background')
+    rng   = np.random.default_rng(0)
+    r     = np.arange(shape[0])*.5
+    alpha = .026
+    Sv    = background.tvg(r, alpha).reshape(-1, 1) - 150 \
+            + rng.normal(0, 1, shape)
+    Sv[300:             ] = -20
+    Sv[100:140,   50:70 ] = np.nan
+    Sv[:      , 200:220 ] = np.nan
+    bn , m_  = gBN.derobertis(Sv, np.arange(shape[0]), np.arange(shape[1]),
+                              5, 20, r, alpha)
+    bn_, m__ = background.derobertis(Sv, 5, 20, background.tvg(r, alpha))
+    assert (m__ == m_).all()
+    assert np.allclose(bn_, bn, equal_nan=True)
+
+def test_noise():
+    """
+    Noise must be reused while it does not drift, and estimated again when it
+    drifts or when scheduled.
+    """
+    rng   = np.random.default_rng(0)
+    r     = np.arange(600)*.5
+    tvg   = background.tvg(r, .026)
+    noise = background.Noise(every=3600, drift=1)
+    t0    = np.datetime64('2019-01-01T00:00:00')
+    def ping(level, start):
+        Sv = tvg.reshape(-1, 1) + level + rng.normal(0, 1, (600, 400))
+        t  = t0 + np.timedelta64(start, 's') \
+             + np.arange(400)*np.timedelta64(2, 's')
+        return Sv, t
+    
+    # first file estimated, second one reused
+    bn, m_ = noise.estimate(*ping(-150, 0), tvg)
+    assert (noise.estimations, noise.reuses) == (1, 0)
+    Sv, t  = ping(-150, 800)
+    bn, m_ = noise.estimate(Sv, t, tvg)
+    bn_    = background.derobertis(Sv, 5, 20, tvg)[0]
+    assert (noise.estimations, noise.reuses) == (1, 1)
+    assert np.allclose(bn[~m_], (tvg.reshape(-1, 1) + noise.level
+                                 + 0*Sv)[~m_], equal_nan=True)
+    assert np.nanmax(np.abs(bn - bn_)) < .5
+    assert (np.isnan(bn) <= np.isnan(bn_)).all()
+    
+    # drift, and then schedule, make noise be estimated again
+    noise.estimate(*ping(-145, 1600), tvg)
+    assert (noise.estimations, noise.reuses) == (2, 1)
+    noise.estimate(*ping(-145, 2400), tvg)
+    assert (noise.estimations, noise.reuses) == (2, 2)
+    noise.estimate(*ping(-145, 5400), tvg)
+    assert (noise.estimations, noise.reuses) == (3, 2)
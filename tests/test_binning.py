@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Tests for RapidKrill binning routines.
+
+Created on Fri Oct 16 21:58:12 2026
+@author: British Antarctic Survey
+"""
+
+# import modules
+import numpy as np
+import pytest
+from rapidkrill import binning
+
+def test_bins():
+    """
+    Means, sums, distance averages and broadcasts must match binning every
+    bin one at a time, including empty bins and samples out of the bins.
+    """
+    rng  = np.random.default_rng(0)
+    r    = np.arange(1, 501)*.5
+    nm   = np.sort(rng.uniform(0, 5, 700))
+    Sv   = rng.normal(-70, 5, (500, 700))
+    Sv[rng.random(Sv.shape) < .2] = np.nan
+    sb   = rng.uniform(50, 300, 700)
+    sb[:100] = np.nan
+    redges  = np.array([20, 100, 100, 250])
+    nmedges = np.array([.5, 1.5, 2.5, 2.5, 6])
+    bins    = binning.Bins(r, nm, redges, nmedges)
+    
+    Svr, n = bins.mean(Sv, log=True)
+    sbr    = bins.oned(sb)
+    valid  = bins.sum(~np.isnan(Sv), dtype=np.int64)
+    for i in range(len(redges)-1):
+        for j in range(len(nmedges)-1):
+            ri = (r >=redges [i]) & (r <redges [i+1])
+            nj = (nm>=nmedges[j]) & (nm<nmedges[j+1])
+            d  = Sv[np.ix_(ri, nj)]
+            assert n[i, j] == valid[i, j] == np.sum(~np.isnan(d))
+            if n[i, j]:
+                assert np.isclose(Svr[i, j],
+                                  10*np.log10(np.nanmean(10**(d/10))))
+            else:
+                assert np.isnan(Svr[i, j])
+            if i==0:
+                if np.isnan(sb[nj]).all():
+                    assert np.isnan(sbr[j])
+                else:
+                    assert np.isclose(sbr[j], np.nanmean(sb[nj]))
+    
+    full, mask = bins.full(Svr)
+    assert full.shape == Sv.shape
+    assert np.isnan(full[~mask]).all()
+    assert (full[r==50][0, (nm>=1.5) & (nm<2.5)] == Svr[0, 1]).all()
+
+def test_max():
+    """
+    Maxima must ignore NaNs, and be NaN in empty bins or bins with no data.
+    """
+    Sv = np.array([[-70., np.nan, -60, -80],
+                   [-75., np.nan, -90, -50],
+                   [-65., np.nan, -85, -55]])
+    bins = binning.Bins(np.arange(3), np.arange(4), np.array([0, 2, 2, 3]),
+                        np.array([0, 1, 2, 4]))
+    Svr  = bins.max(Sv)
+    assert Svr[0, 0] == -70 and Svr[0, 2] == -50 and Svr[2, 2] == -55
+    assert np.isnan(Svr[0, 1]) and np.isnan(Svr[1]).all()
+
+def test_weights():
+    """
+    Weighting samples straddling bin edges, means, valid samples and 
+    distance averages must match echopy's resampling on EK60-like grids.
+    """
+    rs   = pytest.importorskip('echopy.resample')
+    rng  = np.random.default_rng(0)
+    r    = 1.3 + np.arange(1400)*.1905
+    nm   = np.cumsum(rng.uniform(.0009, .0019, 3000))
+    Sv   = rng.normal(-75, 6, (1400, 3000))
+    Sv[rng.random(Sv.shape) < .3] = np.nan
+    sb   = rng.uniform(50, 300, 3000)
+    sb[:100] = np.nan
+    redges  = np.array([20, 250])
+    nmedges = np.arange(1, nm[-1], 1)
+    bins    = binning.Bins(r, nm, redges, nmedges, weights=True)
+    
+    Svr, n = bins.mean(Sv, log=True)
+    Svr_, _, _, pc_ = rs.twod(Sv, r, nm, redges, nmedges, log=True)
+    assert np.allclose(Svr, Svr_, rtol=0, atol=1e-9)
+    assert np.allclose(n/bins.sum(np.ones(Sv.shape, bool))*100, pc_)
+    sbr_ = rs.oned(sb.reshape(1, -1), nm, nmedges, 1)[0]
+    assert np.allclose(bins.oned(sb), sbr_[0])
@@ -0,0 +1,43 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Tests for RapidKrill caches.
+
+Created on Fri Oct 16 23:58:37 2026
+@author: British Antarctic Survey
+"""
+
+# import modules
+import numpy as np
+import pytest
+from rapidkrill import cache
+
+def test_lru():
+    """
+    Values must be computed only on misses, the least recently used must be
+    dropped first, and cached arrays must be read-only.
+    """
+    lru   = cache.LRU(maxsize=2)
+    calls = []
+    def compute(x):
+        calls.append(x)
+        return {'x': np.array([x])}
+    
+    for x in [1, 2, 1, 3, 1, 2]:
+        value = lru.get(cache.key(x), lambda: compute(x))
+        assert value['x'][0] == x
+    assert calls == [1, 2, 3, 2]
+    assert (lru.hits, lru.misses, len(lru)) == (2, 4, 2)
+    with pytest.raises(ValueError):
+        value['x'][0] = 0
+
+def test_key():
+    """
+    Keys must change with values, type and shape of arrays.
+    """
+    r = np.arange(10)*.5
+    assert cache.key(r, .026) == cache.key(r.copy(), .026)
+    keys = {cache.key(r, .026), cache.key(r, .027), cache.key(r[:-1], .026),
+            cache.key(r.astype(np.float32), .026), cache.key(r, None),
+            cache.key(r, '.026'), cache.key(r.reshape(2, 5), .026)}
+    assert len(keys) == 7
@@ -0,0 +1,45 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Tests for RapidKrill checkpoints.
+
+Created on Fri Oct 16 20:41:16 2026
+@author: British Antarctic Survey
+"""
+
+# import modules
+import os
+import numpy as np
+from rapidkrill import checkpoint
+
+def test_roundtrip(tmp_path):
+    """
+    State is loaded as saved, except for None values, which are not saved.
+    """
+    path  = str(tmp_path/'state.npz')
+    t     = np.datetime64('2019-01-01') + np.arange(3)*np.timedelta64(1, 's')
+    state = {'preraw': {'t': t, 'r': np.arange(5.), 'transect': 2, 
+                        'Tmot': None},
+             'listen': {'path': '/data', 'lastrow': 10, 'processed': ['a.raw',
+                                                                  'b.raw'],
+                        'rawfiles': []}}
+    checkpoint.save(path, state)
+    loaded = checkpoint.load(path)
+    assert (loaded['preraw']['t'] == t).all()
+    assert (loaded['preraw']['r'] == np.arange(5.)).all()
+    assert loaded['preraw']['transect'] == 2
+    assert 'Tmot' not in loaded['preraw']
+    assert loaded['listen'] == {'path': '/data', 'lastrow': 10,
+                                'processed': ['a.raw', 'b.raw'],
+                                'rawfiles': []}
+    assert not os.path.exists(path + '.tmp')
+
+def test_corrupt(tmp_path):
+    """
+    Missing or unreadable checkpoints are ignored.
+    """
+    path = str(tmp_path/'state.npz')
+    assert checkpoint.load(path) is None
+    with open(path, 'wb') as f:
+        f.write(b'corrupt')
+    assert checkpoint.load(path) is None
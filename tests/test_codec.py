@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Tests for RapidKrill report encodings.
+
+Created on Fri Oct 16 23:18:44 2026
+@author: British Antarctic Survey
+"""
+
+# import modules
+import base64
+import numpy as np
+import pytest
+from rapidkrill import codec
+from test_store import results
+
+def test_binary():
+    """
+    Rows must be decoded as encoded, to the quantum of every field, with
+    NaNs and depth layers, with or without compression.
+    """
+    rows = results(50, layers=True, nans=True)
+    for compress in [True, False]:
+        decoded = codec.decode(codec.encode(rows, compress=compress))
+        assert list(decoded.columns) == list(rows.columns)
+        assert (decoded.Time == rows.Time.str[:19]).all()
+        for column, quantum, _ in codec._fields(rows.columns[8:]):
+            if column!='Time':
+                assert np.allclose(decoded[column], rows[column],
+                                   atol=quantum/2 + 1e-9, equal_nan=True)
+    assert codec.decode(codec.encode(results(3))).shape == (3, 8)
+
+def test_bytes():
+    """
+    Binary reports must take a fraction of the bytes of CSV text reports,
+    and fit as many rows as possible in the budget.
+    """
+    line = '{:>5} {:>10} {:>10} {:>10} {:>10}'
+    print(line.format('rows', 'CSV', 'CSV base64', 'binary', 'zlib'))
+    for n in [1, 10, 100]:
+        rows   = results(n, layers=True, nans=True)
+        text   = len(codec.text(rows).encode())
+        b64    = len(base64.b64encode(codec.text(rows).encode()))
+        binary = len(codec.encode(rows, compress=False))
+        packed = len(codec.encode(rows))
+        print(line.format(n, *['%.1f' % (b/n) for b in [text, b64, binary,
+                                                         packed]]))
+        assert packed <= binary
+        if n>=10:
+            assert binary/n < text/n/4
+
+    # fit an Iridium SBD message
+    rows       = results(200, layers=True, nans=True)
+    data, n    = codec.Binary(budget=340).encode(rows)
+    assert 10 < n < 200 and len(data) <= 340
+    assert len(codec.encode(rows[:n+1])) > 340
+    assert codec.decode(data).Miles.iloc[-1] == np.round(rows.Miles[n-1], 2)
+    with pytest.raises(Exception, match='No row fits'):
+        codec.Binary(budget=10).encode(rows)
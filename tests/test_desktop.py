@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Tests for the RapidKrill desktop application. They need pyEcholab and echopy.
+
+Created on Fri Oct 16 23:51:06 2026
+@author: British Antarctic Survey
+"""
+
+# import modules
+import os
+import numpy as np
+import pytest
+
+pytest.importorskip('echolab2')
+pytest.importorskip('echopy')
+from rapidkrill import read, process, desktop
+from synthetic import rawfile
+
+def decode(path, **kwargs):
+    """
+    Decode synthetic RAW files, named after their number in the sequence.
+    """
+    decoded = rawfile(int(os.path.basename(path)[:-4]), npings=700,
+                      maxrange=300)
+    decoded['rawfile'] = path
+    return decoded
+
+def test_workers(monkeypatch):
+    """
+    Decoding files in other processes must stitch and process them as
+    decoding them one after the other, in this process.
+    """
+    monkeypatch.setattr(read, 'decode', decode)
+    rawfiles = ['%d.raw' % i for i in range(5)]
+    results  = {}
+    for workers in [1, 2]:
+        preraw, stitched, NASC = None, [], []
+        stream = process.CcamlrStream()
+        for d in desktop.decoding(rawfiles, workers=workers):
+            raw    = read.stitch(d(), preraw=preraw)
+            preraw = raw.copy()
+            stitched.append(raw)
+            stream.append(raw)
+            NASC.append(stream.process())
+        NASC.append(stream.flush())
+        NASC = [pro['NASC120swr'][0] for pro in NASC if pro is not None]
+        results[workers] = stitched, np.concatenate(NASC)
+
+    for serial, parallel in zip(results[1][0], results[2][0]):
+        for k in ['Sv', 't', 'nm', 'lon', 'lat', 'pitchmax', 'theta']:
+            assert np.array_equal(serial[k], parallel[k], equal_nan=True)
+        assert serial['transect'] == parallel['transect']
+    assert len(results[1][1]) > 0
+    assert np.array_equal(results[1][1], results[2][1], equal_nan=True)
@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Tests for RapidKrill filters.
+
+Created on Fri Oct 16 23:05:19 2026
+@author: British Antarctic Survey
+"""
+
+# import modules
+import numpy as np
+import pytest
+from scipy import ndimage
+from scipy.signal import convolve2d
+from rapidkrill import filters
+
+def echogram(dtype=np.float64, seed=0):
+    """
+    Simulate Sv with noise, a swarm, and impulse noise in some pings.
+    """
+    rng = np.random.default_rng(seed)
+    Sv  = rng.normal(-75, 8, (300, 400))
+    Sv[100:140, 150:250] += 25
+    Sv[:, rng.random(400) < .03] += 30
+    return Sv.astype(dtype)
+
+@pytest.mark.parametrize('size', [(3, 3), (7, 7), (3, 5)])
+def test_kernels(size):
+    """
+    Filters must match scipy 2D kernels, NaNs spreading as in convolution.
+    """
+    Sv = echogram()
+    sv = 10**(Sv/10)
+    sv[100, 200] = np.nan
+    k  = np.ones(size)/np.prod(size)
+    assert np.allclose(filters.box(sv, size),
+                       convolve2d(sv, k, 'same', boundary='symm'),
+                       equal_nan=True)
+    fp = np.ones(size)
+    eroded  = ndimage.grey_erosion (Sv, footprint=fp)
+    dilated = ndimage.grey_dilation(Sv, footprint=fp)
+    median  = ndimage.median_filter(Sv, footprint=fp)
+    where   = Sv > -60
+    assert (filters.erosion (Sv, size) == eroded ).all()
+    assert (filters.dilation(Sv, size) == dilated).all()
+    assert (filters.medianf (Sv, size) == median ).all()
+    assert (filters.medianf (Sv, size, where=where, chunk=1000)
+            == median[where]).all()
+
+@pytest.mark.parametrize('dtype', [np.float64, np.float32])
+def test_wang(dtype):
+    """
+    Impulse noise filtering must match echopy.
+    """
+    mIN    = pytest.importorskip('echopy.mask_impulse')
+    Sv     = echogram(dtype)
+    kwargs = dict(thr=(-70,-40), erode=[(3,3)], dilate=[(7,7)], median=[(7,7)])
+    Svin , m_  = mIN.wang(Sv, **kwargs)
+    Svin_, m__ = filters.wang(Sv, **kwargs)
+    assert Svin_.dtype == Svin.dtype
+    assert (m__ == m_).all()
+    assert np.allclose(Svin_, Svin, rtol=0, atol=1e-4)
@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Tests for RapidKrill metrics.
+
+Created on Fri Oct 16 21:24:50 2026
+@author: British Antarctic Survey
+"""
+
+# import modules
+import json, time
+from rapidkrill import metrics
+
+def routine():
+    metrics.start('read.raw', 'D20190101-T000000.raw', rows=3)
+    time.sleep(.02)
+    metrics.lap('decode')
+    sum(range(10**6))
+    metrics.lap('Sv')
+    time.sleep(.01)
+    metrics.lap('decode')
+    return metrics.end('read.raw')
+
+def test_disabled():
+    """
+    Nothing is recorded unless metrics are enabled.
+    """
+    metrics.disable()
+    assert routine() is None
+
+def test_records(tmp_path):
+    """
+    Stages must be recorded with their wall time, CPU time and RSS increase,
+    adding up stages with the same name, and written as JSON lines and in a
+    Prometheus textfile.
+    """
+    jsonl, prom = str(tmp_path/'metrics.jsonl'), str(tmp_path/'rk.prom')
+    metrics.enable(jsonl, prom)
+    try:
+        routine()
+        metrics.start('process.ccamlr', 'D20190101-T000000.raw')
+        metrics.start('read.raw', 'D20190101-T001000.raw')
+        record = routine()
+        metrics.lap('impulse')
+        metrics.end('process.ccamlr')
+    finally:
+        metrics.disable()
+
+    assert list(record['stages']) == ['decode', 'Sv']
+    assert record['stages']['decode']['wall'] >= .03
+    assert record['stages']['Sv']['cpu'] > 0
+    assert record['total']['wall'] >= sum(s['wall'] for s in
+                                         record['stages'].values())
+    assert record['rows'] == 3
+
+    # the unfinished read.raw run is dropped, and the nested one recorded
+    lines = [json.loads(l) for l in open(jsonl)]
+    assert [l['routine'] for l in lines] == ['read.raw', 'read.raw',
+                                             'process.ccamlr']
+    assert list(lines[2]['stages']) == ['impulse']
+
+    text = open(prom).read()
+    assert 'rapidkrill_runs_total{routine="read.raw"} 2' in text
+    assert 'rapidkrill_stage_seconds{routine="read.raw",stage="Sv"}' in text
+    assert 'rapidkrill_stage_cpu_seconds{routine="process.ccamlr",' \
+           'stage="total"}' in text
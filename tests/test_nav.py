@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Tests for RapidKrill navigation routines.
+
+Created on Fri Oct 16 10:41:55 2026
+@author: British Antarctic Survey
+"""
+
+# import modules
+import numpy as np
+import pytest
+from rapidkrill import nav
+
+def test_distance_geopy():
+    """
+    Distances must match geopy's geodesic distance within 1 mm, for GPS-like
+    consecutive fixes and for positions far apart.
+    """
+    geopy = pytest.importorskip('geopy.distance')
+    rng   = np.random.default_rng(0)
+    lat0  = rng.uniform(-80, 80, 500)
+    lon0  = rng.uniform(-180, 180, 500)
+    for lat1, lon1 in [(lat0 + rng.normal(0, .001, 500),
+                        lon0 + rng.normal(0, .001, 500)),
+                       (rng.uniform(-80, 80, 500),
+                        rng.uniform(-180, 180, 500))]:
+        km  = nav.distance(lat0, lon0, lat1, lon1)
+        kmg = np.array([geopy.distance((a, b), (c, d)).km
+                        for a, b, c, d in zip(lat0, lon0, lat1, lon1)])
+        assert np.abs(km-kmg).max() < 1e-6
+
+def test_distance_special():
+    """
+    Coincident positions are at zero distance, and NaN positions result in
+    NaN distances, with no effect on the rest.
+    """
+    assert nav.distance(-60, -45, -60, -45) == 0
+    assert np.isnan(nav.distance(np.nan, -45, -60, -45))
+    km = nav.distance([-60, np.nan], [-45, -45], [-60.1, -60], [-45, -45])
+    assert np.isnan(km[1]) & (abs(km[0]-11.1) < .1)
+
+def test_clean():
+    """
+    A single bad fix and a missing fix are rejected and interpolated, while
+    the rest of an undisturbed track is left untouched.
+    """
+    T   = np.datetime64('2019-01-01T00:00:00') \
+          + np.arange(600)*np.timedelta64(1000, 'ms')
+    LAT = -60 + np.arange(600)*4.6e-5
+    LON = -45 + np.arange(600)*1e-5
+    lat = LAT.copy()
+    lat[300] += .01
+    lat[ 10]  = np.nan
+    lon, lat, Q = nav.clean(T, LON, lat)
+    assert (np.where(~Q)[0] == [10, 300]).all()
+    assert np.abs(lat-LAT).max() < 1e-7
+    assert (lat[400:] == LAT[400:]).all()
+    lon, lat, Q = nav.clean(T, LON, LAT)
+    assert Q.all() & (lat == LAT).all() & (lon == LON).all()
+
+def test_clean_dateline():
+    """
+    A track crossing the dateline must be cleaned as any other track, with
+    longitude wrapped to [-180, 180).
+    """
+    T   = np.datetime64('2019-01-01T00:00:00') \
+          + np.arange(600)*np.timedelta64(1000, 'ms')
+    LAT = -60 + np.arange(600)*4.6e-5
+    LON = (179.997 + np.arange(600)*1e-5 + 180) % 360 - 180
+    lon, lat, Q = nav.clean(T, LON, LAT)
+    assert Q.all() & (lon == LON).all()
+    lon_ = LON.copy()
+    lon_[300] += .02
+    lon_[301]  = np.nan
+    lon, lat, Q = nav.clean(T, lon_, LAT)
+    assert (np.where(~Q)[0] == [300, 301]).all()
+    assert np.abs((lon - LON + 180) % 360 - 180).max() < 1e-7
+    assert (lon >= -180).all() & (lon < 180).all()
+
+def test_interp():
+    """
+    Interpolating a stack of variables must match scipy's interp1d applied to
+    each variable, for every bounds behaviour.
+    """
+    interp1d = pytest.importorskip('scipy.interpolate').interp1d
+    rng = np.random.default_rng(0)
+    xp  = np.sort(rng.uniform(0, 100, 50))
+    fp  = rng.normal(size=(3, 50))
+    fp[1, 5] = np.nan
+    x   = rng.uniform(-10, 110, 200)
+    f   = nav.interp(x, xp, fp)
+    assert np.allclose(f, [interp1d(xp, v, bounds_error=False)(x) for v in fp],
+                       equal_nan=True)
+    f   = nav.interp(x, xp, fp, bounds='extrapolate')
+    assert np.allclose(f, [interp1d(xp, v, fill_value='extrapolate')(x)
+                           for v in fp], equal_nan=True)
+    assert nav.interp(x, xp, fp[0]).shape == x.shape
+    with pytest.raises(Exception):
+        nav.interp(x, xp, fp, bounds='raise')
@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Tests for RapidKrill processing routines. They need echopy.
+
+Created on Fri Oct 16 14:20:31 2026
+@author: British Antarctic Survey
+"""
+
+# import modules
+import numpy as np
+import pytest
+
+pytest.importorskip('echopy')
+from rapidkrill import process
+from synthetic import transect, split
+
+def streamed(stream, parts):
+    """
+    Process parts in a stream, flushing it after the last one, and get the
+    NASC and distance of the intervals delivered.
+    """
+    pros = []
+    for part in parts:
+        stream.append(part)
+        pros.append(stream.process())
+    pros.append(stream.flush())
+    pros = [pro for pro in pros if pro is not None]
+    return (np.concatenate([pro['NASC120swr'][0] for pro in pros]),
+            np.concatenate([pro['nm120r']        for pro in pros]))
+
+@pytest.mark.parametrize('sizes', [[300]*10, [157, 911, 42, 1200, 690],
+                                   [300]*9 + [190]])
+def test_stream_matches_batch(sizes):
+    """
+    NASC from the stream processor must match processing the whole transect
+    at once, however pings are split across files, with every interval
+    delivered once the stream is flushed.
+    """
+    raw   = transect(npings=sum(sizes))
+    whole = next(split(raw, [sum(sizes)]))
+    batch = process.ccamlr(whole, jdx=[0, 0])
+    NASC, nm = streamed(process.CcamlrStream(), split(raw, sizes))
+
+    assert len(nm) == len(batch['nm120r'])
+    assert np.allclose(nm, batch['nm120r'])
+    assert np.allclose(NASC, batch['NASC120swr'][0], equal_nan=True)
+
+def test_stream_resume(tmp_path):
+    """
+    A stream restored from a checkpoint must deliver the same results as if
+    it had not been interrupted.
+    """
+    from rapidkrill import checkpoint
+    raw   = transect(npings=2400)
+    batch = process.ccamlr(next(split(raw, [2400])), jdx=[0, 0])
+    parts = list(split(raw, [300]*8))
+    for part in parts:
+        part['theta']
+    
+    stream = process.CcamlrStream()
+    NASC   = []
+    for part in parts[:4]:
+        stream.append(part)
+        pro = stream.process()
+        if pro is not None:
+            NASC.append(pro['NASC120swr'][0])
+    checkpoint.save(str(tmp_path/'stream.npz'), stream.state())
+    stream = process.CcamlrStream()
+    stream.restore(checkpoint.load(str(tmp_path/'stream.npz')))
+    NASC   = np.concatenate(NASC + [streamed(stream, parts[4:])[0]])
+    
+    assert len(NASC) == len(batch['nm120r'])
+    assert np.allclose(NASC, batch['NASC120swr'][0], equal_nan=True)
+
+def test_stream_noise(tmp_path):
+    """
+    NASC from the stream processor reusing background noise across files
+    must stay within 1e-4 (relative) of estimating noise in every file, and
+    the noise reused must be restored from a checkpoint.
+    """
+    from rapidkrill import background, checkpoint
+    raw   = transect(npings=2400)
+    parts = list(split(raw, [300]*8))
+    for part in parts:
+        part['theta']
+    every  = streamed(process.CcamlrStream(), parts)[0]
+    noise  = background.Noise()
+    stream = process.CcamlrStream(noise=noise)
+    reuse  = streamed(stream, parts)[0]
+    
+    assert len(reuse) == len(every) and noise.reuses > 0
+    assert np.allclose(reuse, every, rtol=1e-4, atol=0, equal_nan=True)
+
+    checkpoint.save(str(tmp_path/'stream.npz'), stream.state())
+    restored = process.CcamlrStream(noise=background.Noise())
+    restored.restore(checkpoint.load(str(tmp_path/'stream.npz')))
+    assert restored.noise.level     == noise.level
+    assert restored.noise.reference == noise.reference
+    assert restored.noise.time      == noise.time
+
+def test_float32():
+    """
+    Processing in single precision must deliver the same NASC as in double
+    precision, to a small relative error.
+    """
+    raw   = transect(npings=1500)
+    pro   = process.ccamlr(next(split(raw, [1500])), jdx=[0, 0])
+    raw['Sv'] = raw['Sv'].astype(np.float32)
+    pro32 = process.ccamlr(next(split(raw, [1500])), jdx=[0, 0])
+    assert pro32['Sv120clean'].dtype == np.float32
+    assert pro32['NASC120swr'].dtype == np.float64
+    assert np.allclose(pro32['NASC120swr'], pro['NASC120swr'], rtol=1e-4,
+                       equal_nan=True)
+
+@pytest.mark.parametrize('output', ['minimal', 'png'])
+def test_outputs(output):
+    """
+    Output profiles leave out Sv-sized variables, but not results.
+    """
+    raw   = transect(npings=1500)
+    full  = process.ccamlr(next(split(raw, [1500])), jdx=[0, 0])
+    pro   = process.ccamlr(next(split(raw, [1500])), jdx=[0, 0], output=output)
+    drop  = set(process.OUTPUTS['full']) - set(process.OUTPUTS[output])
+    assert all((k in full) & (k not in pro) for k in drop)
+    assert set(full) - drop <= set(pro)
+    assert np.allclose(pro['NASC120swr'], full['NASC120swr'], equal_nan=True)
+    assert (pro['m120_'] == full['m120_']).all()
+
+def test_integrate():
+    """
+    NASC integrated in layers must match NASC resampled from 20 to 250 m,
+    and add up across layers above the seabed.
+    """
+    raw    = transect(npings=1500)
+    layers = [(20, 250), (20, 100), (100, 150), (-30, 0, 'seabed'),
+              (20, 150)]
+    pro    = process.ccamlr(next(split(raw, [1500])), jdx=[0, 0],
+                            layers=layers)
+    NASC   = pro['NASC120swl']
+    assert NASC.shape == (5, len(pro['nm120r']))
+    assert np.allclose(NASC[0], pro['NASC120swr'][0], equal_nan=True)
+    assert np.allclose(NASC[1] + NASC[2], NASC[4])
+    assert (pro['thick120l'][3][np.isfinite(pro['sbliner'][0])] == 30).all()
+
+def test_kernels():
+    """
+    Processing with rapidkrill filter kernels must deliver the same results
+    as with echopy kernels.
+    """
+    raw  = transect(npings=1500)
+    pro  = process.ccamlr(next(split(raw, [1500])), jdx=[0, 0])
+    pro_ = process.ccamlr(next(split(raw, [1500])), jdx=[0, 0],
+                          kernels='rapidkrill')
+    for k in ['Sv120in', 'Sv120clean', 'Sv120sw']:
+        assert np.allclose(pro_[k], pro[k], equal_nan=True)
+    assert (pro_['m120_'] == pro['m120_']).all()
+    assert np.allclose(pro_['NASC120swr'], pro['NASC120swr'], equal_nan=True)
+
+def test_tracking():
+    """
+    Processing tracking the seabed must deliver the same results as
+    searching the seabed in the whole range.
+    """
+    raw  = transect(npings=1500)
+    pro  = process.ccamlr(next(split(raw, [1500])), jdx=[0, 0])
+    pro_ = process.ccamlr(next(split(raw, [1500])), jdx=[0, 0],
+                          tracking=True)
+    assert np.allclose(pro_['sbliner'], pro['sbliner'], equal_nan=True)
+    assert np.allclose(pro_['NASC120swr'], pro['NASC120swr'], equal_nan=True)
+    assert (pro_['m120_'] == pro['m120_']).all()
@@ -0,0 +1,36 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Tests for RapidKrill reading routines. They need pyEcholab and echopy.
+
+Created on Fri Oct 16 20:05:38 2026
+@author: British Antarctic Survey
+"""
+
+# import modules
+import numpy as np
+import pytest
+
+pytest.importorskip('echolab2')
+pytest.importorskip('echopy')
+from rapidkrill import read
+from synthetic import decoded
+
+def test_stitch():
+    """
+    Consecutive RAW files must be stitched in the same transect, with
+    distance and motion continuing along files, at the speed simulated.
+    """
+    files  = decoded(nfiles=3, npings=600, maxrange=100, speed=10)
+    preraw = None
+    nm     = []
+    for i, d in enumerate(files):
+        raw    = read.stitch(d, preraw=preraw)
+        preraw = read.tail(raw)
+        assert raw['transect'] == 1
+        assert raw['continuous'] == (i>0)
+        assert not np.isnan(raw['pitchmax'][10:]).any()
+        nm.append(raw['nm'])
+    nm = np.concatenate(nm)
+    assert (np.diff(nm) > 0).all()
+    assert np.isclose(nm[-1] - nm[0], 10*(len(nm) - 1)*2/3600, rtol=.05)
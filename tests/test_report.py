@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Tests for RapidKrill reporting routines. They need echopy.
+
+Created on Fri Oct 16 22:14:36 2026
+@author: British Antarctic Survey
+"""
+
+# import modules
+import os, shutil
+import numpy as np
+import pytest
+
+pytest.importorskip('echopy')
+from rapidkrill import report, store, codec
+from synthetic import echogram
+from test_store import results
+
+def test_decimate():
+    """
+    Sv must be reduced to the maximum shape with the mean in the linear
+    domain, or the maximum, of every pixel, keeping dimensions already
+    within the maximum.
+    """
+    r, Sv = echogram(1000, 500)
+    Sv[:, :10] = np.nan
+    mean  = report.decimate(Sv, (100, 2000))
+    peak  = report.decimate(Sv, (100, 2000), how='max')
+    assert mean.shape == peak.shape == (100, 1000)
+    assert mean.dtype == np.float32
+    assert np.isclose(mean[7, 500], 10*np.log10(np.mean(
+        10**(Sv[35:40, 500]/10))), atol=1e-4)
+    assert peak[7, 500] == np.float32(Sv[35:40, 500].max())
+    assert np.isnan(mean[:, :10]).all() and np.isnan(peak[:, :10]).all()
+
+def test_render(tmp_path):
+    """
+    Echogram images must be saved one after another with the same figure.
+    """
+    t  = np.datetime64('2019-01-01T00:00:00') \
+         + np.arange(0, 1201, 600)*np.timedelta64(1, 's')
+    Sv = np.full((50, 80), -70, dtype=np.float32)
+    extent = tuple(report.mdates.date2num(t[[0, -1]])) + (270, 0)
+    for i in range(2):
+        report.render(str(tmp_path/('%d.png' % i)), Sv, Sv, extent, 1, t[1:],
+                      np.array([.1, .2]), np.array([10., 20.]), t)
+        assert (tmp_path/('%d.png' % i)).stat().st_size > 0
+    assert len(report.figure['ax'][2].texts) == 4
+
+def test_land():
+    """
+    Reports must deliver the rows after the last row delivered, once there
+    are enough, reading results from the store, which is created from the
+    CSV log file of older logs, as CSV text or in binary.
+    """
+    logname = 'test-%d' % os.getpid()
+    path    = os.path.join(os.path.dirname(report.__file__), '..', 'log',
+                           logname, '')
+    os.makedirs(path)
+    sent = []
+    def deliver(sender, recipient, subject, text, data):
+        if isinstance(data, bytes):
+            sent.append(codec.decode(data))
+        else:
+            sent.append(data.splitlines())
+        return True
+    try:
+        results(5).to_csv(path + logname + '.csv', index=False)
+        assert report.land(logname, 0, 3, recipient='a@b', 
+                           deliver=deliver) == 3
+        assert report.land(logname, 3, 3, recipient='a@b', 
+                           deliver=deliver) == 3
+        store.append(report.logstore(logname), results(2, 5))
+        assert report.land(logname, 3, 3, recipient='a@b', 
+                           deliver=deliver) == 6
+        
+        # binary reports only carry the rows fitting the budget
+        db     = report.logstore(logname)
+        store.append(db, results(3, 7))
+        budget = len(codec.encode(store.tail(db, 6, 2)))
+        assert report.land(logname, 6, 3, recipient='a@b', deliver=deliver,
+                           encoding=codec.Binary(budget=budget)) == 8
+    finally:
+        shutil.rmtree(path)
+    assert len(sent) == 3
+    assert [float(l.split(',')[4]) for l in sent[1]] == [3, 4, 5]
+    assert list(sent[2].Miles) == [6, 7]
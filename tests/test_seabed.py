@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Tests for RapidKrill seabed detection.
+
+Created on Fri Oct 16 18:55:41 2026
+@author: British Antarctic Survey
+"""
+
+# import modules
+import numpy as np
+import pytest
+from rapidkrill import seabed
+
+def echogram(seed=0):
+    """
+    Simulate Sv with a seabed going deeper than the search range, rising
+    fast, stepping up suddenly, and with a breach.
+    """
+    rng  = np.random.default_rng(seed)
+    r    = np.arange(1, 2401)*.5
+    sb   = np.r_[np.full(300, 2300), np.linspace(2300, 600, 600),
+                 600 + 100*np.sin(np.arange(900)/100)].astype(int)
+    sb[1200:1250] = 200
+    Sv   = rng.normal(-90, 5, (len(r), len(sb)))
+    Sv[np.arange(len(r)).reshape(-1, 1) >= sb] = -30
+    Sv[:, 1500:1510] = -90
+    return Sv, r
+
+def test_ariza():
+    """
+    Seabed must be the same as found in the seabed mask from echopy.
+    """
+    mSB    = pytest.importorskip('echopy.mask_seabed')
+    Sv, r  = echogram()
+    kwargs = dict(r0=20, r1=1000, thr=-38, ec=1, ek=(3,3), dc=10, dk=(3,7))
+    idx    = np.argmax(mSB.ariza(Sv, r, roff=0, **kwargs), axis=0)
+    assert (seabed.track(Sv, r, **kwargs) == idx).all()
+
+def test_shoal():
+    """
+    Strong echoes well above the seabed tracked must not be taken as seabed.
+    """
+    Sv, r = echogram()
+    idx   = seabed.track(Sv, r)
+    Sv[400:440, 1600:1650] = -30
+    assert (seabed.track(Sv, r) == idx).all()
+    assert (idx[:300] == 0).all()
+    assert (idx[1200:1250] == 191).all()
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Tests for the RapidKrill results store.
+
+Created on Fri Oct 16 22:47:19 2026
+@author: British Antarctic Survey
+"""
+
+# import modules
+import sqlite3
+import numpy as np
+import pandas as pd
+from rapidkrill import store, codec
+
+def results(n, start=0, transect=1, layers=False, nans=False):
+    """
+    Simulate results logged every 10 minutes, with NASC in two depth layers
+    if layers, and no seabed detected every 7 rows if nans.
+    """
+    t    = np.datetime64('2019-01-01T00:00:00') \
+           + np.arange(start, start+n)*np.timedelta64(600, 's')
+    rows = pd.DataFrame({'Time'     : np.array(t, dtype=str),
+                         'Longitude': -45 + np.arange(n)/100,
+                         'Latitude' : -60. + 0*np.arange(n),
+                         'Transect' : np.ones(n, dtype=int)*transect,
+                         'Miles'    : np.arange(start, start+n)*1.,
+                         'Seabed'   : 250. + np.arange(n),
+                         'NASC'     : np.arange(n)*1.5,
+                         '% samples': 50. + 0*np.arange(n)})
+    if nans:
+        rows.loc[::7, 'Seabed'] = np.nan
+    if layers:
+        rows['NASC 20-50m' ] = np.arange(n)*.5
+        rows['NASC 50-100m'] = np.arange(n)*1.
+    return rows
+
+def test_store(tmp_path):
+    """
+    Rows must be appended in order, read from any offset, queried by time
+    and transect with indexes, and exported as the CSV log file.
+    """
+    db   = str(tmp_path/'log.sqlite')
+    assert store.count(db) == 0
+    assert store.tail(db, 0).empty
+    rows = [results(5), results(3, 5), results(4, 8, 2, layers=True)]
+    for i, r in enumerate(rows):
+        assert store.append(db, r) == sum(len(r) for r in rows[:i+1])
+
+    # tail reads
+    full = pd.concat(rows, ignore_index=True)
+    assert store.count(db) == 12
+    pd.testing.assert_frame_equal(store.tail(db, 0), full,
+                                  check_dtype=False)
+    pd.testing.assert_frame_equal(store.tail(db, 4, 5),
+                                  full[4:9].reset_index(drop=True),
+                                  check_dtype=False)
+    assert store.tail(db, 12).empty
+
+    # queries, using indexes
+    assert list(store.query(db, transect=2).Miles) == [8, 9, 10, 11]
+    assert list(store.query(db, start=full.Time[3], end=full.Time[6],
+                            transect=np.int64(1)).Miles) == [3, 4, 5]
+    with sqlite3.connect(db) as con:
+        plan = con.execute('EXPLAIN QUERY PLAN SELECT * FROM results '
+                           'WHERE "Transect"=2').fetchall()
+    assert 'results_transect' in str(plan)
+
+    # export as CSV, and load back
+    csv = str(tmp_path/'log.csv')
+    store.export(db, csv, chunksize=5)
+    pd.testing.assert_frame_equal(pd.read_csv(csv), full, check_dtype=False)
+    store.load(csv, str(tmp_path/'loaded.sqlite'))
+    pd.testing.assert_frame_equal(store.tail(str(tmp_path/'loaded.sqlite'), 0),
+                                  full, check_dtype=False)
+
+def test_nulls(tmp_path):
+    """
+    Numeric columns must be read as numbers, with NaNs, also when all rows
+    read are NaN (e.g. no seabed, or a depth layer added later), so that
+    they can be reported (see report.land).
+    """
+    db   = str(tmp_path/'log.sqlite')
+    rows = results(10)
+    rows['Seabed'] = np.nan
+    store.append(db, rows)
+    store.append(db, results(2, 10, layers=True))
+    tail = store.tail(db, 2, 5)
+    assert tail.Seabed.dtype == tail['NASC 20-50m'].dtype == float
+    assert tail.Seabed.isna().all() and tail['NASC 20-50m'].isna().all()
+    assert tail.Transect.dtype == np.int64
+    assert codec.text(tail).count('nan') == 15
@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Tests for RapidKrill directory watcher.
+
+Created on Fri Oct 16 19:31:07 2026
+@author: British Antarctic Survey
+"""
+
+# import modules
+import os, time
+import pytest
+from rapidkrill import watch
+
+def write(path, name, size=10):
+    with open(os.path.join(path, name), 'ab') as f:
+        f.write(b'\0'*size)
+
+@pytest.mark.parametrize('notify', [True, False])
+def test_completed(tmp_path, notify):
+    """
+    Files present at start are ignored, and new files are complete when
+    followed by a newer one, or when they stop changing.
+    """
+    path = str(tmp_path)
+    write(path, 'D0.raw')
+    w = watch.Watcher(path, interval=.2, notify=notify)
+    write(path, 'D1.raw')
+    write(path, 'D2.raw')
+    write(path, 'notes.txt')
+    assert w.completed() == ['D1.raw']
+    w.done('D1.raw')
+    assert w.completed() == []
+    time.sleep(.3)
+    assert w.completed() == ['D2.raw']
+    w.done('D2.raw')
+    write(path, 'D3.raw')
+    assert w.completed() == []
+    w.close()
+
+def test_close_write(tmp_path):
+    """
+    With inotify, a file is complete as soon as it is closed after writing.
+    """
+    path = str(tmp_path)
+    w = watch.Watcher(path, interval=5)
+    if w.fd is None:
+        pytest.skip('inotify not available')
+    write(path, 'D1.raw')
+    w.wait()
+    assert w.completed() == ['D1.raw']
+    w.close()